@@ -12,7 +12,7 @@ import tensorflow_model_optimization as tfmot
 
 ######################################################### Input Parameters #########################################################
 parser = argparse.ArgumentParser()
-parser.add_argument('--version', type=str, required=True, help=' version to be excuted choose from [a,b,c] ')
+parser.add_argument('--version', type=str, required=True, help=' version to be excuted choose from [a,b,c,t] (t = tiny first stage of the HW3 edge cascade)')
 args = parser.parse_args()
 
 version = args.version
@@ -46,12 +46,24 @@ if version == "c" :
     MFCC_OPTIONS = {'frame_length': 1024, 'frame_step': 400, 'mfcc': True,  'lower_frequency': 20, 'upper_frequency': 4000, 'num_mel_bins': 16, 'num_coefficients': 10}
 
 
+######################################################## Options for version t (tiny)
+# first stage of the HW3 edge cascade: a very thin ds_cnn on the same MFCCs as the edge ds_cnn
+# (kws_dscnn_True.tflite), so both stages share one feature extraction
+if version == "t" :
+    m = "ds_cnn"   # model name [ mlp , cnn , ds_cnn  ]
+    alpha = 0.125  # The width multiplier used to apply the structured Pruning 
+    mfcc = True    # True --> excute mfcc , False --> excute STFT
+    MFCC_OPTIONS = {'frame_length': 1024, 'frame_step': 310, 'mfcc': True,  'lower_frequency': 20, 'upper_frequency': 4000, 'num_mel_bins': 40, 'num_coefficients': 10}
+
+
 STFT_OPTIONS = {'frame_length': 256, 'frame_step': 128, 'mfcc': False}  # always achieved low performance results 
 
 model_version = f"_V_{version}_alpha={alpha}"
 
 mymodel = m + model_version
 TFLITE =  f'Group26_kws_{version}.tflite'                                 # path for saving the best model after converted to TF.lite model 
+if version == "t" :
+    TFLITE = 'kws_tiny.tflite'                                             # copy next to kws_dscnn_True.tflite on the edge device
 
 
 if mfcc is True:
@@ -375,6 +387,44 @@ def Q_Aware_T_Tflite_save(filepath = Q_aware_checkpoint_filepath):
         fp.write(tflite_compressed)
     print("*"*50,"\n",f"the model is saved successfuly to {QAT_tflite_model_dir}")
     return QAT_tflite_model_dir , Compressed
+######################################################## Function To Load  Evaluate the TF Lite  Model ########################################################
+def getsize(file):
+    st = os.stat(file)
+    size = st.st_size
+    return size
+
+def load_and_evaluation(path, dataset , Compressed):
+    interpreter = tf.lite.Interpreter(model_path = path) 
+    interpreter.allocate_tensors()
+    input_details = interpreter.get_input_details()
+    output_details = interpreter.get_output_details()
+
+    dataset = dataset.unbatch().batch(1)
+    
+    count = 0                                 # counter to compute the number of correct predictions 
+    total = 0                                 # total number of samples / predictions ==> acc = count/total
+    
+    for inp , label in dataset:
+        my_input = np.array(inp, dtype = np.float32)
+        label = np.array(label, dtype = np.float32)
+
+        interpreter.set_tensor(input_details[0]['index'], my_input)
+        interpreter.invoke()
+        my_output = interpreter.get_tensor(output_details[0]['index'])
+        predict = np.argmax(my_output)                                 # the prediction crossponds to the index of with the highest probability   
+        total += 1   
+        if (predict == label):                                         # if probability == labesl increase the correct predictions counter 
+            count += 1
+    # Compute the Accuracy         
+    accuracy = count/total 
+    # Evaluate the size of Tflite model 
+    size = getsize(path)
+    # Evaluate the size of Tflite model  after Comperession 
+    size_compressed = getsize(Compressed)
+    print ("*"*50,"\n",f"The Size of TF lite model  Before compression is = {size /1000 } kb" )
+    print ("*"*50,"\n",f"The Size of TF lite model  After compression is = {size_compressed /1000 } kb" )
+    print ("*"*50,"\n",f"The accuracy of TF lite model is = {accuracy *100 :0.2f}% " )
+
 ########################################################  Execute version A :
 if version == "a" :
     # convert to Tf lite and apply Post Trianing Quantization with weights only :
@@ -399,3 +449,11 @@ if version == "c" :
     
     # Evaluate the Tflite model 
     load_and_evaluation(Quantized , test_ds , Compressed)
+
+
+if version == "t" :
+    # convert to Tf lite and apply Post Trianing Quantization with weights only (the cascade thresholds are set on the edge):
+    Compressed , Quantized  = S_pruning_Model_evaluate_and_compress_to_TFlite(tflite_model_dir =  TFLITE ,  PQT = True)
+    
+    # Evaluate the Tflite model 
+    load_and_evaluation(Quantized , test_ds , Compressed)
\ No newline at end of file
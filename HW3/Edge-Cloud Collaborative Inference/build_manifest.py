@@ -0,0 +1,45 @@
+import argparse
+import json
+import re
+
+
+############################################ KWS manifest ############################################
+# Compiles labels.txt and the pipeline settings into kws_manifest.json once, so that Fast_client and
+# Slow_Service start by reading one small JSON file instead of parsing labels.txt with regexes.
+# Run it again after changing labels.txt or any setting below.
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--labels', default='labels.txt')
+parser.add_argument('--output', default='kws_manifest.json')
+args = parser.parse_args()
+
+
+def parse_labels(path):
+    # labels.txt holds a python list: ['stop', 'up', ...]
+    with open(path) as f:
+        content = f.read()
+    return [re.sub("[]'[]", "", label).strip() for label in content.split(',')]
+
+
+manifest = {
+    'version': 1,
+    'labels': parse_labels(args.labels),
+    'sampling_rate': 16000,
+    'dataset': {
+        'dir': './data/mini_speech_commands',
+        'archive': 'mini_speech_commands.zip',
+        'origin': 'http://storage.googleapis.com/download.tensorflow.org/data/mini_speech_commands.zip',
+        'test_split': 'kws_test_split.txt',
+    },
+    # MFCC settings of the edge cascade models and of the cloud ds_cnn
+    'edge': {'mfcc': {'frame_length': 1024, 'frame_step': 310, 'lower_frequency': 20, 'upper_frequency': 4000,
+                      'num_mel_bins': 40, 'num_coefficients': 10}},
+    'cloud': {'mfcc': {'frame_length': 640, 'frame_step': 320, 'lower_frequency': 20, 'upper_frequency': 4000,
+                       'num_mel_bins': 40, 'num_coefficients': 10},
+              'model': './kws_dscnn_True.tflite'},
+}
+
+with open(args.output, 'w') as f:
+    json.dump(manifest, f, indent=2)
+    f.write('\n')
+print(f"{args.output}: {len(manifest['labels'])} labels {manifest['labels']}")
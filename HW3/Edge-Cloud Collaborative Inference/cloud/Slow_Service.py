@@ -3,118 +3,145 @@ import json
 import json
 import base64
 import numpy as np
-import tensorflow as tf
-import re
-import os
+import features
+from model_cache import MODEL_CACHE
+from result_cache import ResultCache, audio_digest
+from tracing import HEADER, TIMING_HEADER, Trace, make_exporter
+from startup import Readiness, load_manifest
 seed = 42
-tf.random.set_seed(seed)
 np.random.seed(seed)
-############################### Reading the testsplit and labels.txt ###############################
-zip_path = tf.keras.utils.get_file(
-    origin="http://storage.googleapis.com/download.tensorflow.org/data/mini_speech_commands.zip",
-    fname='mini_speech_commands.zip',
-    extract=True,
-    cache_dir='.', cache_subdir='data')
-
-data_dir = os.path.join('.', 'data', 'mini_speech_commands')
-
-test_files = np.loadtxt("kws_test_split.txt" , dtype = str )
-labels = np.loadtxt("labels.txt" , dtype = "object" ,delimiter= "," )
-
-labels = [re.sub("[]''[]","", x) for x in labels]
-labels = [re.sub("'","", x.strip()) for x in labels]
-labels = np.array(labels , dtype = str) 
-labels =  tf.convert_to_tensor(labels)
+# the service never touches the dataset: startup only reads the manifest compiled by build_manifest.py
 
 
 ############################### define Utility Functions ###############################
 
-def compute(  frame_length ,  num_mel_bins, sampling_rate, 
-                    lower_frequency, upper_frequency):
-    num_spectrogram_bins = (frame_length) // 2 + 1 
-    linear_to_mel_weight_matrix = tf.signal.linear_to_mel_weight_matrix(num_mel_bins, num_spectrogram_bins, sampling_rate,
-                    lower_frequency, upper_frequency)
-    return linear_to_mel_weight_matrix
+####### softmax implementation  in numpy #############
+def softmax(x):
+    f_x = np.exp(x) / np.sum(np.exp(x))
+    return f_x
 
 ############ Create the Keywords Spotting Class KWS ######################3
 class  KWS(object):
     exposed = True
-    def __init__(self):
-        self.sampling_rate = 16000                              # 16000  
-        self.frame_length = 640                                               # 640 
-        self.frame_step = 320                                                   # 320 
-        self.num_mel_bins = 40                                               # 40 
-        self.lower_frequency = 20                                         # 20 
-        self.upper_frequency = 4000                                         # 4000
-        self.num_coefficients = 10 										# 10 
+    def __init__(self, manifest, exporter=None, readiness=None):
+        self.exporter = exporter                                # tracing exporter, None disables the export
+        self.readiness = readiness
+        mfcc = manifest['cloud']['mfcc']
+        self.model_path = manifest['cloud']['model']
+        self.sampling_rate = manifest['sampling_rate']          # 16000  
+        self.frame_length = mfcc['frame_length']                              # 640 
+        self.frame_step = mfcc['frame_step']                                    # 320 
+        self.num_mel_bins = mfcc['num_mel_bins']                             # 40 
+        self.lower_frequency = mfcc['lower_frequency']                    # 20 
+        self.upper_frequency = mfcc['upper_frequency']                    # 4000
+        self.num_coefficients = mfcc['num_coefficients'] 						# 10 
         num_spectrogram_bins = self.frame_length // 2 + 1
 
-        self.linear_to_mel_weight_matrix = tf.signal.linear_to_mel_weight_matrix(
-						self.num_mel_bins, num_spectrogram_bins, self.sampling_rate, 20, 4000)
+        self.linear_to_mel_weight_matrix = features.linear_to_mel_weight_matrix(
+						self.num_mel_bins, num_spectrogram_bins, self.sampling_rate, self.lower_frequency, self.upper_frequency)
+        # predictions of recently seen clips, keyed by the hash of the decoded audio
+        self.cache = ResultCache(max_entries=4096, ttl=600.0)
 
-    def preprocess(self ,audio_string):
+    def warm_up(self):
+        # read the model and import the interpreter runtime now rather than on the first request
+        MODEL_CACHE.interpreter(self.model_path)
+
+    def preprocess(self ,audio_bytes):
         # decode and normalize
-        audio_bytes = base64.b64decode(audio_string)
-        audio, _ = tf.audio.decode_wav(audio_bytes)
-        audio = tf.squeeze(audio, axis=1)
+        audio, _ = features.decode_wav(audio_bytes)
+        audio = audio[:, 0]
         # Padding for files with less than 16000 samples
-        zero_padding = tf.zeros([self.sampling_rate] - tf.shape(audio), dtype=tf.float32)   
-        audio = tf.concat([audio, zero_padding], 0)
-        audio.set_shape([self.sampling_rate])
-
-        stft = tf.signal.stft(audio, frame_length=self.frame_length,frame_step=self.frame_step, fft_length=self.frame_length)
-        spectrogram = tf.abs(stft)
+        audio = features.pad_or_trim(audio, self.sampling_rate)
 
-        mel_spectrogram = tf.tensordot(spectrogram, self.linear_to_mel_weight_matrix, 1)
-        log_mel_spectrogram = tf.math.log(mel_spectrogram + 1.e-6)
-        mfccs = tf.signal.mfccs_from_log_mel_spectrograms(log_mel_spectrogram)
-        mfccs = mfccs[..., :self.num_coefficients]
+        # NumPy port of the tf.signal chain: stft, mel, log, mfccs
+        mfccs = features.mfccs(audio, self.frame_length, self.frame_step, self.linear_to_mel_weight_matrix,
+                               self.num_coefficients)
 
-        mfccs = tf.expand_dims(mfccs, -1)
-        mfccs = tf.expand_dims(mfccs, 0)
+        mfccs = mfccs[np.newaxis, :, :, np.newaxis]
 
         return mfccs  
 
     def GET(self, *path, **query):
-        pass
+        # /stats -> cache counters, /ready -> startup times or 503,
+        # /?hash=<sha256 of the decoded audio> -> cached prediction or 404
+        if len(path) > 0 and path[-1] == 'stats':
+            return json.dumps(self.cache.stats())
+        if len(path) > 0 and path[-1] == 'ready':
+            if self.readiness is None or not self.readiness.is_ready():
+                raise cherrypy.HTTPError(503, 'starting')
+            return json.dumps(self.readiness.info())
+        digest = query.get('hash')
+        if digest is None:
+            raise cherrypy.HTTPError(400, 'hash missing')
+        predicted_label = self.cache.get(digest)
+        if predicted_label is None:
+            raise cherrypy.HTTPError(404, 'not cached')
+        return json.dumps({'prediction': predicted_label, 'cached': True})
 
     def POST(self, *path, **query):
         pass
 
     def PUT(self, *path, **query):
-
-        body = cherrypy.request.body.read()
-        body = json.loads(body)
-        for event in body["e"] :
-            if event ["n"] == 'audio' :
-                audio_string = event['vd']
-        # Managing Errors 
-        if audio_string is None:
-            raise cherrypy.HTTPError(400, 'audio missing')
-        # first_recived = body.get("first_recived")
-
-        mfccs = self.preprocess(audio_string=audio_string)	
+        # the request id of the edge links this trace to the client one
+        trace = Trace(cherrypy.request.headers.get(HEADER), side='cloud')
+        try:
+            output_json = self.predict(trace)
+            trace.add_bytes('response_body', len(output_json))
+            return output_json
+        finally:
+            cherrypy.response.headers[HEADER] = trace.request_id
+            cherrypy.response.headers[TIMING_HEADER] = trace.server_timing()
+            if self.exporter is not None:
+                self.exporter.export(trace)
+
+    def predict(self, trace):
+        with trace.span('read'):
+            body = cherrypy.request.body.read()
+        trace.add_bytes('request_body', len(body))
+        with trace.span('decode'):
+            body = json.loads(body)
+            audio_string = None
+            for event in body["e"] :
+                if event ["n"] == 'audio' :
+                    audio_string = event['vd']
+            # Managing Errors 
+            if audio_string is None:
+                raise cherrypy.HTTPError(400, 'audio missing')
+            # first_recived = body.get("first_recived")
+            audio_bytes = base64.b64decode(audio_string)
+
+        with trace.span('cache'):
+            digest = audio_digest(audio_bytes)
+            predicted_label = self.cache.get(digest)
+        if predicted_label is not None:
+            print(f"Slow service cache hit {predicted_label} ")
+            trace.attrs['cached'] = True
+            with trace.span('serialize'):
+                return json.dumps({'prediction': predicted_label, 'cached': True})
+
+        with trace.span('preprocess'):
+            mfccs = self.preprocess(audio_bytes=audio_bytes)	
         # print('Preprocessing {:.3f}ms'.format(preprocessing))
-        interpreter = tf.lite.Interpreter(model_path='./kws_dscnn_True.tflite') # get the selected model
-        interpreter.allocate_tensors()
-        input_details = interpreter.get_input_details()
-        output_details = interpreter.get_output_details()
-        interpreter.set_tensor(input_details[0]['index'], mfccs)
-        interpreter.invoke()
-        predicted = interpreter.get_tensor(output_details[0]['index'])
-        soft_max = softmax(predicted)
-        predicted_label = int(np.argmax(soft_max)) 
+        with trace.span('invoke'):
+            interpreter = MODEL_CACHE.thread_interpreter(self.model_path) # get the selected model
+            input_details = interpreter.get_input_details()
+            output_details = interpreter.get_output_details()
+            interpreter.set_tensor(input_details[0]['index'], mfccs)
+            interpreter.invoke()
+            predicted = interpreter.get_tensor(output_details[0]['index'])
+        with trace.span('softmax'):
+            soft_max = softmax(predicted)
+            predicted_label = int(np.argmax(soft_max)) 
         # predicted_prob = np.max(soft_max) 
         print(f"Slow service predicted_label {predicted_label} ")
-
-
-
+        self.cache.put(digest, predicted_label)
 
         output = {
                     'prediction': predicted_label,
                 }
 
-        output_json = json.dumps(output)
+        with trace.span('serialize'):
+            output_json = json.dumps(output)
 
         return output_json
     def DELETE(self, *path, **query):
@@ -122,9 +149,36 @@ class  KWS(object):
 
 
 if __name__ == '__main__':
-    conf = {'/': {'request.dispatch': cherrypy.dispatch.MethodDispatcher()}}
-    cherrypy.tree.mount(KWS(), '', conf)
-    cherrypy.config.update({'server.socket_host': '0.0.0.0'})
-    cherrypy.config.update({'server.socket_port': 8080})
-    cherrypy.engine.start()
-    cherrypy.engine.block()
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--server', default='cherrypy', choices=['cherrypy', 'async'], help='serving mode')
+    parser.add_argument('--port', default=8080, type=int)
+    parser.add_argument('--threads', default=10, type=int, help='CherryPy thread pool size')
+    parser.add_argument('--workers', default=4, type=int, help='async mode: executor threads for preprocessing and inference')
+    parser.add_argument('--trace-file', default='slow_service_traces.jsonl', help='request traces (.jsonl, or .prom for Prometheus text)')
+    parser.add_argument('--manifest', default='kws_manifest.json', help='labels and settings compiled by build_manifest.py')
+    parser.add_argument('--ready-file', default=None, help='append the startup time of every run as a JSON line')
+    args = parser.parse_args()
+
+    readiness = Readiness('slow_service', args.ready_file)
+    exporter = make_exporter(args.trace_file)
+    kws = KWS(load_manifest(args.manifest), exporter=exporter, readiness=readiness)
+    kws.warm_up()
+    routes = {'': kws}
+    try:
+        if args.server == 'async':
+            from async_server import AsyncServer
+            AsyncServer(routes, host='0.0.0.0', port=args.port, workers=args.workers, on_ready=readiness.mark).run()
+        else:
+            conf = {'/': {'request.dispatch': cherrypy.dispatch.MethodDispatcher()}}
+            for mount, handler in routes.items():
+                cherrypy.tree.mount(handler, mount, conf)
+            cherrypy.config.update({'server.socket_host': '0.0.0.0'})
+            cherrypy.config.update({'server.socket_port': args.port})
+            cherrypy.config.update({'server.thread_pool': args.threads})
+            cherrypy.engine.start()
+            readiness.mark()
+            cherrypy.engine.block()
+    finally:
+        if exporter is not None:
+            exporter.close()
@@ -0,0 +1,119 @@
+import argparse
+import asyncio
+import base64
+import io
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import wave
+
+
+############################################ Load generator for the serving modes ############################################
+# Sends fallback-sized requests (a 1 s, 16 kHz WAV packed in SenML+JSON, as Fast_client does) from many
+# concurrent keep-alive connections, and reports requests per second and latency percentiles.
+# Without --url it starts Slow_Service.py once per serving mode and compares them.
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--url', type=str, default=None, help='benchmark an already running service (host:port)')
+parser.add_argument('--modes', type=str, default='cherrypy,async', help='serving modes to start and compare')
+parser.add_argument('--port', type=int, default=8090)
+parser.add_argument('--concurrency', type=int, default=32)
+parser.add_argument('--requests', type=int, default=500)
+parser.add_argument('--threads', type=int, default=10, help='CherryPy thread pool size')
+parser.add_argument('--workers', type=int, default=4, help='async executor threads')
+args = parser.parse_args()
+
+
+def fallback_body():
+    buf = io.BytesIO()
+    with wave.open(buf, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(16000)
+        wav.writeframes(os.urandom(2 * 16000))
+    audio_string = base64.b64encode(buf.getvalue()).decode()
+    body = {"bn": "raspberrypi.local", "e": [{"n": "audio", "u": "/", "t": 0, "vd": audio_string}]}
+    return json.dumps(body).encode('utf-8')
+
+
+async def client(host, port, body, count, latencies, errors):
+    reader, writer = await asyncio.open_connection(host, port)
+    request = (f'PUT / HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/json\r\n'
+               f'Content-Length: {len(body)}\r\n\r\n').encode('latin-1') + body
+    try:
+        for _ in range(count):
+            start = time.perf_counter()
+            writer.write(request)
+            await writer.drain()
+            status = int((await reader.readline()).split()[1])
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                if name.strip().lower() == 'content-length':
+                    length = int(value)
+            await reader.readexactly(length)
+            latencies.append((time.perf_counter() - start) * 1e3)
+            if status != 200:
+                errors.append(status)
+    finally:
+        writer.close()
+
+
+async def run_load(host, port):
+    body = fallback_body()
+    latencies, errors = [], []
+    per_client = max(1, args.requests // args.concurrency)
+    start = time.perf_counter()
+    await asyncio.gather(*[client(host, port, body, per_client, latencies, errors) for _ in range(args.concurrency)])
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))]
+
+    return {'requests': len(latencies), 'errors': len(errors), 'rps': len(latencies) / elapsed,
+            'p50': percentile(50), 'p95': percentile(95), 'p99': percentile(99), 'bytes': len(body)}
+
+
+def wait_for_port(port, server, timeout=120):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f'service exited with code {server.returncode} before opening port {port}')
+        with socket.socket() as s:
+            if s.connect_ex(('127.0.0.1', port)) == 0:
+                return
+        time.sleep(0.2)
+    raise TimeoutError(f'service did not open port {port}')
+
+
+def report(mode, result):
+    print(f"{mode:<10}{result['requests']:>9}{result['errors']:>8}{result['rps']:>10.1f}"
+          f"{result['p50']:>10.1f}{result['p95']:>10.1f}{result['p99']:>10.1f}")
+
+
+print(f"{'mode':<10}{'requests':>9}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+if args.url is not None:
+    host, port = args.url.rsplit(':', 1)
+    report('target', asyncio.run(run_load(host, int(port))))
+else:
+    # the service runs from the project directory, where the manifest and the models are
+    project_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    for mode in args.modes.split(','):
+        # stderr is kept so a service that fails to start says why
+        server = subprocess.Popen([sys.executable, os.path.join('cloud', 'Slow_Service.py'), '--server', mode,
+                                   '--port', str(args.port), '--threads', str(args.threads),
+                                   '--workers', str(args.workers)],
+                                  cwd=project_dir, stdout=subprocess.DEVNULL)
+        try:
+            wait_for_port(args.port, server)
+            report(mode, asyncio.run(run_load('127.0.0.1', args.port)))
+        finally:
+            server.terminate()
+            server.wait()
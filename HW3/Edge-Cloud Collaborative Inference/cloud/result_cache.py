@@ -0,0 +1,62 @@
+import collections
+import hashlib
+import io
+import threading
+import time
+import wave
+
+
+############################################ Content-addressed result cache ############################################
+# Retries and several devices hearing the same speaker send the same clip more than once. Predictions
+# are cached by a hash of the decoded audio (PCM samples plus format), so the WAV container bytes do
+# not matter. The edge computes the same digest and can ask for a cached prediction before uploading.
+
+def audio_digest(wav_bytes):
+    with wave.open(io.BytesIO(wav_bytes), 'rb') as wav:
+        digest = hashlib.sha256()
+        digest.update(f'{wav.getnchannels()}:{wav.getsampwidth()}:{wav.getframerate()}:'.encode())
+        digest.update(wav.readframes(wav.getnframes()))
+    return digest.hexdigest()
+
+
+class ResultCache(object):
+    def __init__(self, max_entries=4096, ttl=600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = collections.OrderedDict()       # key -> (expiry, value), least recently used first
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            if item[0] < now:
+                del self._entries[key]
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'entries': len(self._entries), 'max_entries': self.max_entries, 'ttl': self.ttl,
+                    'hits': self.hits, 'misses': self.misses, 'expired': self.expired, 'evictions': self.evictions,
+                    'hit_rate': self.hits / lookups if lookups else 0.0}
@@ -0,0 +1,67 @@
+import json
+import os
+import time
+
+_IMPORTED = time.time()
+
+# labels and pipeline settings compiled by build_manifest.py
+MANIFEST_PATH = os.environ.get('KWS_MANIFEST', 'kws_manifest.json')
+
+
+############################################ Manifest and dataset ############################################
+
+def load_manifest(path=MANIFEST_PATH):
+    with open(path) as f:
+        return json.load(f)
+
+
+def ensure_dataset(dataset):
+    # a local copy is used as it is: no network and no TensorFlow import unless the data is missing
+    data_dir = dataset['dir']
+    if not os.path.isdir(data_dir):
+        import tensorflow as tf
+        tf.keras.utils.get_file(origin=dataset['origin'], fname=dataset['archive'], extract=True,
+                                cache_dir='.', cache_subdir='data')
+    return data_dir
+
+
+############################################ Readiness ############################################
+# started is the creation time of the process (from /proc on Linux, otherwise the import of this
+# module), ready is set by mark() once the service can do its work. mark() prints the startup time
+# and appends it as a JSON line to `path`, so startups can be measured across runs.
+
+def process_start_time():
+    try:
+        with open('/proc/self/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        with open('/proc/uptime') as f:
+            uptime = float(f.read().split()[0])
+        # starttime is field 22 of stat, in clock ticks after boot
+        return time.time() - uptime + int(fields[19]) / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class Readiness(object):
+    def __init__(self, service, path=None):
+        self.service = service
+        self.path = path
+        self.started = process_start_time() or _IMPORTED
+        self.ready = None
+
+    def is_ready(self):
+        return self.ready is not None
+
+    def mark(self):
+        self.ready = time.time()
+        info = self.info()
+        print(f"{self.service} ready in {info['startup_ms']:.0f} ms")
+        if self.path:
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(info) + '\n')
+        return info
+
+    def info(self):
+        startup_ms = (self.ready - self.started) * 1e3 if self.ready is not None else None
+        return {'service': self.service, 'pid': os.getpid(), 'started': self.started, 'ready': self.ready,
+                'startup_ms': startup_ms}
@@ -1,46 +1,47 @@
 import json
 import base64
+import hashlib
+import io
+import wave
 import numpy as np
-import tensorflow as tf
-import sys
 import time 
-import re
 import os
 import requests
-from scipy import signal
+import features
+from cascade import CascadeEngine, DEFAULT_SPEC
+from vad import VAD
+from startup import Readiness, ensure_dataset, load_manifest
+from tracing import HEADER, TIMING_HEADER, Trace, make_exporter, request_wire_size, response_wire_size
 
-# define the seed for both numpy and tensorflow
+# define the seed for numpy
 seed = 42
-tf.random.set_seed(seed)
 np.random.seed(seed)
-############################### Reading the testsplit and labels.txt ###############################
-zip_path = tf.keras.utils.get_file(
-    origin="http://storage.googleapis.com/download.tensorflow.org/data/mini_speech_commands.zip",
-    fname='mini_speech_commands.zip',
-    extract=True,
-    cache_dir='.', cache_subdir='data')
-
-data_dir = os.path.join('.', 'data', 'mini_speech_commands')
-
-test_files = np.loadtxt("kws_test_split.txt" , dtype = str )
-labels = np.loadtxt("labels.txt" , dtype = "object" ,delimiter= "," )
-
-labels = [re.sub("[]''[]","", x) for x in labels]
-labels = [re.sub("'","", x.strip()) for x in labels]
-labels = np.array(labels , dtype = str) 
-labels =  tf.convert_to_tensor(labels)
-
 ############################### define Utility Functions ###############################
 
 # Resampling function
 def res(audio, sampling_rate):        
+    from scipy import signal                 # scipy.signal alone takes a second to import
     audio = signal.resample_poly(audio, 1, 16000 // sampling_rate)
     return np.array(audio, dtype = np.float32)
-
-# Translation of the resampling function from a numpy function to a tensorflow function
-def tf_function(audio, sampling_rate):
-    audio = tf.numpy_function(res, [audio, sampling_rate], tf.float32)
-    return audio
+# hash of the decoded audio, the same as result_cache.audio_digest on the cloud side
+def audio_digest(wav_bytes):
+	with wave.open(io.BytesIO(wav_bytes), 'rb') as wav:
+		digest = hashlib.sha256()
+		digest.update(f'{wav.getnchannels()}:{wav.getsampwidth()}:{wav.getframerate()}:'.encode())
+		digest.update(wav.readframes(wav.getnframes()))
+	return digest.hexdigest()
+# HTTP request carrying the trace id; records the round trip, the cloud spans and the on-the-wire bytes
+def traced_request(trace, name, method, url, **kwargs):
+	headers = dict(kwargs.pop('headers', {}), **{HEADER: trace.request_id})
+	start = time.perf_counter()
+	r = requests.request(method, url, headers=headers, **kwargs)
+	round_trip = (time.perf_counter() - start) * 1e3
+	trace.add_span(name, round_trip)
+	cloud = trace.merge_server_timing(r.headers.get(TIMING_HEADER))
+	trace.add_span('network', round_trip - cloud)
+	trace.add_bytes('sent', request_wire_size(r.request))
+	trace.add_bytes('received', response_wire_size(r))
+	return r
 ####### softmax implementation  in numpy #############
 def softmax(x):
     f_x = np.exp(x) / np.sum(np.exp(x))
@@ -58,7 +59,7 @@ def success_checker (probabilityes):
 def compute(  frame_length ,  num_mel_bins, sampling_rate, 
                     lower_frequency, upper_frequency):
     num_spectrogram_bins = (frame_length) // 2 + 1 
-    linear_to_mel_weight_matrix = tf.signal.linear_to_mel_weight_matrix(num_mel_bins, num_spectrogram_bins, sampling_rate,
+    linear_to_mel_weight_matrix = features.linear_to_mel_weight_matrix(num_mel_bins, num_spectrogram_bins, sampling_rate,
                     lower_frequency, upper_frequency)
     return linear_to_mel_weight_matrix
 
@@ -68,8 +69,10 @@ def compute(  frame_length ,  num_mel_bins, sampling_rate,
 class KWS(object):
 	def __init__(self, labels, file_path , linear_to_mel_weight_matrix,frame_length, frame_step, 
             num_mel_bins=None, lower_frequency=None, upper_frequency=None,
-            num_coefficients=None):
+            num_coefficients=None, cascade=None, vad=None):
 			self.labels = labels
+			self.vad = vad                                                                 # None disables the silence gate
+			self.cascade = cascade                                                         # early-exit stages run on the edge
 			self.file_path = file_path
 			self.sampling_rate = 16000                                             # 16000  
 			self.frame_length = frame_length                                               # 640 
@@ -83,104 +86,131 @@ class KWS(object):
 
 
 
-	def preprocess(self , audio_binary):
+	def preprocess(self , audio_binary, trace):
 		# decode and normalize
-		audio, _ = tf.audio.decode_wav(audio_binary)
-		audio = tf.squeeze(audio, axis=1)
-		# Padding for files with less than 16000 samples
-		zero_padding = tf.zeros([self.sampling_rate] - tf.shape(audio), dtype=tf.float32)   
-		audio = tf.concat([audio, zero_padding], 0)
-		audio.set_shape([self.sampling_rate])
-
-		stft = tf.signal.stft(audio, frame_length=self.frame_length,frame_step=self.frame_step, fft_length=self.frame_length)
-		spectrogram = tf.abs(stft)
+		with trace.span('decode'):
+			audio, _ = features.decode_wav(audio_binary)
+			audio = audio[:, 0]
+			# Padding for files with less than 16000 samples
+			audio = features.pad_or_trim(audio, self.sampling_rate)
 
-		mel_spectrogram = tf.tensordot(spectrogram, self.linear_to_mel_weight_matrix, 1)
-		log_mel_spectrogram = tf.math.log(mel_spectrogram + 1.e-6)
-		mfccs = tf.signal.mfccs_from_log_mel_spectrograms(log_mel_spectrogram)
-		mfccs = mfccs[..., :self.num_coefficients]
+		with trace.span('mfcc'):
+			# NumPy port of the tf.signal chain: stft, mel, log, mfccs
+			mfccs = features.mfccs(audio, self.frame_length, self.frame_step, self.linear_to_mel_weight_matrix,
+								   self.num_coefficients)
 
-		mfccs = tf.expand_dims(mfccs, -1)
-		mfccs = tf.expand_dims(mfccs, 0)
+			mfccs = mfccs[np.newaxis, :, :, np.newaxis]
 
 		return mfccs
 
-	def read(self):
-		audio_binary = tf.io.read_file(self.file_path)
-		parts = self.file_path.split("/")
-		parts = [f"'{part}'" for part in parts]
-		label = parts[-2] 
-		label = label[1:-1]
-		label_id = tf.argmax(label == self.labels)
-		
-		audio_bytes = bytearray(open(self.file_path,'rb').read())
-		audio_base64bytes =  base64.b64encode(audio_bytes)
-		audio_string = audio_base64bytes.decode()
+	def read(self, trace):
+		with trace.span('read'):
+			with open(self.file_path, 'rb') as f:
+				audio_binary = f.read()
+			parts = self.file_path.split("/")
+			parts = [f"'{part}'" for part in parts]
+			label = parts[-2] 
+			label = label[1:-1]
+			label_id = np.argmax(label == self.labels)
+			
+			audio_bytes = bytearray(audio_binary)
+		trace.add_bytes('audio', len(audio_bytes))
+		with trace.span('encode'):
+			audio_base64bytes =  base64.b64encode(audio_bytes)
+			audio_string = audio_base64bytes.decode()
 		return   audio_string , label, int(label_id ) , audio_bytes , audio_binary
 
 
-	def predict (self):
-		audio_string , label_t, label_id  , audio_bytes , audio_binary = self.read()
+	def predict (self, trace):
+		audio_string , label_t, label_id  , audio_bytes , audio_binary = self.read(trace)
 		start = time.time()
-		mfccs = self.preprocess(audio_binary)	
+		# silence is answered before the MFCC and the cascade, and never goes to the cloud
+		if self.vad is not None:
+			with trace.span('vad'):
+				speech = self.vad.is_speech_wav(audio_bytes)
+			if not speech:
+				trace.attrs['stage'] = 'silence'
+				excution = (time.time()-start)*1e3
+				return  'silence' , 0.0 , 0.0 , 0.0 , audio_string , 0.0 , label_id , excution , label_t , 'silence' , False
+		mfccs = self.preprocess(audio_binary, trace)	
 		# print('Preprocessing {:.3f}ms'.format(preprocessing))
-		interpreter = tf.lite.Interpreter(model_path='./kws_dscnn_True.tflite') # get the selected model
-		interpreter.allocate_tensors()
-		input_details = interpreter.get_input_details()
-		output_details = interpreter.get_output_details()
-		interpreter.set_tensor(input_details[0]['index'], mfccs)
-		interpreter.invoke()
-		predicted = interpreter.get_tensor(output_details[0]['index'])
+		# tiny model first, then the local ds_cnn; escalate == True sends the clip to the cloud
+		predicted_label, soft_max, stage, escalate = self.cascade.predict(mfccs, trace)
 		end = time.time()
-		soft_max = softmax(predicted)
-		predicted_label = np.argmax(soft_max)
-		# predicted_prob = np.max(soft_max) 
+		with trace.span('policy'):
+			# predicted_prob = np.max(soft_max) 
+			check ,best , sec_best= success_checker(soft_max[np.newaxis])
+		trace.attrs['stage'] = stage
 		
 		excution = (end-start)*1e3
-		check ,best , sec_best= success_checker(soft_max)
-		return  predicted_label , check , best ,sec_best, audio_string,best , label_id ,excution , label_t
+		return  predicted_label , check , best ,sec_best, audio_string,best , label_id ,excution , label_t , stage , escalate
 
 if __name__ == '__main__':
-	MFCC_OPTIONS = {'frame_length': 1024, 'frame_step': 310, 'lower_frequency': 20, 'upper_frequency': 4000, 'num_mel_bins': 40, 'num_coefficients': 10}
-	# MFCC_OPTIONS = {'frame_length': 640, 'frame_step': 320,   'lower_frequency': 20, 'upper_frequency': 4000, 'num_mel_bins': 16, 'num_coefficients': 10}
-	first = True
+	readiness = Readiness('fast_client', os.environ.get('READY_FILE'))
+	############################### labels, settings and test split ###############################
+	# labels and MFCC settings come from the manifest compiled by build_manifest.py
+	manifest = load_manifest()
+	labels = np.array(manifest['labels'], dtype = str)
+	data_dir = ensure_dataset(manifest['dataset'])
+	test_files = np.loadtxt(manifest['dataset']['test_split'] , dtype = str )
+	exporter = make_exporter(os.environ.get('TRACE_FILE', 'fast_client_traces.jsonl'))
+	# stages as name:model_path:threshold, cheapest first
+	cascade = CascadeEngine.from_spec(os.environ.get('CASCADE', DEFAULT_SPEC))
+	# off by default: the test split has no silence label, so every gated clip would count as a miss
+	vad = VAD() if os.environ.get('VAD', '0') == '1' else None
+	MFCC_OPTIONS = manifest['edge']['mfcc']
+	linear_to_mel_weight_matrix = compute( frame_length = MFCC_OPTIONS['frame_length'],  num_mel_bins = MFCC_OPTIONS['num_mel_bins'],
+                    sampling_rate = manifest['sampling_rate'], lower_frequency = MFCC_OPTIONS['lower_frequency'],
+                    upper_frequency = MFCC_OPTIONS['upper_frequency'])
 	total_inference_time = 0
 	i = 0
 	slow = 0
 	count = 0
 	total = len(test_files)
 	cost = 0
+	cache_hits = 0
+	saved = 0
+	cascade.warm_up()
+	readiness.mark()
 	for filename in test_files:
 		print("*" * 100)
 		print('  \r ',i,"\n",end='') 
-		if first == True :
-			print("\n computing")
-			linear_to_mel_weight_matrix = compute( frame_length = 1024,  num_mel_bins = 40, sampling_rate = 16000, 
-                    lower_frequency = 20, upper_frequency = 4000)
-			first = False
-		# print(f"first == {first}")
-		kw_spotting = KWS(labels , filename ,linear_to_mel_weight_matrix, **MFCC_OPTIONS)
-		predicted_label , check , best ,sec_best, audio_string,best , label_id , excution,label_t = kw_spotting.predict()
+		kw_spotting = KWS(labels , filename ,linear_to_mel_weight_matrix, cascade=cascade, vad=vad, **MFCC_OPTIONS)
+		trace = Trace(side='edge')
+		predicted_label , check , best ,sec_best, audio_string,best , label_id , excution,label_t , stage , escalate = kw_spotting.predict(trace)
+		trace.attrs['file'] = filename
 		print(f"\n Actual label is {label_id} , {label_t}")
-		print(f"fast predicted label is {predicted_label }  probability {best*100 :0.2f}%  2nd prob ={sec_best*100 :0.2f}%  and diff = {check*100 :0.3f}% ")
-		if best >=  0.49 and int(predicted_label) == label_id :
+		print(f"fast predicted label ({stage}) is {predicted_label }  probability {best*100 :0.2f}%  2nd prob ={sec_best*100 :0.2f}%  and diff = {check*100 :0.3f}% ")
+		if not escalate and predicted_label != 'silence' and int(predicted_label) == label_id :
 				count += 1
-		if best < 0.49:
+		if escalate:
 			# print(f"model predection is {soft_max} ,    {soft_max.sum()} \n")
 			slow += 1
 			print("Sending to the slow pipeline")
 
 			url = 'http://192.168.43.99:8080/predict'  ### the notebook ip address
+			# ask for a cached prediction of the same clip first, the upload is skipped on a hit
+			digest = audio_digest(base64.b64decode(audio_string))
 			# PACK INFO INTO A JSON
-			to_predict = {
-                        "bn": "raspberrypi.local",
-                        "e": [{"n": "audio", "u": "/", "t": 0, "vd": audio_string}]}
-			to_predict_senML_json = json.dumps(to_predict)
-			
-			size = sys.getsizeof(json.dumps(to_predict_senML_json))
+			with trace.span('serialize'):
+				to_predict = {
+                    "bn": "raspberrypi.local",
+                    "e": [{"n": "audio", "u": "/", "t": 0, "vd": audio_string}]}
+				to_predict_senML_json = json.dumps(to_predict).encode('utf-8')
+			r = traced_request(trace, 'lookup', 'GET', url, params={'hash': digest})
+			if r.status_code == 200:
+				cache_hits += 1
+				# the encoded SenML request body that did not have to be sent
+				saved += len(to_predict_senML_json)
+				print("Cached in the slow pipeline, upload skipped")
+			else:
+				r = traced_request(trace, 'upload', 'PUT', url, data=to_predict_senML_json,
+								   headers={'Content-Type': 'application/json'})
+			# real request + response sizes, headers included
+			size = trace.bytes['sent'] + trace.bytes['received']
 			print(f"size = {size / 1048576} Mb")
 			cost += size
-			r = requests.put(url, json=to_predict)
+			trace.attrs['slow'] = True
 			if r.status_code == 200:
 				# print(r.text)
 				rbody = r.json()
@@ -197,6 +227,8 @@ if __name__ == '__main__':
 		
 		print('Total inference {:.3f}ms'.format(excution))
 		total_inference_time += excution
+		if exporter is not None:
+			exporter.export(trace)
 
 		i += 1
 		# if i == 100 :
@@ -206,11 +238,20 @@ if __name__ == '__main__':
 	# print(total_inference_time)
 	avg_total_inference_time = total_inference_time / i 
 	print(f"correct predictions = {count}")
-	accuracy = count / i 
+	# clips gated as silence got no prediction: they are reported apart, not scored as misses
+	gated = vad.skipped if vad is not None else 0
+	accuracy = count / max(i - gated, 1)
 
-	print(f"accuracy = {accuracy * 100} % ")
+	print(f"accuracy = {accuracy * 100} % on the {i - gated} clips that were not gated as silence")
 	print(f"communication cost = {cost / 1048576} Mb and {slow} files sent to slow pipeline")
+	print(f"{cache_hits} slow requests answered from the cloud cache, {saved / 1048576} Mb of upload request bodies (SenML JSON) skipped")
 	print(f"The average Total inference time is {avg_total_inference_time} ms")
+	if vad is not None:
+		print(f"{vad.skipped} of {vad.blocks} clips detected as silence and skipped")
+	for cascade_stage in cascade.stats()['stages']:
+		print(f"stage {cascade_stage['name']}: {cascade_stage['runs']} runs, {cascade_stage['exits']} early exits, {cascade_stage['mean_ms']:.3f} ms per invoke")
+	if exporter is not None:
+		exporter.close()
 
 
 
@@ -0,0 +1,88 @@
+import os
+import time
+
+import numpy as np
+
+from model_cache import MODEL_CACHE
+
+
+# name:model_path:threshold, cheapest stage first. The tiny stage is a low-alpha ds_cnn trained by
+# HW2/Keyword Spotting/Keyword Spotting.py --version t on the same MFCCs as the edge ds_cnn.
+DEFAULT_SPEC = 'tiny:./kws_tiny.tflite:0.9,ds_cnn:./kws_dscnn_True.tflite:0.49'
+
+
+############################################ Early-exit cascade ############################################
+# Stages run in order on the same MFCCs and the first one whose top probability reaches its threshold
+# answers. When no stage is confident the last stage's output is returned with escalate=True, and the
+# caller sends the clip to the cloud. Most clips stop at the tiny model, so the average edge latency
+# (and energy) is close to the tiny model's instead of the full ds_cnn's.
+
+def softmax(x):
+    e = np.exp(x - np.max(x))
+    return e / np.sum(e)
+
+
+class Stage(object):
+    def __init__(self, name, model_path, threshold):
+        self.name = name
+        self.model_path = model_path
+        self.threshold = threshold
+        self.runs = 0
+        self.exits = 0
+        self.total_ms = 0.0
+
+    def run(self, mfccs):
+        start = time.perf_counter()
+        interpreter = MODEL_CACHE.thread_interpreter(self.model_path)
+        input_details = interpreter.get_input_details()
+        output_details = interpreter.get_output_details()
+        interpreter.set_tensor(input_details[0]['index'], np.asarray(mfccs, dtype=np.float32))
+        interpreter.invoke()
+        predicted = interpreter.get_tensor(output_details[0]['index'])
+        elapsed = (time.perf_counter() - start) * 1e3
+        self.runs += 1
+        self.total_ms += elapsed
+        return predicted, elapsed
+
+
+class CascadeEngine(object):
+    def __init__(self, stages):
+        if not stages:
+            raise ValueError('the cascade needs at least one stage')
+        self.stages = stages
+        self.escalations = 0
+
+    @classmethod
+    def from_spec(cls, spec=DEFAULT_SPEC):
+        # stages whose model file is missing are skipped, so the cascade works before the tiny model is trained
+        stages = []
+        for item in spec.split(','):
+            name, model_path, threshold = item.strip().split(':')
+            if not os.path.exists(model_path):
+                print(f"cascade: {model_path} not found, stage {name} skipped")
+                continue
+            stages.append(Stage(name, model_path, float(threshold)))
+        return cls(stages)
+
+    def warm_up(self):
+        # load every stage model and build its interpreter on the calling thread, before the first clip
+        for stage in self.stages:
+            MODEL_CACHE.thread_interpreter(stage.model_path)
+
+    def predict(self, mfccs, trace=None):
+        # returns (label, probabilities, stage name, escalate)
+        for stage in self.stages:
+            predicted, elapsed = stage.run(mfccs)
+            if trace is not None:
+                trace.add_span(f'invoke.{stage.name}', elapsed)
+            probabilities = softmax(predicted[0])
+            if np.max(probabilities) >= stage.threshold:
+                stage.exits += 1
+                return int(np.argmax(probabilities)), probabilities, stage.name, False
+        self.escalations += 1
+        return int(np.argmax(probabilities)), probabilities, stage.name, True
+
+    def stats(self):
+        return {'stages': [{'name': s.name, 'threshold': s.threshold, 'runs': s.runs, 'exits': s.exits,
+                            'mean_ms': s.total_ms / s.runs if s.runs else 0.0} for s in self.stages],
+                'escalations': self.escalations}
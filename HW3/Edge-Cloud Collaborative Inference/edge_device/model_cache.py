@@ -0,0 +1,138 @@
+import hashlib
+import mmap
+import os
+import threading
+
+
+############################################ Interpreter runtime ############################################
+# Only the TFLite interpreter is needed at inference time: tflite_runtime (or its successor
+# ai_edge_litert) imports in milliseconds and weighs a few MB, full TensorFlow is only the fallback and
+# is imported on the first interpreter, never at import time. TFLITE_RUNTIME forces one of them
+# ('tflite_runtime', 'ai_edge_litert' or 'tensorflow'), e.g. for models that need the TF select ops.
+
+RUNTIMES = ('tflite_runtime', 'ai_edge_litert', 'tensorflow')
+
+_interpreter_class = None
+RUNTIME = None
+
+
+def _import_interpreter(runtime):
+    if runtime == 'tflite_runtime':
+        from tflite_runtime.interpreter import Interpreter
+        return Interpreter
+    if runtime == 'ai_edge_litert':
+        from ai_edge_litert.interpreter import Interpreter
+        return Interpreter
+    import tensorflow as tf
+    return tf.lite.Interpreter
+
+
+def interpreter_class():
+    global _interpreter_class, RUNTIME
+    if _interpreter_class is None:
+        forced = os.environ.get('TFLITE_RUNTIME')
+        if forced is not None and forced not in RUNTIMES:
+            raise ValueError(f'unknown TFLITE_RUNTIME {forced}')
+        for runtime in ([forced] if forced else RUNTIMES):
+            try:
+                _interpreter_class = _import_interpreter(runtime)
+            except ImportError:
+                if forced:
+                    raise
+                continue
+            RUNTIME = runtime
+            break
+        else:
+            raise ImportError('no TFLite interpreter: install tflite_runtime or tensorflow')
+    return _interpreter_class
+
+
+############################################ Shared TFLite model cache ############################################
+# Interpreters are built from model_path: the runtime memory-maps the .tflite read-only, so the model
+# pages live once in the OS page cache and are shared by every interpreter and every process using it.
+# (model_content would not do: the python bindings only accept `bytes`, a private copy per process.)
+# The cache keeps (path, mtime, size) and the sha256 of each model, so a model replaced by /add is seen
+# on the next lookup. Models must be replaced with os.replace, never rewritten in place, because live
+# interpreters still map the old file.
+
+class ModelEntry(object):
+    def __init__(self, path, mtime, size, sha256):
+        self.path = path
+        self.mtime = mtime
+        self.size = size
+        self.sha256 = sha256
+
+    def key(self):
+        return (self.path, self.mtime, self.size)
+
+
+class ModelCache(object):
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.hits = 0
+        self.misses = 0
+
+    def _stat(self, path):
+        st = os.stat(path)
+        return st.st_mtime_ns, st.st_size
+
+    def _load(self, path, mtime, size):
+        with open(path, 'rb') as f:
+            if size == 0:
+                raise ValueError(f'model file {path} is empty')
+            # hashed through a temporary mapping, no copy of the model is kept
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                sha256 = hashlib.sha256(mapped).hexdigest()
+        return ModelEntry(path, mtime, size, sha256)
+
+    def entry(self, model_path):
+        # (path, mtime, size) is checked on every lookup, so a model overwritten by /add is reloaded
+        path = os.path.abspath(model_path)
+        mtime, size = self._stat(path)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry.key() == (path, mtime, size):
+                self.hits += 1
+                return entry
+            self.misses += 1
+            entry = self._load(path, mtime, size)
+            self._entries[path] = entry
+            return entry
+
+    def interpreter(self, model_path):
+        # interpreters are not thread safe: each caller gets its own, backed by the shared mapping
+        interpreter = interpreter_class()(model_path=self.entry(model_path).path)
+        interpreter.allocate_tensors()
+        return interpreter
+
+    def thread_interpreter(self, model_path):
+        # one ready-to-use interpreter per (thread, model); rebuilt when the model file changes
+        entry = self.entry(model_path)
+        local = self._local.__dict__
+        cached = local.get(entry.path)
+        if cached is not None and cached[0] == entry.key():
+            return cached[1]
+        interpreter = interpreter_class()(model_path=entry.path)
+        interpreter.allocate_tensors()
+        local[entry.path] = (entry.key(), interpreter)
+        return interpreter
+
+    def invalidate(self, model_path):
+        path = os.path.abspath(model_path)
+        with self._lock:
+            self._entries.pop(path, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            models = {path: {'size': e.size, 'sha256': e.sha256} for path, e in self._entries.items()}
+        return {'hits': self.hits, 'misses': self.misses, 'runtime': RUNTIME, 'models': models}
+
+
+# process wide cache shared by every handler
+MODEL_CACHE = ModelCache()
@@ -0,0 +1,159 @@
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+
+HEADER = 'X-Request-ID'
+TIMING_HEADER = 'Server-Timing'
+BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)        # ms
+
+
+############################################ End-to-end request tracing ############################################
+# One Trace per clip on the edge and one per request in the cloud, linked by the X-Request-ID header.
+# A trace holds named spans (ms) and byte counters. The cloud returns its spans in a Server-Timing
+# header, so the edge record has the whole breakdown and the network time is the round trip minus the
+# cloud spans. Records go to a JSON-lines file, or to a Prometheus text file when the path ends in .prom.
+
+def new_request_id():
+    return uuid.uuid4().hex
+
+
+class Trace(object):
+    def __init__(self, request_id=None, side='edge'):
+        self.request_id = request_id or new_request_id()
+        self.side = side
+        self.timestamp = time.time()
+        self._start = time.perf_counter()
+        self.spans = {}
+        self.bytes = {}
+        self.attrs = {}
+
+    @contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.add_span(name, (time.perf_counter() - start) * 1e3)
+
+    def add_span(self, name, duration_ms):
+        self.spans[name] = self.spans.get(name, 0.0) + duration_ms
+
+    def add_bytes(self, name, count):
+        self.bytes[name] = self.bytes.get(name, 0) + count
+
+    def server_timing(self):
+        return ', '.join(f'{name};dur={duration:.3f}' for name, duration in self.spans.items())
+
+    def merge_server_timing(self, header, prefix='cloud.'):
+        # adds the spans of a Server-Timing header (name;dur=ms, ...) and returns their total
+        total = 0.0
+        for item in (header or '').split(','):
+            name, _, params = item.strip().partition(';')
+            for param in params.split(';'):
+                key, _, value = param.strip().partition('=')
+                if name and key == 'dur':
+                    self.add_span(prefix + name, float(value))
+                    total += float(value)
+        return total
+
+    def record(self):
+        return {'request_id': self.request_id, 'side': self.side, 'timestamp': self.timestamp,
+                'total_ms': (time.perf_counter() - self._start) * 1e3,
+                'spans': self.spans, 'bytes': self.bytes, **self.attrs}
+
+
+############################################ On-the-wire sizes ############################################
+# Sizes of the HTTP messages as sent: request/status line, headers and body (requests objects).
+
+def request_wire_size(prepared):
+    host = prepared.url.split('://', 1)[-1].split('/', 1)[0]
+    head = f'{prepared.method} {prepared.path_url} HTTP/1.1\r\nHost: {host}\r\n'
+    head += ''.join(f'{name}: {value}\r\n' for name, value in prepared.headers.items()) + '\r\n'
+    body = prepared.body or b''
+    return len(head.encode('latin-1')) + len(body)
+
+
+def response_wire_size(response):
+    head = f'HTTP/1.1 {response.status_code} {response.reason}\r\n'
+    head += ''.join(f'{name}: {value}\r\n' for name, value in response.headers.items()) + '\r\n'
+    return len(head.encode('latin-1')) + len(response.content)
+
+
+############################################ Exporters ############################################
+
+class JsonLinesExporter(object):
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'a')
+
+    def export(self, trace):
+        line = json.dumps(trace.record(), separators=(',', ':'))
+        with self._lock:
+            self._file.write(line + '\n')
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class PrometheusExporter(object):
+    # span durations as histograms and byte counters, rewritten (atomically) every flush_every traces
+    def __init__(self, path, flush_every=10):
+        self.path = path
+        self.flush_every = flush_every
+        self._lock = threading.Lock()
+        self._histograms = {}            # (side, span) -> [bucket counts..., count, sum]
+        self._bytes = {}                 # (side, name) -> total
+        self._pending = 0
+
+    def export(self, trace):
+        with self._lock:
+            spans = dict(trace.spans, total=trace.record()['total_ms'])
+            for name, duration in spans.items():
+                histogram = self._histograms.setdefault((trace.side, name), [0] * (len(BUCKETS) + 2))
+                for i, bound in enumerate(BUCKETS):
+                    if duration <= bound:
+                        histogram[i] += 1
+                histogram[-2] += 1
+                histogram[-1] += duration
+            for name, count in trace.bytes.items():
+                self._bytes[(trace.side, name)] = self._bytes.get((trace.side, name), 0) + count
+            self._pending += 1
+            if self._pending >= self.flush_every:
+                self._write()
+
+    def _write(self):
+        lines = ['# TYPE kws_span_duration_ms histogram']
+        for (side, name), histogram in sorted(self._histograms.items()):
+            labels = f'side="{side}",span="{name}"'
+            for bound, count in zip(BUCKETS, histogram):
+                lines.append(f'kws_span_duration_ms_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'kws_span_duration_ms_bucket{{{labels},le="+Inf"}} {histogram[-2]}')
+            lines.append(f'kws_span_duration_ms_count{{{labels}}} {histogram[-2]}')
+            lines.append(f'kws_span_duration_ms_sum{{{labels}}} {histogram[-1]:.3f}')
+        lines.append('# TYPE kws_bytes_total counter')
+        for (side, name), total in sorted(self._bytes.items()):
+            lines.append(f'kws_bytes_total{{side="{side}",name="{name}"}} {total}')
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, self.path)
+        self._pending = 0
+
+    def close(self):
+        with self._lock:
+            self._write()
+
+
+def make_exporter(path):
+    if not path:
+        return None
+    if path.endswith('.prom'):
+        return PrometheusExporter(path)
+    return JsonLinesExporter(path)
@@ -1,5 +1,7 @@
 import requests
-import base64
+import hashlib
+import os
+import time
 
 
 
@@ -20,28 +22,68 @@ import base64
 # hthres = args.hthres
 # print(f'model_name = {model_name}')
 
+######################################### chunked, resumable binary upload #########################################
+def file_sha256(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def upload_model(url_add, model_name, file_path, chunk_size=64 * 1024, retries=5):
+    size = os.path.getsize(file_path)
+    sha256 = file_sha256(file_path)
+
+    # skip the transfer when the device already stores the same model, resume a partial upload otherwise
+    status = requests.get(f'{url_add}/{model_name}').json()
+    if status['sha256'] == sha256:
+        return 'unchanged'
+    offset = status['offset'] if 0 < status['offset'] < size else 0
+
+    failures = 0
+    with open(file_path, 'rb') as f:
+        while True:
+            f.seek(offset)
+            chunk = f.read(chunk_size)
+            try:
+                r = requests.put(f'{url_add}/{model_name}', params={'offset': offset, 'size': size, 'sha256': sha256},
+                                 data=chunk, headers={'Content-Type': 'application/octet-stream'})
+            except requests.ConnectionError as error:
+                failures += 1
+                if failures > retries:
+                    raise
+                print(f" upload of {model_name} interrupted ({error}), resuming")
+                time.sleep(min(2 ** failures, 30))
+                offset = requests.get(f'{url_add}/{model_name}').json()['offset']
+                continue
+            # errors raised by CherryPy itself come back as HTML, only 200 and 409 carry JSON
+            if r.status_code not in (200, 409):
+                raise RuntimeError(f"upload of {model_name} failed: {r.status_code} {r.text}")
+            body = r.json()
+            if r.status_code == 409:            # the device has a different offset: continue from there
+                offset = body['offset']
+                continue
+            if body['status'] in ('complete', 'unchanged'):
+                return body['status']
+            offset = body['offset']
+
+
 def main() :
     
 ######################################### ADD service #########################################
     path = './models'
     models = ['cnn' , 'mlp']
+    # the multi-horizon model (HW2 version m) is uploaded too when it has been trained
+    if os.path.exists(f'{path}/multi.tflite'):
+        models.append('multi')
     for model_name in models :
-        model_bytes = bytearray(open(f'{path}/{model_name}.tflite','rb').read())
-
-
-        model_base64bytes =  base64.b64encode(model_bytes)
-        model_string = model_base64bytes.decode()
-
-        body = {
-                "model": model_string,
-                "name": model_name
-                }             
         url_add = 'http://192.168.43.114:8080/add'
-        r_add = requests.post(url_add, json = body)
-        if r_add.status_code == 200:
-            print(f" model {model_name} was added Successfully")
+        status = upload_model(url_add, model_name, f'{path}/{model_name}.tflite')
+        if status == 'unchanged':
+            print(f" model {model_name} is already up to date")
         else:
-            print('Error:', r_add.status_code)
+            print(f" model {model_name} was added Successfully")
     ######################################### List service #########################################
 
 
@@ -49,24 +91,44 @@ def main() :
     r_list = requests.get(url_list)
     content = r_list.json()
     length = len (content["models"])
-    if length != 2 :
-        print(f" Error : the list lenght is {length} != 2 ") 
+    if length != len(models) :
+        print(f" Error : the list lenght is {length} != {len(models)} ") 
     else :
         print(f"the list lenght is {length} \n the models saved are {content['models']} ")
+        for name, details in content.get('details', {}).items():
+            print(f" {name}: {details.get('size')} bytes, {details.get('latency_ms', float('nan')):.3f} ms per invoke")
+    # the list is only sent again when it changed
+    r_again = requests.get(url_list, headers={'If-None-Match': r_list.headers.get('ETag', '')})
+    print(f" list unchanged since last request: {r_again.status_code == 304}")
 
     ######################################### Predict service #########################################
 
     model_name = 'cnn'
     tthres=0.1
     hthres=0.2
-    url_predict = f'http://192.168.43.114:8080/predict?model={model_name}&tthres={tthres}&hthres={hthres}'
+    shadow = 'mlp'     # evaluated on the same readings as the primary model, reported in the job metrics
+    url_predict = f'http://192.168.43.114:8080/predict?model={model_name}&tthres={tthres}&hthres={hthres}&shadow={shadow}'
     r_predict = requests.get(url_predict)
 
     
     if r_predict.status_code == 200:
-        print(f" Executing predict with model={model_name} tthres={tthres} hthres={hthres}")
+        job_id = r_predict.json()['job_id']
+        print(f" Executing predict with model={model_name} tthres={tthres} hthres={hthres} as job {job_id}")
+        # the job keeps running on the device: inspect it with GET /jobs/<id>, stop it with DELETE /jobs/<id>
+        r_job = requests.get(f'http://192.168.43.114:8080/jobs/{job_id}')
+        print(f" job status {r_job.json()}")
     else:
         print('Error:', r_predict.status_code)
+
+    # a multi-horizon model (HW2 version m) serves both forecast lengths from one interpreter
+    if 'multi' in models:
+        for horizon in (3, 9):
+            url_multi = f'http://192.168.43.114:8080/predict?model=multi&tthres={tthres}&hthres={hthres}&horizon={horizon}'
+            r_multi = requests.get(url_multi)
+            if r_multi.status_code == 200:
+                print(f" Executing predict with model=multi horizon={horizon} as job {r_multi.json()['job_id']}")
+            else:
+                print('Error:', r_multi.status_code, r_multi.text)
 if __name__ == "__main__":
     main()   
 
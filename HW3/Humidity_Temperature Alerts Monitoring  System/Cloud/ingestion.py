@@ -0,0 +1,182 @@
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+
+from senml_codec import split_topic
+
+
+############################################ Alert ingestion pipeline ############################################
+# The paho network loop only calls submit(), which never blocks: a full queue drops the message and
+# counts it. A pool of workers decodes and validates the SenML packs and writes the rows to the sink
+# in batches, so the MQTT loop keeps up whatever the storage does.
+
+class ValidationError(ValueError):
+    pass
+
+
+def pack_to_rows(topic, pack):
+    # one row per SenML record: (time, device, topic, name, value)
+    if not isinstance(pack, dict) or not isinstance(pack.get('e'), list):
+        raise ValidationError('not a SenML pack')
+    device = pack.get('bn', '')
+    base_time = pack.get('bt', 0)
+    if not isinstance(device, str) or not isinstance(base_time, (int, float)):
+        raise ValidationError('bad base name or base time')
+    rows = []
+    for record in pack['e']:
+        if not isinstance(record, dict) or not isinstance(record.get('n'), str):
+            raise ValidationError('record without a name')
+        if 'v' in record:
+            value = record['v']
+        elif 'vb' in record:
+            value = float(bool(record['vb']))
+        else:
+            raise ValidationError(f"record {record['n']} without a value")
+        if not isinstance(value, (int, float)):
+            raise ValidationError(f"record {record['n']} has a non numeric value")
+        rows.append((base_time + record.get('t', 0), device, topic, record['n'], float(value)))
+    return rows
+
+
+class JsonLinesSink(object):
+    # daily JSON-lines files, written one batch at a time
+    def __init__(self, directory='./alerts'):
+        self.directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, rows):
+        by_day = {}
+        for row in rows:
+            day = datetime.fromtimestamp(row[0], timezone.utc).strftime('%Y-%m-%d')
+            by_day.setdefault(day, []).append(row)
+        with self._lock:
+            for day, day_rows in by_day.items():
+                with open(os.path.join(self.directory, f'{day}.jsonl'), 'a') as f:
+                    f.write(''.join(json.dumps({'t': t, 'device': device, 'topic': topic, 'n': name, 'v': value}) + '\n'
+                                    for t, device, topic, name, value in day_rows))
+
+    def close(self):
+        pass
+
+
+class TimeSeriesSink(object):
+    # one series per device and record name in the local time-series store
+    def __init__(self, store):
+        self.store = store
+
+    def write(self, rows):
+        by_series = {}
+        for t, device, topic, name, value in rows:
+            times, values = by_series.setdefault(f'{device}/{name}', ([], []))
+            times.append(t)
+            values.append(value)
+        for series, (times, values) in by_series.items():
+            self.store.append_many(series, times, values)
+
+    def close(self):
+        self.store.close()
+
+
+class IngestionPipeline(object):
+    def __init__(self, sink, workers=4, maxsize=10000, batch_size=500, batch_timeout=1.0, report_every=10.0):
+        self.sink = sink
+        self.workers = workers
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout
+        self.report_every = report_every
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._threads = []
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+
+        self.received = 0
+        self.dropped = 0
+        self.invalid = 0
+        self.written = 0
+        self.batches = 0
+        self.high_watermark = 0
+
+    ##################### called from the MQTT network loop ####################
+    def submit(self, topic, payload):
+        self.received += 1
+        try:
+            self._queue.put_nowait((topic, payload))
+        except queue.Full:
+            self.dropped += 1
+            return False
+        depth = self._queue.qsize()
+        if depth > self.high_watermark:
+            self.high_watermark = depth
+        return True
+
+    ##################### workers ####################
+    def _flush(self, rows):
+        if not rows:
+            return
+        try:
+            self.sink.write(rows)
+        except Exception as error:
+            print(f"ingestion: failed to write {len(rows)} rows: {error!r}")
+            return
+        with self._lock:
+            self.written += len(rows)
+            self.batches += 1
+
+    def _work(self):
+        rows = []
+        deadline = time.monotonic() + self.batch_timeout
+        while True:
+            timeout = max(0.0, deadline - time.monotonic())
+            try:
+                topic, payload = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                topic = None
+            if topic is not None:
+                base_topic, codec = split_topic(topic)
+                try:
+                    rows.extend(pack_to_rows(base_topic, codec.decode(payload)))
+                except Exception as error:
+                    # any malformed payload is counted and skipped, a worker never dies on one
+                    with self._lock:
+                        self.invalid += 1
+                    print(f"ingestion: invalid {codec.name} payload on '{topic}': {error}")
+                finally:
+                    self._queue.task_done()
+            if len(rows) >= self.batch_size or time.monotonic() >= deadline:
+                self._flush(rows)
+                rows = []
+                deadline = time.monotonic() + self.batch_timeout
+            if topic is None and self._stop_event.is_set() and self._queue.empty():
+                self._flush(rows)
+                return
+
+    def _report(self):
+        while not self._stop_event.wait(self.report_every):
+            print("ingestion: %s" % (self.stats(),))
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f'ingest-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        if self.report_every:
+            thread = threading.Thread(target=self._report, name='ingest-report', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        # drain what is already queued, then stop the workers
+        self._stop_event.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        self.sink.close()
+
+    def stats(self):
+        return {'queue_depth': self._queue.qsize(), 'queue_capacity': self._queue.maxsize,
+                'high_watermark': self.high_watermark, 'received': self.received, 'dropped': self.dropped,
+                'invalid': self.invalid, 'written': self.written, 'batches': self.batches}
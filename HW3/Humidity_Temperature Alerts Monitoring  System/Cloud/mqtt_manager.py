@@ -0,0 +1,199 @@
+import collections
+import os
+import threading
+import uuid
+
+import paho.mqtt.client as PahoMQTT
+
+
+############################################ Process-wide MQTT connection manager ############################################
+# One persistent paho client (one socket, one network thread) per broker, shared by every publisher and
+# subscriber of the process. Subscribers register a handler per topic filter, and the filters are
+# re-subscribed after every reconnection. Reconnections are left to the paho loop with an exponential
+# backoff, and the publishes issued while the connection is down are kept in a queue bounded in bytes.
+
+class MQTTManager(object):
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    @classmethod
+    def shared(cls, broker="test.mosquitto.org", port=1883, **kwargs):
+        with cls._instances_lock:
+            manager = cls._instances.get((broker, port))
+            if manager is None:
+                manager = cls._instances[(broker, port)] = cls(broker, port, **kwargs)
+            return manager
+
+    def __init__(self, broker, port, client_prefix='ml4iot', max_offline_bytes=1 << 20,
+                 min_reconnect_delay=1, max_reconnect_delay=60):
+        self.broker = broker
+        self.port = port
+        # a unique client id: two processes with the same id knock each other off the broker
+        self.clientID = f'{client_prefix}-{os.getpid()}-{uuid.uuid4().hex[:8]}'
+        self.max_offline_bytes = max_offline_bytes
+
+        self._paho_mqtt = PahoMQTT.Client(self.clientID, True)
+        self._paho_mqtt.on_connect = self._on_connect
+        self._paho_mqtt.on_disconnect = self._on_disconnect
+        self._paho_mqtt.on_message = self._on_message
+        self._paho_mqtt.reconnect_delay_set(min_delay=min_reconnect_delay, max_delay=max_reconnect_delay)
+
+        self._lock = threading.RLock()
+        self._handlers = collections.defaultdict(list)      # topic filter -> [handler(topic, payload)]
+        self._qos = {}                                       # topic filter -> qos
+        self._offline = collections.deque()
+        self._offline_bytes = 0
+        self._users = 0
+        self._started = False
+        self.connected = False
+
+        self.connects = 0
+        self.disconnects = 0
+        self.offline_dropped = 0
+
+    ##################### connection ####################
+    def start(self):
+        # reference counted: the connection opens with the first user and closes with the last one
+        with self._lock:
+            self._users += 1
+            if self._started:
+                return
+            self._started = True
+        self._paho_mqtt.connect_async(self.broker, self.port)
+        self._paho_mqtt.loop_start()
+
+    def stop(self):
+        with self._lock:
+            self._users -= 1
+            if self._users > 0 or not self._started:
+                return
+            self._started = False
+        self._paho_mqtt.disconnect()
+        self._paho_mqtt.loop_stop()
+
+    def _on_connect(self, paho_mqtt, userdata, flags, rc):
+        print ("Connected to %s as %s with result code: %d" % (self.broker, self.clientID, rc))
+        if rc != 0:
+            return
+        with self._lock:
+            self.connected = True
+            self.connects += 1
+            filters = [(topic, self._qos[topic]) for topic in self._handlers]
+            pending = list(self._offline)
+            self._offline.clear()
+            self._offline_bytes = 0
+        if filters:
+            self._paho_mqtt.subscribe(filters)
+        for topic, payload, qos in pending:
+            self._paho_mqtt.publish(topic, payload, qos)
+
+    def _on_disconnect(self, paho_mqtt, userdata, rc):
+        with self._lock:
+            self.connected = False
+            self.disconnects += 1
+        if rc != 0:
+            print ("Lost the connection to %s (rc %d), reconnecting" % (self.broker, rc))
+
+    ##################### publish ####################
+    def publish(self, topic, payload, qos=2):
+        with self._lock:
+            if not self.connected:
+                self._enqueue(topic, payload, qos)
+                return False
+        info = self._paho_mqtt.publish(topic, payload, qos)
+        if info.rc == PahoMQTT.MQTT_ERR_NO_CONN:
+            # paho keeps and resends QoS 1/2 messages by itself, only QoS 0 would be lost
+            if qos == 0:
+                with self._lock:
+                    self._enqueue(topic, payload, qos)
+            return False
+        return True
+
+    def _enqueue(self, topic, payload, qos):
+        size = len(payload)
+        if size > self.max_offline_bytes:
+            self.offline_dropped += 1
+            return
+        # the oldest messages go first when the memory bound is reached
+        while self._offline and self._offline_bytes + size > self.max_offline_bytes:
+            _, old_payload, _ = self._offline.popleft()
+            self._offline_bytes -= len(old_payload)
+            self.offline_dropped += 1
+        self._offline.append((topic, payload, qos))
+        self._offline_bytes += size
+
+    ##################### subscribe ####################
+    def subscribe(self, topic, handler, qos=2):
+        with self._lock:
+            first = topic not in self._handlers
+            self._handlers[topic].append(handler)
+            self._qos[topic] = max(qos, self._qos.get(topic, 0))
+            connected = self.connected
+        if connected and first:
+            self._paho_mqtt.subscribe(topic, qos)
+
+    def unsubscribe(self, topic, handler):
+        with self._lock:
+            handlers = self._handlers.get(topic, [])
+            if handler in handlers:
+                handlers.remove(handler)
+            last = not handlers
+            if last:
+                self._handlers.pop(topic, None)
+                self._qos.pop(topic, None)
+            connected = self.connected
+        if connected and last:
+            self._paho_mqtt.unsubscribe(topic)
+
+    def _on_message(self, paho_mqtt, userdata, msg):
+        with self._lock:
+            handlers = [handler for topic, topic_handlers in self._handlers.items()
+                        if PahoMQTT.topic_matches_sub(topic, msg.topic) for handler in topic_handlers]
+        for handler in handlers:
+            try:
+                handler(msg.topic, msg.payload)
+            except Exception as error:
+                print ("handler failed on topic '%s': %r" % (msg.topic, error))
+
+    def stats(self):
+        with self._lock:
+            return {'client_id': self.clientID, 'connected': self.connected, 'users': self._users,
+                    'connects': self.connects, 'disconnects': self.disconnects,
+                    'offline_queued': len(self._offline), 'offline_bytes': self._offline_bytes,
+                    'offline_dropped': self.offline_dropped, 'subscriptions': sorted(self._handlers)}
+
+
+############################################ MyMQTT-compatible view on the shared connection ############################################
+
+class SharedMyMQTT(object):
+    def __init__(self, clientID, broker, port, notifier, manager=None):
+        self.clientID = clientID
+        self.broker = broker
+        self.port = port
+        self.notifier = notifier
+        self.manager = manager or MQTTManager.shared(broker, port)
+        self._topics = []
+
+    def myOnMessageReceived(self, topic, payload):
+        self.notifier.notify(topic, payload)
+
+    def myPublish(self, topic, msg, qos=2, verbose=False):
+        if verbose:
+            print ("publishing '%s' with topic '%s'" % (msg, topic))
+        else:
+            print ("publishing %d bytes with topic '%s' (qos %d)" % (len(msg), topic, qos))
+        self.manager.publish(topic, msg, qos)
+
+    def mySubscribe(self, topic, qos=2):
+        print ("subscribing to %s" % (topic))
+        self.manager.subscribe(topic, self.myOnMessageReceived, qos)
+        self._topics.append(topic)
+
+    def start(self):
+        self.manager.start()
+
+    def stop(self):
+        for topic in self._topics:
+            self.manager.unsubscribe(topic, self.myOnMessageReceived)
+        self._topics = []
+        self.manager.stop()
@@ -1,11 +1,20 @@
 from MyMQTT import MyMQTT
+from mqtt_manager import SharedMyMQTT
+from senml_codec import DEFAULT_CODEC, get_codec, split_topic, topic_for
 
 
 class setup():
-    def __init__(self, clientID):
+    def __init__(self, clientID, codec=DEFAULT_CODEC, pipeline=None, shared=True):
         # create an instance of MyMQTT class
         self.clientID = clientID
-        self.myMqttClient = MyMQTT(self.clientID, "test.mosquitto.org", 1883, self)
+        self.codec = get_codec(codec)
+        # when set, received messages are only queued: decoding and storage happen in the pipeline workers
+        self.pipeline = pipeline
+        # by default every setup of the process shares one connection (see mqtt_manager)
+        if shared:
+            self.myMqttClient = SharedMyMQTT(self.clientID, "test.mosquitto.org", 1883, self)
+        else:
+            self.myMqttClient = MyMQTT(self.clientID, "test.mosquitto.org", 1883, self)
 
     def run(self):
         # if needed, perform some other actions befor starting the mqtt communication
@@ -17,9 +26,39 @@ class setup():
         print ("ending %s" % (self.clientID))
         self.myMqttClient.stop ()
 
+    def publish_senml(self, topic, pack, qos=2):
+        # encode the SenML pack with the configured codec, the codec name travels as topic suffix
+        payload = self.codec.encode(pack)
+        self.myMqttClient.myPublish(topic_for(topic, self.codec.name), payload, qos)
+
     def notify(self, topic, msg):
         # manage here your received message. You can perform some error-check here
-        print ("received '%s' under topic '%s'" % (msg, topic))
+        if self.pipeline is not None:
+            self.pipeline.submit(topic, msg)
+            return
+        topic, codec = split_topic(topic)
+        try:
+            pack = codec.decode(msg)
+        except ValueError as error:
+            print ("dropping undecodable %s payload under topic '%s': %s" % (codec.name, topic, error))
+            return
+        print ("received '%s' under topic '%s' (%s)" % (pack, topic, codec.name))
 
 
+if __name__ == "__main__":
+    import time
+    from ingestion import IngestionPipeline, TimeSeriesSink
+    from tsstore import TimeSeriesStore
 
+    pipeline = IngestionPipeline(TimeSeriesSink(TimeSeriesStore('./history')), workers=4, maxsize=10000, batch_size=500)
+    pipeline.start()
+    # every alert topic, whatever the codec suffix
+    subscriber = setup("subscriber 26", pipeline=pipeline)
+    subscriber.run()
+    subscriber.myMqttClient.mySubscribe("/s289815/#")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        subscriber.end()
+        pipeline.stop()
@@ -0,0 +1,278 @@
+import json
+import struct
+
+
+############################################ SenML payload codecs ############################################
+# The codec travels as a topic suffix: "/s289815/temperature_alert/cbor" carries CBOR-SenML, while the
+# bare topic keeps carrying SenML+JSON so the existing subscribers are not affected.
+# Every codec encodes and decodes the same pack: {'bn': ..., 'bt': ..., 'e': [record, ...]}.
+
+class JsonCodec(object):
+    name = 'json'
+
+    def encode(self, pack):
+        return json.dumps(pack, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+    def decode(self, payload):
+        return json.loads(payload)
+
+
+############################################ CBOR-SenML (RFC 8428) ############################################
+# SenML labels are replaced by their integer CBOR labels and the base fields go in the first record.
+
+SENML_LABELS = {'bn': -2, 'bt': -3, 'bu': -4, 'bv': -5, 'n': 0, 'u': 1, 'v': 2, 'vs': 3, 'vb': 4,
+                's': 5, 't': 6, 'ut': 7, 'vd': 8}
+SENML_NAMES = {label: name for name, label in SENML_LABELS.items()}
+
+
+def _cbor_head(major, value):
+    if value < 24:
+        return bytes([(major << 5) | value])
+    if value < 0x100:
+        return bytes([(major << 5) | 24, value])
+    if value < 0x10000:
+        return bytes([(major << 5) | 25]) + struct.pack('>H', value)
+    if value < 0x100000000:
+        return bytes([(major << 5) | 26]) + struct.pack('>I', value)
+    return bytes([(major << 5) | 27]) + struct.pack('>Q', value)
+
+
+def cbor_dumps(obj):
+    out = bytearray()
+
+    def encode(item):
+        if item is None:
+            out.append(0xf6)
+        elif item is True:
+            out.append(0xf5)
+        elif item is False:
+            out.append(0xf4)
+        elif isinstance(item, int):
+            out.extend(_cbor_head(0, item) if item >= 0 else _cbor_head(1, -1 - item))
+        elif isinstance(item, float):
+            # float32 when it is exact, as the sensor values usually are
+            packed = struct.pack('>f', item)
+            if struct.unpack('>f', packed)[0] == item:
+                out.append(0xfa)
+                out.extend(packed)
+            else:
+                out.append(0xfb)
+                out.extend(struct.pack('>d', item))
+        elif isinstance(item, str):
+            data = item.encode('utf-8')
+            out.extend(_cbor_head(3, len(data)))
+            out.extend(data)
+        elif isinstance(item, (bytes, bytearray)):
+            out.extend(_cbor_head(2, len(item)))
+            out.extend(item)
+        elif isinstance(item, (list, tuple)):
+            out.extend(_cbor_head(4, len(item)))
+            for element in item:
+                encode(element)
+        elif isinstance(item, dict):
+            out.extend(_cbor_head(5, len(item)))
+            for key, value in item.items():
+                encode(key)
+                encode(value)
+        else:
+            raise TypeError(f'cannot encode {type(item).__name__} to CBOR')
+
+    encode(obj)
+    return bytes(out)
+
+
+def cbor_loads(data):
+    data = memoryview(data)
+
+    def read_length(info, pos):
+        if info < 24:
+            return info, pos
+        size = {24: 1, 25: 2, 26: 4, 27: 8}.get(info)
+        if size is None:
+            raise ValueError('indefinite lengths are not supported')
+        return int.from_bytes(data[pos:pos + size], 'big'), pos + size
+
+    def decode(pos):
+        initial = data[pos]
+        major, info = initial >> 5, initial & 0x1f
+        pos += 1
+        if major == 7:
+            if info == 20:
+                return False, pos
+            if info == 21:
+                return True, pos
+            if info == 22:
+                return None, pos
+            if info == 25:
+                return struct.unpack('>e', data[pos:pos + 2])[0], pos + 2
+            if info == 26:
+                return struct.unpack('>f', data[pos:pos + 4])[0], pos + 4
+            if info == 27:
+                return struct.unpack('>d', data[pos:pos + 8])[0], pos + 8
+            raise ValueError(f'unsupported simple value {info}')
+        value, pos = read_length(info, pos)
+        if major == 0:
+            return value, pos
+        if major == 1:
+            return -1 - value, pos
+        if major == 2:
+            return bytes(data[pos:pos + value]), pos + value
+        if major == 3:
+            return str(data[pos:pos + value], 'utf-8'), pos + value
+        if major == 4:
+            items = []
+            for _ in range(value):
+                item, pos = decode(pos)
+                items.append(item)
+            return items, pos
+        if major == 5:
+            items = {}
+            for _ in range(value):
+                key, pos = decode(pos)
+                items[key], pos = decode(pos)
+            return items, pos
+        raise ValueError(f'unsupported CBOR major type {major}')
+
+    # short buffers, unhashable keys and runaway nesting all surface as ValueError, like the other codecs
+    try:
+        obj, pos = decode(0)
+    except (IndexError, struct.error, TypeError, RecursionError) as error:
+        raise ValueError(f'malformed CBOR: {error}') from error
+    if pos != len(data):
+        raise ValueError('trailing bytes after the CBOR item')
+    return obj
+
+
+class CborCodec(object):
+    name = 'cbor'
+
+    def encode(self, pack):
+        records = []
+        for i, record in enumerate(pack['e']):
+            item = {SENML_LABELS[key]: value for key, value in record.items()}
+            if i == 0:
+                for base in ('bn', 'bt'):
+                    if base in pack:
+                        item[SENML_LABELS[base]] = pack[base]
+            records.append(item)
+        return cbor_dumps(records)
+
+    def decode(self, payload):
+        records = cbor_loads(payload)
+        pack = {'e': []}
+        try:
+            for record in records:
+                event = {}
+                for label, value in record.items():
+                    name = SENML_NAMES[label]
+                    if name in ('bn', 'bt'):
+                        pack[name] = value
+                    else:
+                        event[name] = value
+                pack['e'].append(event)
+        except KeyError as error:
+            raise ValueError(f'unknown SenML label {error}') from error
+        except (TypeError, AttributeError) as error:
+            raise ValueError(f'not a CBOR-SenML pack: {error}') from error
+        return pack
+
+
+############################################ Packed struct format ############################################
+# header: version, base time (uint32), base name (length prefixed), number of records (uint16)
+# record: name id, time offset (int32), value as float32 (or 0/1 for the boolean records)
+# The names (and their units) come from a fixed table shared by publishers and subscribers.
+# Version 1 payloads (one byte record count, int16 offsets) are still decoded.
+
+PACKED_VERSION = 2
+PACKED_NAMES = [
+    ('temperature_predicted', '°C'), ('temperature_actual', '°C'),
+    ('humidity_predicted', '%'), ('humidity_actual', '%'),
+    ('temperature_alert', None), ('humidity_alert', None),
+    ('temperature_suppressed', None), ('humidity_suppressed', None),
+]
+PACKED_IDS = {name: i for i, (name, _) in enumerate(PACKED_NAMES)}
+PACKED_BOOL = 0x80
+HEADER = struct.Struct('>BIB')
+# version -> (record count, record)
+PACKED_LAYOUTS = {1: (struct.Struct('>B'), struct.Struct('>Bhf')),
+                  2: (struct.Struct('>H'), struct.Struct('>Bif'))}
+COUNT, RECORD = PACKED_LAYOUTS[PACKED_VERSION]
+
+
+class PackedCodec(object):
+    name = 'packed'
+
+    def encode(self, pack):
+        base_name = pack.get('bn', '').encode('utf-8')
+        out = bytearray(HEADER.pack(PACKED_VERSION, int(pack.get('bt', 0)), len(base_name)))
+        out.extend(base_name)
+        if len(pack['e']) > 0xFFFF:
+            raise ValueError(f"{len(pack['e'])} records do not fit in one packed frame, split the pack")
+        out.extend(COUNT.pack(len(pack['e'])))
+        for record in pack['e']:
+            name_id = PACKED_IDS.get(record['n'])
+            if name_id is None:
+                raise ValueError(f"record name {record['n']} has no packed id")
+            if 'vb' in record:
+                out.extend(RECORD.pack(name_id | PACKED_BOOL, int(record.get('t', 0)), float(bool(record['vb']))))
+            else:
+                out.extend(RECORD.pack(name_id, int(record.get('t', 0)), float(record['v'])))
+        return bytes(out)
+
+    def decode(self, payload):
+        # a short buffer or an unknown name id is a malformed payload, reported as ValueError
+        try:
+            return self._decode(payload)
+        except (struct.error, IndexError) as error:
+            raise ValueError(f'malformed packed payload: {error}') from error
+
+    def _decode(self, payload):
+        version, base_time, name_length = HEADER.unpack_from(payload, 0)
+        if version not in PACKED_LAYOUTS:
+            raise ValueError(f'unsupported packed version {version}')
+        count_struct, record_struct = PACKED_LAYOUTS[version]
+        pos = HEADER.size
+        base_name = bytes(payload[pos:pos + name_length]).decode('utf-8')
+        pos += name_length
+        count, = count_struct.unpack_from(payload, pos)
+        pos += count_struct.size
+        records = []
+        for _ in range(count):
+            name_id, offset, value = record_struct.unpack_from(payload, pos)
+            pos += record_struct.size
+            name, unit = PACKED_NAMES[name_id & ~PACKED_BOOL]
+            record = {'n': name, 't': offset}
+            if name_id & PACKED_BOOL:
+                record['vb'] = bool(value)
+            else:
+                record['v'] = value
+                if unit is not None:
+                    record['u'] = unit
+            records.append(record)
+        return {'bn': base_name, 'bt': base_time, 'e': records}
+
+
+CODECS = {codec.name: codec for codec in (JsonCodec(), CborCodec(), PackedCodec())}
+DEFAULT_CODEC = 'json'
+
+
+def get_codec(name):
+    codec = CODECS.get(name)
+    if codec is None:
+        raise ValueError(f'unknown codec {name}, choose from {sorted(CODECS)}')
+    return codec
+
+
+def topic_for(topic, codec_name):
+    # the default codec keeps the bare topic
+    if codec_name == DEFAULT_CODEC:
+        return topic
+    return f'{topic}/{codec_name}'
+
+
+def split_topic(topic):
+    # returns the topic without the codec suffix and the codec to decode it with
+    base, _, suffix = topic.rpartition('/')
+    if base and suffix in CODECS:
+        return base, CODECS[suffix]
+    return topic, CODECS[DEFAULT_CODEC]
@@ -0,0 +1,212 @@
+import collections
+import os
+import re
+import threading
+
+import numpy as np
+
+
+############################################ Local time-series store ############################################
+# Append-only and columnar: every series is split in time segments of `segment_seconds`, and every
+# segment is a directory holding three memory-mapped files:
+#   t.f8    float64 timestamps (seconds)
+#   v.f4    float32 values
+#   n.i8    number of rows written so far
+# A segment is preallocated with `capacity` rows; when it is full the next rows go to a new part of the
+# same time segment. Nothing is ever rewritten, so readers can map the files while the writer appends.
+# Every open segment holds three mappings (and their file descriptors), so at most `max_open` segments
+# stay open for writing: the least recently written one is flushed and closed, and reopened on demand.
+
+SEGMENT_DIR = re.compile(r'^(\d+)-(\d+)$')
+
+
+def series_dir(name):
+    # series names like 'raspberrypi.local/temperature_actual' become safe directory names
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', name.replace('/', '__'))
+
+
+class Segment(object):
+    def __init__(self, path, capacity, create, readonly=False):
+        self.path = path
+        mode = 'w+' if create else ('r' if readonly else 'r+')
+        if create:
+            os.makedirs(path, exist_ok=True)
+        self.count = np.memmap(os.path.join(path, 'n.i8'), dtype=np.int64, mode=mode, shape=(1,))
+        if not create:
+            capacity = os.path.getsize(os.path.join(path, 't.f8')) // 8
+        self.capacity = capacity
+        self.t = np.memmap(os.path.join(path, 't.f8'), dtype=np.float64, mode=mode, shape=(capacity,))
+        self.v = np.memmap(os.path.join(path, 'v.f4'), dtype=np.float32, mode=mode, shape=(capacity,))
+
+    @property
+    def size(self):
+        return int(self.count[0])
+
+    def free(self):
+        return self.capacity - self.size
+
+    def append(self, t, v):
+        n = self.size
+        k = len(t)
+        self.t[n:n + k] = t
+        self.v[n:n + k] = v
+        self.count[0] = n + k            # published last: readers never see a half written row
+
+    def rows(self):
+        n = self.size
+        return self.t[:n], self.v[:n]
+
+    def flush(self):
+        for column in (self.t, self.v, self.count):
+            column.flush()
+
+    def close(self):
+        # dropping the last references unmaps the files and releases their descriptors
+        self.flush()
+        self.t = self.v = self.count = None
+
+
+class TimeSeriesStore(object):
+    def __init__(self, root, segment_seconds=3600, capacity=4096, max_open=256):
+        self.root = root
+        self.segment_seconds = segment_seconds
+        self.capacity = capacity
+        self.max_open = max_open
+        self._writers = collections.OrderedDict()          # (series, segment start) -> open Segment, LRU order
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    ##################### writing ####################
+    def _parts(self, series, start):
+        directory = os.path.join(self.root, series_dir(series))
+        if not os.path.isdir(directory):
+            return []
+        parts = []
+        for entry in os.listdir(directory):
+            match = SEGMENT_DIR.match(entry)
+            if match and int(match.group(1)) == start:
+                parts.append(int(match.group(2)))
+        return sorted(parts)
+
+    def _writer(self, series, start):
+        key = (series, start)
+        segment = self._writers.get(key)
+        if segment is not None and segment.free() > 0:
+            self._writers.move_to_end(key)
+            return segment
+        parts = self._parts(series, start)
+        if segment is None and parts:
+            segment = Segment(self._path(series, start, parts[-1]), self.capacity, create=False)
+        if segment is None or segment.free() == 0:
+            part = parts[-1] + 1 if parts else 0
+            segment = Segment(self._path(series, start, part), self.capacity, create=True)
+        # keep only the current segment of each series open for writing
+        for old in [k for k in self._writers if k[0] == series and k != key]:
+            self._writers.pop(old).close()
+        if key in self._writers and self._writers[key] is not segment:
+            self._writers[key].close()
+        self._writers[key] = segment
+        self._writers.move_to_end(key)
+        while len(self._writers) > self.max_open:
+            _, lru = self._writers.popitem(last=False)
+            lru.close()
+            self.evictions += 1
+        return segment
+
+    def _path(self, series, start, part):
+        directory = os.path.join(self.root, series_dir(series))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+            # the original name, since the directory name is sanitized
+            with open(os.path.join(directory, 'name'), 'w') as f:
+                f.write(series)
+        return os.path.join(directory, f'{start}-{part}')
+
+    def append(self, series, t, value):
+        self.append_many(series, [t], [value])
+
+    def append_many(self, series, times, values):
+        times = np.asarray(times, dtype=np.float64)
+        values = np.asarray(values, dtype=np.float32)
+        if times.shape != values.shape:
+            raise ValueError('times and values must have the same length')
+        with self._lock:
+            starts = np.floor(times / self.segment_seconds).astype(np.int64) * self.segment_seconds
+            for start in np.unique(starts):
+                mask = starts == start
+                seg_times, seg_values = times[mask], values[mask]
+                while len(seg_times):
+                    segment = self._writer(series, int(start))
+                    k = min(segment.free(), len(seg_times))
+                    segment.append(seg_times[:k], seg_values[:k])
+                    seg_times, seg_values = seg_times[k:], seg_values[k:]
+
+    def flush(self):
+        with self._lock:
+            for segment in self._writers.values():
+                segment.flush()
+
+    def close(self):
+        with self._lock:
+            for segment in self._writers.values():
+                segment.close()
+            self._writers.clear()
+
+    ##################### reading ####################
+    def series(self):
+        names = []
+        for entry in os.listdir(self.root):
+            path = os.path.join(self.root, entry, 'name')
+            if os.path.exists(path):
+                with open(path) as f:
+                    names.append(f.read())
+        return sorted(names)
+
+    def query(self, series, start=None, end=None):
+        # rows with start <= t < end, sorted by time
+        directory = os.path.join(self.root, series_dir(series))
+        if not os.path.isdir(directory):
+            return np.zeros(0, dtype=np.float64), np.zeros(0, dtype=np.float32)
+        times, values = [], []
+        for entry in sorted(os.listdir(directory)):
+            match = SEGMENT_DIR.match(entry)
+            if match is None:
+                continue
+            seg_start = int(match.group(1))
+            if start is not None and seg_start + self.segment_seconds <= start:
+                continue
+            if end is not None and seg_start >= end:
+                continue
+            with self._lock:
+                segment = self._writers.get((series, seg_start))
+                if segment is None or segment.path != os.path.join(directory, entry):
+                    segment = Segment(os.path.join(directory, entry), self.capacity, create=False, readonly=True)
+                t, v = segment.rows()
+                mask = np.ones(len(t), dtype=bool)
+                if start is not None:
+                    mask &= t >= start
+                if end is not None:
+                    mask &= t < end
+                times.append(np.array(t[mask]))
+                values.append(np.array(v[mask]))
+        if not times:
+            return np.zeros(0, dtype=np.float64), np.zeros(0, dtype=np.float32)
+        times = np.concatenate(times)
+        values = np.concatenate(values)
+        order = np.argsort(times, kind='stable')
+        return times[order], values[order]
+
+    def downsample(self, series, start=None, end=None, bucket=60):
+        # min / mean / max / count per `bucket` seconds, e.g. 1-minute aggregates with bucket=60
+        times, values = self.query(series, start, end)
+        if len(times) == 0:
+            return []
+        buckets = (np.floor(times / bucket) * bucket).astype(np.int64)
+        bucket_starts, first = np.unique(buckets, return_index=True)
+        counts = np.diff(np.append(first, len(values)))
+        mins = np.minimum.reduceat(values, first)
+        maxs = np.maximum.reduceat(values, first)
+        sums = np.add.reduceat(values.astype(np.float64), first)
+        return [{'t': int(b), 'min': float(lo), 'mean': float(s / c), 'max': float(hi), 'count': int(c)}
+                for b, lo, hi, s, c in zip(bucket_starts, mins, maxs, sums, counts)]
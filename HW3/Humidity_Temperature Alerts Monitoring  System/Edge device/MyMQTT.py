@@ -24,11 +24,14 @@ class MyMQTT:
         # A new message is received
         self.notifier.notify (msg.topic, msg.payload)
 
-    def myPublish (self, topic, msg):
+    def myPublish (self, topic, msg, qos=2, verbose=False):
         # if needed, you can do some computation or error-check before publishing
-        print ("publishing '%s' with topic '%s'" % (msg, topic))
+        if verbose:
+            print ("publishing '%s' with topic '%s'" % (msg, topic))
+        else:
+            print ("publishing %d bytes with topic '%s' (qos %d)" % (len(msg), topic, qos))
         # publish a message with a certain topic
-        self._paho_mqtt.publish(topic, msg, 2)
+        self._paho_mqtt.publish(topic, msg, qos)
 
     def mySubscribe (self, topic):
         # if needed, you can do some computation or error-check before subscribing
@@ -0,0 +1,165 @@
+import collections
+import threading
+import time
+
+
+############################################ N-of-M debouncer with hysteresis ############################################
+# The alert raises when at least n of the last m errors are above the threshold, and it only clears
+# when fewer than n of the last m errors are above the lower threshold (threshold * hysteresis),
+# so a noisy error hovering around the threshold does not flap.
+
+class Debouncer(object):
+    def __init__(self, n=3, m=5, hysteresis=0.8):
+        if not 1 <= n <= m:
+            raise ValueError('n must be between 1 and m')
+        self.n = n
+        self.m = m
+        self.hysteresis = hysteresis
+        self.history = collections.deque(maxlen=m)
+        self.active = False
+
+    def update(self, error, threshold):
+        limit = threshold * self.hysteresis if self.active else threshold
+        self.history.append(error > limit)
+        above = sum(self.history)
+        changed = False
+        if not self.active and above >= self.n:
+            self.active = changed = True
+        elif self.active and above < self.n:
+            self.active = False
+            changed = True
+        return self.active, changed
+
+
+############################################ Alert aggregator ############################################
+# Every tick goes through observe(); only debounced alerts are kept, at most one per key every
+# `min_interval` seconds (the suppressed ones are counted in the next record), and all the events of a
+# topic are sent as a single SenML pack every `flush_interval` seconds. A pack that fails to publish is
+# put back and retried on the next flush; at most `max_pending` events are kept per topic meanwhile.
+
+class AlertAggregator(object):
+    def __init__(self, publisher, n=3, m=5, hysteresis=0.8, min_interval=5.0, flush_interval=10.0,
+                 qos=None, default_qos=2, base_name='raspberrypi.local', max_pending=1000):
+        self.publisher = publisher
+        self.n = n
+        self.m = m
+        self.hysteresis = hysteresis
+        self.min_interval = min_interval
+        self.flush_interval = flush_interval
+        self.qos = dict(qos or {})
+        self.default_qos = default_qos
+        self.base_name = base_name
+        self.max_pending = max_pending
+
+        self._debouncers = {}
+        self._last_sent = {}
+        self._suppressed = collections.Counter()
+        self._pending = collections.defaultdict(list)
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+        self.observed = 0
+        self.raised = 0
+        self.rate_limited = 0
+        self.packs = 0
+        self.failures = 0
+        self.dropped = 0
+
+    def observe(self, key, topic, quantity, unit, predicted, actual, threshold, timestamp):
+        # returns True when an alert record was queued for this tick
+        error = abs(float(predicted) - float(actual))
+        with self._lock:
+            self.observed += 1
+            debouncer = self._debouncers.get(key)
+            if debouncer is None:
+                debouncer = self._debouncers[key] = Debouncer(self.n, self.m, self.hysteresis)
+            active, changed = debouncer.update(error, threshold)
+
+            if changed and not active:
+                # tell the subscribers that the condition is over
+                self._pending[topic].append((timestamp, [{'n': f'{quantity}_alert', 'vb': False}]))
+                self._last_sent.pop(key, None)
+                return False
+            if not active:
+                return False
+
+            now = time.monotonic()
+            last = self._last_sent.get(key)
+            if last is not None and now - last < self.min_interval:
+                self.rate_limited += 1
+                self._suppressed[key] += 1
+                return False
+            self._last_sent[key] = now
+
+            records = [{'n': f'{quantity}_predicted', 'u': unit, 'v': float(predicted)},
+                       {'n': f'{quantity}_actual', 'u': unit, 'v': float(actual)}]
+            suppressed = self._suppressed.pop(key, 0)
+            if suppressed:
+                records.append({'n': f'{quantity}_suppressed', 'v': suppressed})
+            self._pending[topic].append((timestamp, records))
+            self.raised += 1
+            return True
+
+    def pack(self, events):
+        # one SenML pack: base time is the first event, every record carries its offset
+        base_time = events[0][0]
+        records = []
+        for timestamp, event_records in events:
+            for record in event_records:
+                record = dict(record)
+                record['t'] = timestamp - base_time
+                records.append(record)
+        return {'bn': self.base_name, 'bt': base_time, 'e': records}
+
+    def flush(self):
+        with self._lock:
+            pending = self._pending
+            self._pending = collections.defaultdict(list)
+        for topic, events in pending.items():
+            if not events:
+                continue
+            try:
+                self.publisher.publish_pack(topic, self.pack(events), self.qos.get(topic, self.default_qos))
+                self.packs += 1
+            except Exception as error:
+                print(f"alert pack for {topic} not published ({error!r}), retrying on the next flush")
+                self.failures += 1
+                self._requeue(topic, events)
+
+    def _requeue(self, topic, events):
+        # the unsent events go before the ones queued meanwhile; the oldest are dropped past max_pending
+        with self._lock:
+            events = events + self._pending[topic]
+            if len(events) > self.max_pending:
+                self.dropped += len(events) - self.max_pending
+                events = events[-self.max_pending:]
+            self._pending[topic] = events
+
+    def _run(self):
+        while not self._stop_event.wait(self.flush_interval):
+            self.flush()
+        self.flush()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='alert-flusher', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def forget(self, key_prefix):
+        # drop the state of a stopped job
+        with self._lock:
+            for key in [k for k in self._debouncers if k[0] == key_prefix]:
+                self._debouncers.pop(key, None)
+                self._last_sent.pop(key, None)
+                self._suppressed.pop(key, None)
+
+    def stats(self):
+        return {'observed': self.observed, 'raised': self.raised, 'rate_limited': self.rate_limited,
+                'packs': self.packs, 'failures': self.failures, 'dropped': self.dropped}
@@ -0,0 +1,182 @@
+import asyncio
+import inspect
+import json
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+import cherrypy
+
+
+############################################ asyncio serving mode ############################################
+# Serves the same exposed handler classes that are mounted on CherryPy (GET/POST/PUT/DELETE methods
+# with *path and **query). Connections are handled by one asyncio loop, so idle or slow clients do not
+# hold a thread; only the handler call itself (decoding, preprocessing, inference) runs in a bounded
+# executor. Inside the executor the handler finds a cherrypy.request / cherrypy.response pair as usual,
+# so `cherrypy.request.body.read()`, `cherrypy.request.headers` and `cherrypy.HTTPError` keep working.
+
+REASONS = {200: 'OK', 304: 'Not Modified', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           409: 'Conflict', 411: 'Length Required', 413: 'Payload Too Large', 500: 'Internal Server Error',
+           503: 'Service Unavailable'}
+
+
+class Headers(dict):
+    # case-insensitive header map
+    def __setitem__(self, key, value):
+        super().__setitem__(key.lower(), value)
+
+    def __getitem__(self, key):
+        return super().__getitem__(key.lower())
+
+    def __contains__(self, key):
+        return super().__contains__(key.lower())
+
+    def get(self, key, default=None):
+        return super().get(key.lower(), default)
+
+
+class Body(object):
+    def __init__(self, data):
+        self._data = data
+        self._pos = 0
+
+    def read(self, size=None):
+        if size is None or size < 0:
+            size = len(self._data) - self._pos
+        chunk = self._data[self._pos:self._pos + size]
+        self._pos += len(chunk)
+        return chunk
+
+
+class Request(object):
+    def __init__(self, method, path, headers, body):
+        self.method = method
+        self.path_info = path
+        self.headers = headers
+        self.body = Body(body)
+
+
+class Response(object):
+    def __init__(self):
+        self.status = 200
+        self.headers = Headers()
+
+
+def status_code(status):
+    if isinstance(status, int):
+        return status
+    return int(str(status).split()[0])
+
+
+class AsyncServer(object):
+    def __init__(self, routes, host='0.0.0.0', port=8080, workers=4, max_body=100 * 1024 * 1024, on_ready=None):
+        # routes: mount point -> handler object, as passed to cherrypy.tree.mount
+        # on_ready: called once the socket is listening
+        self.routes = sorted(routes.items(), key=lambda item: len(item[0]), reverse=True)
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.max_body = max_body
+        self.on_ready = on_ready
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='handler')
+
+    def resolve(self, path):
+        for mount, handler in self.routes:
+            mount = mount.rstrip('/')
+            if path == mount or path.startswith(mount + '/') or mount == '':
+                rest = path[len(mount):].strip('/')
+                return handler, [unquote(part) for part in rest.split('/') if part]
+        return None, None
+
+    def call(self, handler, method, path, query, request):
+        # runs in the executor thread
+        response = Response()
+        cherrypy.serving.load(request, response)
+        try:
+            function = getattr(handler, method, None)
+            if function is None:
+                return 405, response.headers, b'method not allowed'
+            # arguments the handler does not take are a 404, as the CherryPy dispatcher answers
+            try:
+                inspect.signature(function).bind(*path, **query)
+            except TypeError:
+                return 404, response.headers, b'not found'
+            result = function(*path, **query)
+            if result is None:
+                result = b''
+            elif isinstance(result, str):
+                result = result.encode('utf-8')
+            return status_code(response.status), response.headers, result
+        except cherrypy.HTTPError as error:
+            # args is (status, message), the reason phrase stands in for a missing message
+            message = json.dumps({'status': error.status, 'message': error.args[1] or error.reason})
+            return error.code, response.headers, message.encode('utf-8')
+        except Exception:
+            traceback.print_exc()
+            return 500, response.headers, b'internal server error'
+
+    async def handle(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, version = request_line.decode('latin-1').split()
+                headers = Headers()
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip()] = value.strip()
+                # chunked request bodies are not decoded: ask for a Content-Length and drop the connection
+                if headers.get('Transfer-Encoding', '').lower() not in ('', 'identity'):
+                    await self.write(writer, 411, Headers(), b'length required', False)
+                    break
+                length = int(headers.get('Content-Length', 0))
+                if length > self.max_body:
+                    await self.write(writer, 413, Headers(), b'payload too large', False)
+                    break
+                body = await reader.readexactly(length) if length else b''
+
+                url = urlsplit(target)
+                query = dict(parse_qsl(url.query))
+                handler, path = self.resolve(url.path)
+                keep_alive = headers.get('Connection', '').lower() != 'close' and version == 'HTTP/1.1'
+                if handler is None:
+                    await self.write(writer, 404, Headers(), b'not found', keep_alive)
+                else:
+                    request = Request(method, url.path, headers, body)
+                    status, response_headers, payload = await loop.run_in_executor(
+                        self.executor, self.call, handler, method, path, query, request)
+                    await self.write(writer, status, response_headers, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def write(self, writer, status, headers, payload, keep_alive):
+        head = [f'HTTP/1.1 {status} {REASONS.get(status, "")}']
+        headers.setdefault('content-type', 'text/html;charset=utf-8')
+        headers['content-length'] = str(len(payload))
+        headers['connection'] = 'keep-alive' if keep_alive else 'close'
+        head.extend(f'{name}: {value}' for name, value in headers.items())
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + payload)
+        await writer.drain()
+
+    async def serve(self):
+        server = await asyncio.start_server(self.handle, self.host, self.port)
+        print(f"async server listening on {self.host}:{self.port} with {self.workers} workers")
+        if self.on_ready is not None:
+            self.on_ready()
+        async with server:
+            await server.serve_forever()
+
+    def run(self):
+        try:
+            asyncio.run(self.serve())
+        finally:
+            self.executor.shutdown(wait=False)
@@ -0,0 +1,45 @@
+import argparse
+import timeit
+
+from senml_codec import CODECS
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--repeat', type=int, default=5, help='timing repetitions, the best one is reported')
+parser.add_argument('--number', type=int, default=2000, help='encode/decode calls per repetition')
+args = parser.parse_args()
+
+
+############################################ Typical alert packs ############################################
+
+def alert_pack(events, step=1):
+    # `events` debounced temperature alerts in one pack, as flushed by the AlertAggregator
+    records = []
+    for i in range(events):
+        records.append({'n': 'temperature_predicted', 'u': '°C', 'v': 21.5 + 0.1 * i, 't': i * step})
+        records.append({'n': 'temperature_actual', 'u': '°C', 'v': 22.0 + 0.1 * i, 't': i * step})
+    return {'bn': 'raspberrypi.local', 'bt': 1650000000, 'e': records}
+
+
+# the last pack has more than 255 records and time offsets past the int16 range (a long batch)
+PACKS = {'single alert': alert_pack(1), '10 alerts': alert_pack(10), '60 alerts': alert_pack(60),
+         '300 alerts': alert_pack(300, step=120)}
+
+
+def best_us(stmt):
+    return min(timeit.repeat(stmt, repeat=args.repeat, number=args.number)) / args.number * 1e6
+
+
+print(f"{'pack':<14}{'codec':<8}{'bytes':>8}{'vs json':>9}{'encode us':>11}{'decode us':>11}")
+for pack_name, pack in PACKS.items():
+    json_size = len(CODECS['json'].encode(pack))
+    for codec_name, codec in CODECS.items():
+        payload = codec.encode(pack)
+        decoded = codec.decode(payload)
+        assert decoded['bt'] == pack['bt']
+        assert len(decoded['e']) == len(pack['e'])
+        assert [record['t'] for record in decoded['e']] == [record['t'] for record in pack['e']]
+        encode = best_us(lambda: codec.encode(pack))
+        decode = best_us(lambda: codec.decode(payload))
+        print(f"{pack_name:<14}{codec_name:<8}{len(payload):>8}{len(payload) / json_size:>9.2f}"
+              f"{encode:>11.1f}{decode:>11.1f}")
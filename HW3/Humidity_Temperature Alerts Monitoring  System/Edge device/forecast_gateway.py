@@ -0,0 +1,322 @@
+import argparse
+import threading
+import time
+
+import numpy as np
+
+from alert_aggregator import AlertAggregator
+from model_cache import MODEL_CACHE
+from senml_codec import get_codec, split_topic, topic_for
+from sliding_window import MEAN, STD
+
+
+READINGS = '/s289815/gateway/+/reading/#'           # '/s289815/gateway/<device>/reading[/<codec>]'
+ALERTS = '/s289815/gateway/{}/{}_alert'             # device, quantity
+
+
+############################################ Per-device window store ############################################
+# One record per device in a structured array (array of structs): the doubled ring window of
+# normalized readings (as in RingWindow, the last `width` samples are window[pos:pos + width]), the
+# forecast of its next reading and the flags the batcher needs. Devices get a row the first time they
+# report; the array doubles when it is full, so the per-reading cost does not depend on the device count.
+
+def record_dtype(width, channels=2):
+    return np.dtype([('window', np.float32, (2 * width, channels)),
+                     ('pos', np.int32), ('count', np.int32), ('seq', np.int64),
+                     ('last_t', np.float64),
+                     ('forecast', np.float32, (channels,)), ('has_forecast', np.bool_),
+                     ('due', np.bool_)])
+
+
+class DeviceStore(object):
+    def __init__(self, width=6, channels=2, capacity=1024, mean=MEAN, std=STD):
+        self.width = width
+        self.channels = channels
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.inv_std = (1.0 / np.asarray(std, dtype=np.float32)).astype(np.float32)
+        self.records = np.zeros(capacity, dtype=record_dtype(width, channels))
+        self.index = {}                 # device id -> row
+        self.devices = []               # row -> device id
+        self._offsets = np.arange(width)
+
+    def row(self, device):
+        row = self.index.get(device)
+        if row is None:
+            row = len(self.devices)
+            if row == len(self.records):
+                grown = np.zeros(2 * len(self.records), dtype=self.records.dtype)
+                grown[:row] = self.records
+                self.records = grown
+            self.index[device] = row
+            self.devices.append(device)
+        return row
+
+    def push(self, row, timestamp, reading):
+        record = self.records[row]
+        value = (np.asarray(reading, dtype=np.float32) - self.mean) * self.inv_std
+        pos = int(record['pos'])
+        record['window'][pos] = value
+        record['window'][pos + self.width] = value
+        record['pos'] = (pos + 1) % self.width
+        record['count'] = min(int(record['count']) + 1, self.width)
+        record['seq'] += 1
+        record['last_t'] = timestamp
+        record['due'] = record['count'] == self.width
+
+    def windows(self, rows):
+        # [len(rows), width, channels] batch, oldest sample first (one gather for the whole batch)
+        records = self.records
+        index = records['pos'][rows][:, None] + self._offsets
+        return records['window'][rows[:, None], index]
+
+    def __len__(self):
+        return len(self.devices)
+
+
+############################################ Batched forecaster ############################################
+# The TF lite models are exported with a [1, 6, 2] input. The input is resized to power-of-two batch
+# sizes (one interpreter per size, all backed by the same cached model buffer) and the due windows are
+# padded up to the next size, so a tick costs a handful of invokes whatever the number of devices. A
+# model whose graph cannot be resized (e.g. a reshape with a constant batch of 1) falls back to one
+# invoke per device.
+
+class BatchedForecaster(object):
+    def __init__(self, model_path, width=6, channels=2, max_batch=256):
+        self.model_path = model_path
+        self.width = width
+        self.channels = channels
+        self.max_batch = max_batch
+        self._interpreters = {}
+        self.batched = self._interpreter(2) is not None
+
+    def _interpreter(self, size):
+        if size in self._interpreters:
+            return self._interpreters[size]
+        interpreter = MODEL_CACHE.interpreter(self.model_path)
+        input_index = interpreter.get_input_details()[0]['index']
+        output_index = interpreter.get_output_details()[0]['index']
+        if size != 1:
+            try:
+                interpreter.resize_tensor_input(input_index, [size, self.width, self.channels])
+                interpreter.allocate_tensors()
+                interpreter.set_tensor(input_index, np.zeros([size, self.width, self.channels], dtype=np.float32))
+                interpreter.invoke()
+                if interpreter.get_tensor(output_index).shape[0] != size:
+                    return None
+            except (RuntimeError, ValueError):
+                return None
+        self._interpreters[size] = (interpreter, input_index, output_index)
+        return self._interpreters[size]
+
+    def _invoke(self, batch, size):
+        interpreter, input_index, output_index = self._interpreter(size)
+        interpreter.set_tensor(input_index, batch)
+        interpreter.invoke()
+        # [size, 2] or [size, steps, 2]: the next step is row 0 (also for the multi-horizon models)
+        return interpreter.get_tensor(output_index).reshape(size, -1, self.channels)[:, 0]
+
+    def predict(self, windows):
+        count = len(windows)
+        forecasts = np.empty([count, self.channels], dtype=np.float32)
+        if not self.batched:
+            for i in range(count):
+                forecasts[i] = self._invoke(windows[i:i + 1], 1)[0]
+            return forecasts
+        for start in range(0, count, self.max_batch):
+            chunk = windows[start:start + self.max_batch]
+            size = 2
+            while size < len(chunk):
+                size *= 2
+            batch = np.zeros([size, self.width, self.channels], dtype=np.float32)
+            batch[:len(chunk)] = chunk
+            forecasts[start:start + len(chunk)] = self._invoke(batch, size)[:len(chunk)]
+        return forecasts
+
+
+############################################ Gateway ############################################
+
+class GatewayPublisher(object):
+    # AlertAggregator publisher on top of any client with publish(topic, payload, qos)
+    def __init__(self, client, codec='json'):
+        self.client = client
+        self.codec = get_codec(codec)
+
+    def publish_pack(self, topic, pack, qos=2):
+        self.client.publish(topic_for(topic, self.codec.name), self.codec.encode(pack), qos)
+
+
+class ForecastGateway(object):
+    def __init__(self, client, model_name, tthres, hthres, aggregator, width=6, interval=0.1, max_batch=256):
+        self.client = client
+        self.model_name = model_name
+        self.tthres = tthres
+        self.hthres = hthres
+        self.aggregator = aggregator
+        self.interval = interval
+        self.store = DeviceStore(width)
+        self.forecaster = BatchedForecaster('./models/{}.tflite'.format(model_name), width, max_batch=max_batch)
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+        self.readings = 0
+        self.dropped = 0
+        self.batches = 0
+        self.predictions = 0
+        self.batch_ms = 0.0
+
+    def on_message(self, topic, payload):
+        topic, codec = split_topic(topic)
+        try:
+            device = topic.split('/')[3]
+            # the codecs raise ValueError on malformed payloads, the rest covers packs of the wrong shape
+            pack = codec.decode(payload)
+            values = {record['n']: (pack.get('bt', 0) + record.get('t', 0), record['v']) for record in pack['e']}
+            timestamp, temperature = values['temperature']
+            _, humidity = values['humidity']
+        except (ValueError, KeyError, TypeError, AttributeError, IndexError):
+            self.dropped += 1
+            return
+        self.ingest(device, timestamp, temperature, humidity)
+
+    def ingest(self, device, timestamp, temperature, humidity):
+        with self._lock:
+            row = self.store.row(device)
+            record = self.store.records[row]
+            forecast = record['forecast'].copy() if record['has_forecast'] else None
+            record['has_forecast'] = False
+            self.store.push(row, timestamp, (temperature, humidity))
+            self.readings += 1
+        if forecast is not None:
+            # the forecast made from the previous window against the reading that just arrived
+            self.aggregator.observe((device, 'temperature'), ALERTS.format(device, 'temperature'), 'temperature',
+                                    '°C', forecast[0], temperature, self.tthres, timestamp)
+            self.aggregator.observe((device, 'humidity'), ALERTS.format(device, 'humidity'), 'humidity',
+                                    '%', forecast[1], humidity, self.hthres, timestamp)
+
+    def tick(self):
+        # one batched invoke for every device that received a reading since the last tick
+        with self._lock:
+            records = self.store.records
+            rows = np.flatnonzero(records['due'][:len(self.store)])
+            if len(rows) == 0:
+                return 0
+            windows = self.store.windows(rows)
+            seqs = records['seq'][rows].copy()
+            records['due'][rows] = False
+        start = time.perf_counter()
+        forecasts = self.forecaster.predict(windows)
+        self.batch_ms += (time.perf_counter() - start) * 1e3
+        with self._lock:
+            records = self.store.records
+            # a device that reported again in the meantime is due again: its stale forecast is dropped
+            fresh = records['seq'][rows] == seqs
+            records['forecast'][rows[fresh]] = forecasts[fresh]
+            records['has_forecast'][rows[fresh]] = True
+        self.batches += 1
+        self.predictions += len(rows)
+        return len(rows)
+
+    def _run(self):
+        next_tick = time.monotonic()
+        while not self._stop_event.is_set():
+            try:
+                self.tick()
+            except Exception as error:
+                print(f"gateway tick failed: {error!r}")
+            next_tick += self.interval
+            self._stop_event.wait(max(0.0, next_tick - time.monotonic()))
+
+    def start(self):
+        self.client.start()
+        self.client.subscribe(READINGS, self.on_message, qos=0)
+        self.aggregator.start()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='forecast-gateway', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.client.unsubscribe(READINGS, self.on_message)
+        self.aggregator.stop()
+        self.client.stop()
+
+    def stats(self):
+        return {'devices': len(self.store), 'readings': self.readings, 'dropped': self.dropped,
+                'batches': self.batches, 'predictions': self.predictions, 'batched': self.forecaster.batched,
+                'mean_batch': self.predictions / self.batches if self.batches else 0.0,
+                'mean_batch_ms': self.batch_ms / self.batches if self.batches else 0.0,
+                'alerts': self.aggregator.stats()}
+
+
+############################################ Simulated devices ############################################
+
+def simulate(client, devices, rate, duration, codec='json'):
+    # `devices` sensors publishing a SenML reading `rate` times per second each, for `duration` seconds
+    codec = get_codec(codec)
+    rng = np.random.default_rng(42)
+    base = rng.normal([20.0, 60.0], [3.0, 10.0], size=(devices, 2))
+    topics = [topic_for(f'/s289815/gateway/dev{i:05d}/reading', codec.name) for i in range(devices)]
+    period = 1.0 / rate
+    next_round = time.monotonic()
+    end = next_round + duration
+    sent = 0
+    while time.monotonic() < end:
+        now = time.time()
+        drift = rng.normal(0.0, 0.2, size=(devices, 2))
+        base += drift
+        for i in range(devices):
+            pack = {'bn': f'dev{i:05d}', 'bt': now,
+                    'e': [{'n': 'temperature', 'u': 'Cel', 't': 0, 'v': float(base[i, 0])},
+                          {'n': 'humidity', 'u': '%RH', 't': 0, 'v': float(base[i, 1])}]}
+            client.publish(topics[i], codec.encode(pack), 0)
+            sent += 1
+        next_round += period
+        time.sleep(max(0.0, next_round - time.monotonic()))
+    return sent
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', type=str, default='cnn', help='forecaster in ./models')
+    parser.add_argument('--tthres', type=float, default=0.5)
+    parser.add_argument('--hthres', type=float, default=2.0)
+    parser.add_argument('--interval', type=float, default=0.1, help='seconds between batched invokes')
+    parser.add_argument('--max_batch', type=int, default=256)
+    parser.add_argument('--codec', type=str, default='json')
+    parser.add_argument('--local', action='store_true', help='in-process broker with simulated devices')
+    parser.add_argument('--devices', type=int, default=1000, help='simulated devices (--local)')
+    parser.add_argument('--rate', type=float, default=1.0, help='readings per second per simulated device')
+    parser.add_argument('--duration', type=float, default=30.0, help='simulation length in seconds')
+    args = parser.parse_args()
+
+    if args.local:
+        from local_broker import LocalBroker
+        client = LocalBroker()
+    else:
+        from mqtt_manager import MQTTManager
+        client = MQTTManager.shared()
+
+    aggregator = AlertAggregator(GatewayPublisher(client, args.codec))
+    gateway = ForecastGateway(client, args.model, args.tthres, args.hthres, aggregator,
+                              interval=args.interval, max_batch=args.max_batch)
+    gateway.start()
+    try:
+        if args.local:
+            start = time.process_time()
+            sent = simulate(client, args.devices, args.rate, args.duration, args.codec)
+            cpu = time.process_time() - start
+            print(f"{sent} readings from {args.devices} devices in {args.duration:.0f} s, "
+                  f"{cpu / args.duration * 100:.1f}% of one core")
+            print(gateway.stats())
+        else:
+            while True:
+                time.sleep(10)
+                print(gateway.stats())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        gateway.stop()
@@ -0,0 +1,60 @@
+import collections
+import threading
+
+
+############################################ In-process broker stand-in ############################################
+# Same publish/subscribe interface as MQTTManager, without a network: a publish is delivered to the
+# matching handlers on the publisher's thread. Used to run and load-test the gateway on one machine.
+
+def topic_matches(topic_filter, topic):
+    filter_levels = topic_filter.split('/')
+    topic_levels = topic.split('/')
+    for i, level in enumerate(filter_levels):
+        if level == '#':
+            return True
+        if i >= len(topic_levels) or (level != '+' and level != topic_levels[i]):
+            return False
+    return len(filter_levels) == len(topic_levels)
+
+
+class LocalBroker(object):
+    def __init__(self):
+        self._handlers = collections.defaultdict(list)
+        self._lock = threading.Lock()
+        self.published = 0
+        self.delivered = 0
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def publish(self, topic, payload, qos=2):
+        with self._lock:
+            handlers = [handler for topic_filter, filter_handlers in self._handlers.items()
+                        if topic_matches(topic_filter, topic) for handler in filter_handlers]
+            self.published += 1
+            self.delivered += len(handlers)
+        for handler in handlers:
+            try:
+                handler(topic, payload)
+            except Exception as error:
+                print ("handler failed on topic '%s': %r" % (topic, error))
+        return True
+
+    def subscribe(self, topic, handler, qos=2):
+        with self._lock:
+            self._handlers[topic].append(handler)
+
+    def unsubscribe(self, topic, handler):
+        with self._lock:
+            handlers = self._handlers.get(topic, [])
+            if handler in handlers:
+                handlers.remove(handler)
+            if not handlers:
+                self._handlers.pop(topic, None)
+
+    def stats(self):
+        with self._lock:
+            return {'published': self.published, 'delivered': self.delivered, 'subscriptions': sorted(self._handlers)}
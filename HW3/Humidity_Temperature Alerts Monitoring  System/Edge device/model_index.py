@@ -0,0 +1,126 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from model_cache import MODEL_CACHE
+
+
+############################################ Model registry index ############################################
+# In-memory description of every model in ./models: size, hash, input/output tensors (shape, dtype,
+# quantization) and a measured invoke latency. It is refreshed by /add (through model_store listeners)
+# and by a watcher thread that polls the directory, so /list is answered from memory with an ETag.
+
+def tensor_details(details):
+    scale, zero_point = details['quantization']
+    return {'name': details['name'], 'shape': [int(d) for d in details['shape']],
+            'dtype': np.dtype(details['dtype']).name,
+            'quantization': {'scale': float(scale), 'zero_point': int(zero_point)}}
+
+
+def measure_latency(interpreter, runs=20):
+    # median invoke time in ms on an all-zero input
+    for details in interpreter.get_input_details():
+        interpreter.set_tensor(details['index'], np.zeros(details['shape'], dtype=details['dtype']))
+    interpreter.invoke()             # warm-up
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        interpreter.invoke()
+        times.append((time.perf_counter() - start) * 1e3)
+    return float(np.median(times))
+
+
+class ModelIndex(object):
+    def __init__(self, models_dir='./models', poll_interval=5.0, latency_runs=20):
+        self.models_dir = models_dir
+        self.poll_interval = poll_interval
+        self.latency_runs = latency_runs
+        self._entries = {}               # file name -> metadata
+        self._stamps = {}                # file name -> (mtime_ns, size) the metadata was built from
+        self._lock = threading.Lock()
+        self._scan_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._etag = None
+        self._body = None
+        self._publish()
+
+    def describe(self, file_name, path):
+        entry = MODEL_CACHE.entry(path)
+        interpreter = MODEL_CACHE.interpreter(path)
+        return {'size': entry.size, 'sha256': entry.sha256,
+                'inputs': [tensor_details(d) for d in interpreter.get_input_details()],
+                'outputs': [tensor_details(d) for d in interpreter.get_output_details()],
+                'latency_ms': measure_latency(interpreter, self.latency_runs)}
+
+    def scan(self):
+        with self._scan_lock:
+            return self._scan()
+
+    def _scan(self):
+        # rebuilds the metadata of the new or changed files only
+        if not os.path.isdir(self.models_dir):
+            current = {}
+        else:
+            current = {e.name: (e.stat().st_mtime_ns, e.stat().st_size) for e in os.scandir(self.models_dir)
+                       if e.name.endswith('.tflite') and not e.name.startswith('.')}
+        changed = False
+        for file_name, stamp in current.items():
+            if self._stamps.get(file_name) == stamp:
+                continue
+            try:
+                metadata = self.describe(file_name, os.path.join(self.models_dir, file_name))
+            except Exception as error:
+                metadata = {'size': stamp[1], 'error': repr(error)}
+            with self._lock:
+                self._entries[file_name] = metadata
+                self._stamps[file_name] = stamp
+            changed = True
+        for file_name in set(self._stamps) - set(current):
+            with self._lock:
+                self._entries.pop(file_name, None)
+                self._stamps.pop(file_name, None)
+            changed = True
+        if changed:
+            self._publish()
+        return changed
+
+    def _publish(self):
+        # the response body and its ETag are built once per change, not per request
+        with self._lock:
+            models = sorted(self._entries)
+            body = json.dumps({'models': models, 'details': {name: self._entries[name] for name in models}},
+                              sort_keys=True)
+            self._body = body
+            self._etag = '"%s"' % hashlib.sha1(body.encode('utf-8')).hexdigest()
+
+    def snapshot(self):
+        with self._lock:
+            return self._etag, self._body
+
+    def notify(self, name):
+        # called by model_store when a model is written: /list is up to date as soon as /add returns
+        self.scan()
+
+    def _run(self):
+        while not self._stop_event.wait(self.poll_interval):
+            try:
+                self.scan()
+            except Exception as error:
+                print(f"model index scan failed: {error!r}")
+
+    def start(self):
+        self.scan()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='model-index', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,119 @@
+import hashlib
+import os
+import re
+import threading
+
+from model_cache import MODEL_CACHE
+
+
+MODELS_DIR = './models'
+CHUNK_SIZE = 64 * 1024
+NAME = re.compile(r'^[A-Za-z0-9_.-]+$')
+
+
+############################################ Model files on disk ############################################
+# Models are always written to a temporary file first and renamed over the final one, so a reader never
+# sees a half written .tflite. Chunked uploads keep their partial file (./models/.<name>.part) between
+# requests, which lets a client resume from the last offset the device acknowledged.
+
+class UploadError(Exception):
+    def __init__(self, status, message, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.offset = offset
+
+
+def valid_name(name):
+    return name is not None and NAME.match(name) is not None and not name.startswith('.')
+
+
+def model_path(name):
+    return os.path.join(MODELS_DIR, f'{name}.tflite')
+
+
+def partial_path(name):
+    return os.path.join(MODELS_DIR, f'.{name}.part')
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# callables notified with the model name every time a model is replaced (e.g. the ModelIndex)
+LISTENERS = []
+
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+def _lock_for(name):
+    with _locks_guard:
+        return _locks.setdefault(name, threading.Lock())
+
+
+def _publish(name, tmp_path):
+    # atomic replace of the stored model, then drop its stale cache entry
+    path = model_path(name)
+    os.replace(tmp_path, path)
+    MODEL_CACHE.invalidate(path)
+    for listener in LISTENERS:
+        listener(name)
+    return path
+
+
+def save_model(name, content):
+    os.makedirs(MODELS_DIR, exist_ok=True)
+    tmp_path = os.path.join(MODELS_DIR, f'.{name}.tmp')
+    with _lock_for(name):
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        return _publish(name, tmp_path)
+
+
+def upload_status(name):
+    path = model_path(name)
+    part = partial_path(name)
+    return {'name': name,
+            'sha256': file_sha256(path) if os.path.exists(path) else None,
+            'size': os.path.getsize(path) if os.path.exists(path) else None,
+            'offset': os.path.getsize(part) if os.path.exists(part) else 0}
+
+
+def write_chunk(name, stream, offset, total_size, sha256, length):
+    # appends `length` bytes read from `stream` at `offset`; once total_size bytes are there the hash is
+    # checked and the model replaces the stored one. Returns the upload status.
+    os.makedirs(MODELS_DIR, exist_ok=True)
+    part = partial_path(name)
+    with _lock_for(name):
+        current = os.path.getsize(part) if os.path.exists(part) else 0
+        if offset == 0 and current:
+            current = 0          # a new upload from scratch replaces a stale partial one
+        elif offset != current:
+            raise UploadError(409, f'expected offset {current}', offset=current)
+        if offset + length > total_size:
+            raise UploadError(400, 'chunk goes past the declared size', offset=current)
+
+        with open(part, 'r+b' if current else 'wb') as f:
+            f.seek(offset)
+            remaining = length
+            while remaining > 0:
+                chunk = stream.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                f.write(chunk)
+                remaining -= len(chunk)
+            f.truncate()
+        received = os.path.getsize(part)
+        if received < total_size:
+            return {'name': name, 'status': 'partial', 'offset': received}
+
+        if file_sha256(part) != sha256:
+            os.remove(part)
+            raise UploadError(400, 'sha256 mismatch, upload discarded', offset=0)
+        _publish(name, part)
+        return {'name': name, 'status': 'complete', 'offset': received, 'sha256': sha256}
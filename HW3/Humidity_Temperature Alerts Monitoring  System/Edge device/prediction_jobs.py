@@ -0,0 +1,313 @@
+import functools
+import itertools
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from model_cache import MODEL_CACHE
+from mqtt_setup import setup
+from sensor_service import SensorService
+from sources import open_sensor
+from sliding_window import RingWindow
+
+
+# multi-horizon models (HW2 version m) have one [1, 12, 2] output: rows 0-2 are the 3-step
+# forecast and rows 3-11 the 9-step one, so one interpreter serves either horizon
+MULTI_HORIZON_STEPS = 12
+HORIZONS = {3: slice(0, 3), 9: slice(3, 12)}
+
+
+############################################ Alert publisher ############################################
+# one MQTT client for the whole service instead of one per /predict call
+
+class AlertPublisher(object):
+    def __init__(self, clientID="publisher 3", codec='json'):
+        self.clientID = clientID
+        self.codec = codec
+        self._client = None
+        self._lock = threading.Lock()
+
+    def _ensure_client(self):
+        with self._lock:
+            if self._client is None:
+                self._client = setup(self.clientID, self.codec)
+                self._client.run()
+            return self._client
+
+    def publish_pack(self, topic, pack, qos=2):
+        # pack is a SenML record pack built by the AlertAggregator
+        self._ensure_client().publish_senml(topic, pack, qos)
+
+    def end(self):
+        with self._lock:
+            if self._client is not None:
+                self._client.end()
+                self._client = None
+
+
+############################################ Shared sensor sampling thread ############################################
+# The SensorService thread owns the DHT11 and keeps the latest reading in its slot. This thread reads
+# that slot on the jobs' cadence without ever waiting on the sensor and fans the reading out to all
+# the running prediction jobs. A reading older than max_age is stale and is fanned out as a failed
+# read (None), so each job window keeps its cadence and imputes the gap.
+
+class SensorSampler(threading.Thread):
+    def __init__(self, service, period=1.0, history=None, max_age=None):
+        super().__init__(name='dht-sampler', daemon=True)
+        self.service = service
+        self.period = period
+        self.history = history
+        self.max_age = max_age if max_age is not None else 2.5 * max(period, service.period)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._last_seq = 0
+        self.errors = 0
+        self.readings = 0
+
+    def attach(self, job):
+        with self._lock:
+            self._jobs[job.job_id] = job
+
+    def detach(self, job_id):
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        next_tick = time.monotonic()
+        while not self._stop_event.is_set():
+            latest = self.service.latest()
+            if self.service.is_stale(latest, self.max_age):
+                reading = None
+                timestamp = int((datetime.now()).timestamp())
+                self.errors += 1
+            else:
+                reading = (np.float32(latest.temperature), np.float32(latest.humidity))
+                timestamp = latest.timestamp
+                self.readings += 1
+                # the history keeps every sensor reading once, however often the slot is read
+                if latest.seq != self._last_seq and self.history is not None:
+                    self.history.append('temperature_actual', timestamp, reading[0])
+                    self.history.append('humidity_actual', timestamp, reading[1])
+                self._last_seq = latest.seq
+
+            with self._lock:
+                jobs = list(self._jobs.values())
+            for job in jobs:
+                job.step(reading, timestamp)
+
+            next_tick += self.period
+            self._stop_event.wait(max(0.0, next_tick - time.monotonic()))
+
+
+############################################ Model runner ############################################
+# One interpreter plus its live error metrics. A job has a primary runner that drives the alerts and
+# optional shadow runners that see exactly the same window on every tick (A/B on live data).
+
+class ModelRunner(object):
+    def __init__(self, model_name, tthres, hthres, horizon=None, strict=True):
+        self.model_name = model_name
+        self.tthres = tthres
+        self.hthres = hthres
+
+        self.interpreter = MODEL_CACHE.interpreter('./models/{}.tflite'.format(model_name))
+        self.input_index = self.interpreter.get_input_details()[0]['index']
+        output_details = self.interpreter.get_output_details()[0]
+        self.output_index = output_details['index']
+        self.horizon, self.rows = self.select_horizon(int(np.prod(output_details['shape'])) // 2, horizon, strict)
+
+        self.count = 0
+        self.abs_error_sum = np.zeros(2, dtype=np.float64)
+        self.last_error = None
+        self.would_alert = 0
+
+    def predict(self, window):
+        # a single invoke per model and tick
+        window.write_to(self.interpreter, self.input_index)
+        self.interpreter.invoke()
+        predicted = self.interpreter.get_tensor(self.output_index)
+        return predicted.reshape(-1, 2)[self.rows]            # [1, 2] or [1, steps, 2]: row 0 is the next step
+
+    def select_horizon(self, steps, horizon, strict):
+        # returns the forecast length and the output rows that hold it
+        if steps == MULTI_HORIZON_STEPS:
+            horizon = 3 if horizon is None else horizon
+            if horizon not in HORIZONS:
+                raise ValueError(f'model {self.model_name} serves horizons {sorted(HORIZONS)}, not {horizon}')
+            return horizon, HORIZONS[horizon]
+        if strict and horizon is not None and horizon != steps:
+            raise ValueError(f'model {self.model_name} forecasts {steps} steps, not {horizon}')
+        return steps, slice(0, steps)
+
+    def record(self, predicted, expected, timestamp, history=None):
+        if history is not None:
+            history.append(f'temperature_predicted/{self.model_name}', timestamp, predicted[0, 0])
+            history.append(f'humidity_predicted/{self.model_name}', timestamp, predicted[0, 1])
+        error = np.abs(predicted[0] - expected)
+        self.count += 1
+        self.abs_error_sum += error
+        self.last_error = error
+        if error[0] > self.tthres or error[1] > self.hthres:
+            self.would_alert += 1
+        return error
+
+    def metrics(self):
+        mae = self.abs_error_sum / self.count if self.count else self.abs_error_sum
+        return {'model': self.model_name, 'horizon': self.horizon, 'ticks': self.count,
+                'temperature_mae': float(mae[0]), 'humidity_mae': float(mae[1]),
+                'last_error': None if self.last_error is None else [float(e) for e in self.last_error],
+                'would_alert': self.would_alert}
+
+
+############################################ Prediction job ############################################
+
+class PredictionJob(object):
+    def __init__(self, job_id, model_name, tthres, hthres, aggregator, shadow_models=(), history=None, horizon=None):
+        self.job_id = job_id
+        self.model_name = model_name
+        self.tthres = tthres
+        self.hthres = hthres
+        self.aggregator = aggregator
+        self.history = history
+
+        self.primary = ModelRunner(model_name, tthres, hthres, horizon)
+        # shadows follow the primary horizon when they can serve it, otherwise they keep their own
+        self.shadows = [ModelRunner(name, tthres, hthres, self.primary.horizon, strict=False)
+                        for name in shadow_models if name != model_name]
+        self.window = RingWindow(width=6, channels=2)
+        self.expected = np.zeros(2, dtype=np.float32)
+
+        self.status = 'warming-up'
+        self.created = int(time.time())
+        self.ticks = 0
+        self.alerts = 0
+        self.error = None
+        self.last = None
+
+    def step(self, reading, timestamp):
+        if self.status in ('stopped', 'failed'):
+            return
+        try:
+            self._step(reading, timestamp)
+        except Exception as error:
+            self.status = 'failed'
+            self.error = repr(error)
+            print(f"job {self.job_id} failed: {self.error}")
+
+    def _step(self, reading, timestamp):
+        if reading is None:
+            # a missed sample: the window repeats the previous reading, there is nothing to compare against
+            self.window.push(None)
+            return
+        if not self.window.ready:
+            # warm-up: the first 6 readings fill the window
+            self.window.push(reading)
+            return
+
+        # the window holds the 6 previous readings, the current one is the label
+        expected = self.expected
+        expected[0] = reading[0]
+        expected[1] = reading[1]
+
+        predicted = self.primary.predict(self.window)
+        self.primary.record(predicted, expected, timestamp, self.history)
+        # shadow models only feed their metrics, they never publish
+        for shadow in self.shadows:
+            shadow.record(shadow.predict(self.window), expected, timestamp, self.history)
+        self.window.push(reading)
+
+        self.status = 'running'
+        self.ticks += 1
+        self.last = {'t': timestamp,
+                     'temperature_actual': float(expected[0]), 'temperature_predicted': float(predicted[0, 0]),
+                     'humidity_actual': float(expected[1]), 'humidity_predicted': float(predicted[0, 1])}
+        self.check_alerts(predicted, expected, timestamp)
+
+    def check_alerts(self, predicted, expected, timestamp):
+        # every tick goes to the aggregator, which debounces, rate limits and batches the alerts
+        if self.aggregator.observe((self.job_id, 'temperature'), "/s289815/temperature_alert", 'temperature', '°C',
+                                   predicted[0, 0], expected[0], self.tthres, timestamp):
+            self.alerts += 1
+        if self.aggregator.observe((self.job_id, 'humidity'), "/s289815/humidity_alert", 'humidity', '%',
+                                   predicted[0, 1], expected[1], self.hthres, timestamp):
+            self.alerts += 1
+
+    def stop(self):
+        self.status = 'stopped'
+
+    def describe(self):
+        return {'job_id': self.job_id, 'model': self.model_name, 'horizon': self.primary.horizon, 'tthres': self.tthres, 'hthres': self.hthres,
+                'status': self.status, 'created': self.created, 'ticks': self.ticks, 'alerts': self.alerts,
+                'error': self.error, 'last': self.last,
+                'metrics': self.primary.metrics(), 'shadows': [shadow.metrics() for shadow in self.shadows]}
+
+
+############################################ Job manager ############################################
+
+class JobManager(object):
+    def __init__(self, aggregator, period=1.0, history=None, sensor='dht11'):
+        self.aggregator = aggregator
+        self.history = history
+        self.period = period
+        # the sensor is only opened when the first job starts, /add and /list never touch it
+        self.open_source = functools.partial(open_sensor, sensor, period)
+        self._jobs = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._sampler = None
+        self._service = None
+
+    def _ensure_sampler(self):
+        if self._service is None or not self._service.is_alive():
+            self._service = SensorService(self.period, self.open_source)
+            self._service.start()
+        if self._sampler is None or not self._sampler.is_alive():
+            self._sampler = SensorSampler(self._service, self.period, self.history)
+            self._sampler.start()
+        return self._sampler
+
+    def sensor_stats(self):
+        return self._service.stats() if self._service is not None else None
+
+    def start(self, model_name, tthres, hthres, shadow_models=(), horizon=None):
+        with self._lock:
+            job_id = str(next(self._ids))
+            job = PredictionJob(job_id, model_name, tthres, hthres, self.aggregator, shadow_models, self.history,
+                                horizon)
+            self._jobs[job_id] = job
+            self._ensure_sampler().attach(job)
+        print(f'started job {job_id} with model {model_name} shadows {[s.model_name for s in job.shadows]}')
+        return job
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def list(self):
+        return [job.describe() for job in list(self._jobs.values())]
+
+    def stop(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            job.stop()
+            self.aggregator.forget(job_id)
+            if self._sampler is None:
+                return job
+            self._sampler.detach(job_id)
+            # release the sensor when nothing is left to feed
+            if not any(j.status not in ('stopped', 'failed') for j in self._jobs.values()):
+                self._sampler.stop()
+                self._sampler = None
+                self._service.stop()
+                self._service = None
+        return job
+
+    def shutdown(self):
+        for job_id in list(self._jobs):
+            self.stop(job_id)
@@ -1,22 +1,26 @@
 import cherrypy
 import json
 import os
-import adafruit_dht
-import numpy as np
-import time
-import tensorflow as tf
-from board import D4
-import datetime
-from mqtt_setup import setup
-from datetime import datetime
 import base64
-import numpy as np 
+import model_store
+from model_index import ModelIndex
+from prediction_jobs import AlertPublisher, JobManager
+from alert_aggregator import AlertAggregator
+from tsstore import TimeSeriesStore
+
+# QoS per alert topic: QoS 1 already guarantees the delivery of a batched pack
+ALERT_QOS = {"/s289815/temperature_alert": 1, "/s289815/humidity_alert": 1}
+# payload codec of the alerts: 'json' (SenML+JSON), 'cbor' (CBOR-SenML) or 'packed'
+ALERT_CODEC = os.environ.get('ALERT_CODEC', 'json')
 
 class ADD(object):
     exposed = True
 
-    def GET(self, *path):        
-       pass
+    ##################### GET /add/<name> returns the stored hash and the resume offset ####################
+    def GET(self, *path, **query):
+        if len(path) != 1 or not model_store.valid_name(path[0]):
+            raise cherrypy.HTTPError(400, 'Model name missing or invalid')
+        return json.dumps(model_store.upload_status(path[0]))
 
     ##################### Post is the suitable HTTP method  ####################
     def POST(self, *path, **query):
@@ -33,23 +37,46 @@ class ADD(object):
             raise cherrypy.HTTPError(400, 'Model empty')
         if model_name is None: 
             raise cherrypy.HTTPError(400, 'Model name empty')
+        if not model_store.valid_name(model_name):
+            raise cherrypy.HTTPError(400, 'Model name invalid')
 
         #################### ####################  ####################
 
         # receive the string, pass it to 64 decode
         model_base64 = base64.b64decode(model_string)
 
-        if not os.path.exists('./models'):      ### create a directory model if not existed
-                os.mkdir('models')
-
-        path_file=f'./models/{model_name}.tflite'
-
-        ##### SAVE THE MODEL AS .tflite
-        with open(path_file , 'wb') as f:
-            f.write(model_base64)
+        ##### SAVE THE MODEL AS .tflite (written aside and renamed, the cached copy is invalidated)
+        model_store.save_model(model_name, model_base64)
 
+    ##################### PUT /add/<name>?offset=&size=&sha256= streams one binary chunk ####################
     def PUT(self, *path, **query):
-            pass
+        if len(path) != 1 or not model_store.valid_name(path[0]):
+            raise cherrypy.HTTPError(400, 'Model name missing or invalid')
+        try:
+            offset = int(query.get('offset', 0))
+            size = int(query['size'])
+        except (KeyError, ValueError):
+            raise cherrypy.HTTPError(400, 'offset and size must be integers')
+        sha256 = query.get('sha256')
+        if sha256 is None:
+            raise cherrypy.HTTPError(400, 'sha256 missing')
+        length = cherrypy.request.headers.get('Content-Length')
+        if length is None:
+            raise cherrypy.HTTPError(411, 'Content-Length required')
+
+        # nothing to transfer when the device already stores this exact model
+        if offset == 0:
+            status = model_store.upload_status(path[0])
+            if status['sha256'] == sha256:
+                return json.dumps({'name': path[0], 'status': 'unchanged', 'offset': size, 'sha256': sha256})
+
+        # the body is not buffered: it is read from the socket in chunks straight into the partial file
+        try:
+            status = model_store.write_chunk(path[0], cherrypy.request.body, offset, size, sha256, int(length))
+        except model_store.UploadError as error:
+            cherrypy.response.status = error.status
+            return json.dumps({'name': path[0], 'error': error.message, 'offset': error.offset})
+        return json.dumps(status)
 
     def DELETE(self, *path, **query):
         pass
@@ -60,21 +87,21 @@ class ADD(object):
 class LIST(object):
     exposed = True
 
+    def __init__(self, index):
+        self.index = index
+
     ##################### GET is the suitable HTTP method  ####################
     def GET(self, *path):
-        out = {}
-        
         if not os.path.exists('./models'):
             print("send error code")
             raise cherrypy.HTTPError(400, 'Directory ./models missing')
-        else:
-            models=[]
-            for x in os.listdir('./models'):
-                if x.endswith(".tflite"):
-                    models.append(x)
-            out={'models':models}
 
-        output = json.dumps(out)
+        # served from the in-memory index, a client with the current ETag gets an empty 304
+        etag, output = self.index.snapshot()
+        cherrypy.response.headers['ETag'] = etag
+        if cherrypy.request.headers.get('If-None-Match') == etag:
+            cherrypy.response.status = 304
+            return ''
         return output
 
 
@@ -90,23 +117,11 @@ class LIST(object):
 ############################################ CLASS PREDICT ############################################
 class PREDICT(object):
     exposed = True
-    
-    def GET(self, *path):         
-        pass
-
-    def POST(self, *path, **query):
-
-        pass
-
-    def PUT(self, *path, **query):
-        pass
 
-    def DELETE(self, *path, **query):
-        pass
+    def __init__(self, jobs):
+        self.jobs = jobs
 
-############################################ CLASS PREDICT ############################################
-class PREDICT(object):
-    exposed = True
+    ##################### GET starts a background prediction job and returns its id ####################
     def GET(self, *path, **query):
 
         # Read the query and extract the values + Managing Errors 
@@ -114,6 +129,10 @@ class PREDICT(object):
         model_name = query.get('model')
         if model_name is None:
             raise cherrypy.HTTPError(400, 'model_name missing')
+        if not model_store.valid_name(model_name):
+            raise cherrypy.HTTPError(400, 'invalid model name')
+        if not os.path.exists('./models/{}.tflite'.format(model_name)):
+            raise cherrypy.HTTPError(404, 'model {} not found'.format(model_name))
         # tthres    
         tthres = query.get('tthres')
         if tthres is None:
@@ -128,155 +147,157 @@ class PREDICT(object):
         else:
             hthres = float(hthres)
 
-        test = setup("publisher 3")
-        test.run()
-        
+        # shadow models: a comma separated list, or 'all' for every other stored model
+        shadow = query.get('shadow')
+        if shadow is None:
+            shadow_models = []
+        elif shadow == 'all':
+            shadow_models = [x[:-len('.tflite')] for x in os.listdir('./models') if x.endswith('.tflite')]
+        else:
+            shadow_models = [name for name in shadow.split(',') if name]
+        for name in shadow_models:
+            if not model_store.valid_name(name):
+                raise cherrypy.HTTPError(400, 'invalid model name {}'.format(name))
+            if not os.path.exists('./models/{}.tflite'.format(name)):
+                raise cherrypy.HTTPError(404, 'model {} not found'.format(name))
+
+        # horizon: forecast length; a multi-horizon model serves 3 or 9 steps from the same interpreter
+        horizon = query.get('horizon')
+        if horizon is not None:
+            try:
+                horizon = int(horizon)
+            except ValueError:
+                raise cherrypy.HTTPError(400, 'horizon must be an integer')
 
         print(f'excuting model {model_name}')
-        
-        # depending on the model selected, read the model by the interpreter and allocate memory for tensors
-        interpreter = tf.lite.Interpreter(model_path='./models/{}.tflite'.format(model_name))
-        interpreter.allocate_tensors()
+        try:
+            job = self.jobs.start(model_name, tthres, hthres, shadow_models, horizon)
+        except ValueError as error:
+            raise cherrypy.HTTPError(400, str(error))
 
-        input_details = interpreter.get_input_details()
-        output_details = interpreter.get_output_details()
+        output = json.dumps({'job_id': job.job_id, 'status': job.status, 'horizon': job.primary.horizon,
+                             'shadows': [s.model_name for s in job.shadows]})
+        return output
 
-        window = np.zeros([1, 6, 2], dtype=np.float32)
-        expected = np.zeros(2, dtype=np.float32)
+    def POST(self, *path, **query):
+        pass
 
-        MEAN = np.array([9.107597, 75.904076], dtype=np.float32)
-        STD = np.array([ 8.654227, 16.557089], dtype=np.float32)
+    def PUT(self, *path, **query):
+        pass
+
+    def DELETE(self, *path, **query):
+        pass
+
+############################################ CLASS JOBS ############################################
+class JOBS(object):
+    exposed = True
+
+    def __init__(self, jobs):
+        self.jobs = jobs
+
+    ##################### GET /jobs lists the jobs, GET /jobs/<id> inspects one ####################
+    def GET(self, *path, **query):
+        if len(path) == 0:
+            return json.dumps({'jobs': self.jobs.list(), 'alerts': self.jobs.aggregator.stats(),
+                               'sensor': self.jobs.sensor_stats()})
+        job = self.jobs.get(path[0])
+        if job is None:
+            raise cherrypy.HTTPError(404, 'job {} not found'.format(path[0]))
+        return json.dumps(job.describe())
+
+    def POST(self, *path, **query):
+        pass
+
+    def PUT(self, *path, **query):
+        pass
+
+    ##################### DELETE /jobs/<id> stops a job ####################
+    def DELETE(self, *path, **query):
+        if len(path) != 1:
+            raise cherrypy.HTTPError(400, 'job id missing')
+        job = self.jobs.stop(path[0])
+        if job is None:
+            raise cherrypy.HTTPError(404, 'job {} not found'.format(path[0]))
+        return json.dumps(job.describe())
+
+
+############################################ CLASS HISTORY ############################################
+class HISTORY(object):
+    exposed = True
+
+    def __init__(self, store):
+        self.store = store
+
+    ##################### GET /history lists the series, GET /history/<series>?start=&end=&bucket= reads one ####################
+    def GET(self, *path, **query):
+        if len(path) == 0:
+            return json.dumps({'series': self.store.series()})
+        series = '/'.join(path)
+        try:
+            start = float(query['start']) if 'start' in query else None
+            end = float(query['end']) if 'end' in query else None
+            bucket = int(query['bucket']) if 'bucket' in query else None
+        except ValueError:
+            raise cherrypy.HTTPError(400, 'start, end and bucket must be numbers')
+        if bucket is not None:
+            if bucket <= 0:
+                raise cherrypy.HTTPError(400, 'bucket must be positive')
+            return json.dumps({'series': series, 'bucket': bucket,
+                               'values': self.store.downsample(series, start, end, bucket)})
+        times, values = self.store.query(series, start, end)
+        return json.dumps({'series': series, 't': times.tolist(), 'v': values.tolist()})
+
+    def POST(self, *path, **query):
+        pass
+
+    def PUT(self, *path, **query):
+        pass
+
+    def DELETE(self, *path, **query):
+        pass
 
-        
-        dht_device = adafruit_dht.DHT11(D4)
-        first = True
-
-        while True:
-
-            if first == True : 
-                for i in range(7):
-                    try:
-                        temperature = dht_device.temperature    # save the temperature readings to variable 
-                        humidity = dht_device.humidity          # save the humidity readings to variable 
-                    except RuntimeError as error:
-                        # Errors happen fairly often, DHT's are hard to read, just keep going
-                        print(f"Sensor Error {error.args[0]}")
-                        time.sleep(3.0)
-                        continue
-                    except Exception as error:
-                        dht_device.exit()
-                        raise error
-                    # the first 6 readings represent the window 
-                    if i < 6:
-                        window[0, i, 0] = np.float32(temperature)
-                        window[0, i, 1] = np.float32(humidity)
-                    # the seventh reading is the label 
-                    if i == 6:
-                        expected[0] = np.float32(temperature)
-                        expected[1] = np.float32(humidity)
-
-            
-                        window = (window - MEAN) / STD            # Normalize the values for the window 
-                
-                        interpreter.set_tensor(input_details[0]['index'], window)
-                        interpreter.invoke()
-                        predicted = interpreter.get_tensor(output_details[0]['index'])
-                        last_expected = np.array([expected[0] , expected[1]]  , dtype=np.float32 ,ndmin=3)
-                        last_expected = (last_expected - MEAN) / STD
-                        previous_window = window[:,1:,:]
-                        first = False
-            else :
-                
-                 
-                temperature = dht_device.temperature
-                humidity = dht_device.humidity
-                expected[0] = np.float32(temperature)
-                expected[1] = np.float32(humidity)
-                window = np.append(previous_window , last_expected , axis=1)
-                    
-                #window = (window - MEAN) / STD
-            
-                interpreter.set_tensor(input_details[0]['index'], window)
-                interpreter.invoke()
-                predicted = interpreter.get_tensor(output_details[0]['index'])
-            
-                previous_window = window[:,1:,:]
-                last_expected = np.array([expected[0] , expected[1]]  , dtype=np.float32 ,ndmin=3)
-                last_expected = (last_expected - MEAN) / STD
-                #print('Measured: {:.1f},{:.1f}'.format(expected[0], expected[1]))
-                #print('Predicted: {:.1f},{:.1f}'.format(predicted[0, 0],predicted[0, 1]))
-            temp_actual = f'{expected[0] :0.2f}'
-            hum_actual = f'{expected[1] :0.2f}'
-            temp_pred =  f'{predicted[0, 0] :0.2f}'
-            hum_pred = f'{predicted[0, 1] :0.2f}'
-            temp_abs_error = np.abs( predicted[0, 0] - expected[0] )
-            hum_abs_error = np.abs(predicted[0, 1] - expected[1] )
-
-            
-            timestamp  = int((datetime.now()).timestamp()) # (05/12/2022 19:15:01)
-            # check the temp ALERT condition 
-            if(temp_abs_error > tthres):
-                # print("*" * 100)
-                # print(f" temp actual {temp_actual} {type(temp_actual)}pred {type(temp_pred)}")
-                # pack message into SENML+JSON STRING
-                message = {
-                    'bn': 'raspberrypi.local',
-                    'bt': timestamp,
-                    'e':[
-                        {'n': 'temperature_predicted', 
-                            'u': '°C', 
-                            't': 0, 
-                            'v': float(predicted[0,0])},
-                            {'n': 'temperature_actual', 
-                            'u': '°C', 
-                            't': 0, 
-                            'v': float(expected[0])}  
-                    ]
-                }
-                message = json.dumps(message)
-                test.myMqttClient.myPublish("/s289815/temperature_alert", message)                    # publishing temperature alert 
-                
-            # check the humidity ALERT condition 
-            if(hum_abs_error>hthres):
-                # print("&" * 100)
-                # print(f" hum actual {hum_actual} pred {hum_pred}")
-                # pack message into SENML+JSON STRING
-                message = {
-                    'bn': 'raspberrypi.local',
-                    'bt': timestamp,
-                    'e':[
-                        {'n': 'humidity_predicted', 
-                            'u': '%', 
-                            't': 0, 
-                            'v': float(predicted[0,1])},
-                            {'n': 'humidity_actual', 
-                            'u': '%', 
-                            't': 0, 
-                            'v': float(expected[1])}   
-                    ]
-                }
-                message = json.dumps(message)
-                test.myMqttClient.myPublish("/s289815/humidity_alert", message)            # publishing humidity alert 
-
-            print("*" * 100)
-            
-            time.sleep(1)
-              
-
-              
-
-                
 
 if __name__ == '__main__':
-    conf = {'/': {'request.dispatch': cherrypy.dispatch.MethodDispatcher()}}
-    cherrypy.tree.mount(ADD(), '/add', conf)
-    cherrypy.tree.mount(LIST(), '/list', conf)
-    cherrypy.tree.mount(PREDICT(), '/predict', conf)
-    cherrypy.config.update({'server.socket_host': '0.0.0.0'})
-    cherrypy.config.update({'server.socket_port': 8080})
-    cherrypy.engine.start()
-
-    cherrypy.engine.block()
-
-    while True:
-        time.sleep(1)
+    import argparse
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--server', default='cherrypy', choices=['cherrypy', 'async'], help='serving mode')
+    parser.add_argument('--port', default=8080, type=int)
+    parser.add_argument('--threads', default=10, type=int, help='CherryPy thread pool size')
+    parser.add_argument('--workers', default=4, type=int, help='async mode: executor threads for the handlers')
+    parser.add_argument('--sensor', default='dht11', help='dht11[:PIN], synthetic, csv:PATH or tfrecord:PATH')
+    # a replayed sensor delivers one row per period: a short period load-tests the jobs
+    parser.add_argument('--period', default=1.0, type=float, help='seconds between two prediction ticks')
+    args = parser.parse_args()
+
+    index = ModelIndex('./models', poll_interval=5.0)
+    index.start()
+    model_store.LISTENERS.append(index.notify)
+    publisher = AlertPublisher("publisher 3", ALERT_CODEC)
+    aggregator = AlertAggregator(publisher, n=3, m=5, hysteresis=0.8, min_interval=5.0, flush_interval=10.0,
+                                 qos=ALERT_QOS)
+    aggregator.start()
+    history = TimeSeriesStore('./history', segment_seconds=3600)
+    jobs = JobManager(aggregator, args.period, history, args.sensor)
+    stop_order = [jobs.shutdown, aggregator.stop, history.close, index.stop, publisher.end]
+
+    routes = {'/add': ADD(), '/list': LIST(index), '/predict': PREDICT(jobs), '/jobs': JOBS(jobs),
+              '/history': HISTORY(history)}
+    if args.server == 'async':
+        from async_server import AsyncServer
+        try:
+            AsyncServer(routes, host='0.0.0.0', port=args.port, workers=args.workers).run()
+        finally:
+            for service in stop_order:
+                service()
+    else:
+        conf = {'/': {'request.dispatch': cherrypy.dispatch.MethodDispatcher()}}
+        for mount, handler in routes.items():
+            cherrypy.tree.mount(handler, mount, conf)
+        for service in stop_order:
+            cherrypy.engine.subscribe('stop', service)
+        cherrypy.config.update({'server.socket_host': '0.0.0.0'})
+        cherrypy.config.update({'server.socket_port': args.port})
+        cherrypy.config.update({'server.thread_pool': args.threads})
+        cherrypy.engine.start()
+
+        cherrypy.engine.block()
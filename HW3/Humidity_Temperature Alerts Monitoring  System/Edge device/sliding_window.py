@@ -0,0 +1,64 @@
+import numpy as np
+
+
+MEAN = np.array([9.107597, 75.904076], dtype=np.float32)
+STD = np.array([ 8.654227, 16.557089], dtype=np.float32)
+
+
+############################################ Fixed-size circular input window ############################################
+# The samples are stored twice in a buffer of 2 * width rows (row i and row i + width hold the same value),
+# so the last `width` samples, oldest first, are always the contiguous slice store[pos:pos + width].
+# All the [1, width, channels] views are created once, so a tick only writes one normalized row in place.
+
+class RingWindow(object):
+    def __init__(self, width=6, channels=2, mean=MEAN, std=STD):
+        self.width = width
+        self.channels = channels
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.inv_std = (1.0 / np.asarray(std, dtype=np.float32)).astype(np.float32)
+
+        self._store = np.zeros([2 * width, channels], dtype=np.float32)
+        self._views = [self._store[i:i + width].reshape(1, width, channels) for i in range(width)]
+        self._row = np.zeros(channels, dtype=np.float32)
+        self._pos = 0               # next row to write == oldest sample once the window is full
+        self.count = 0              # valid samples in the window
+        self.imputed = 0            # missing samples replaced by the previous reading
+
+    @property
+    def ready(self):
+        return self.count == self.width
+
+    def push(self, sample):
+        # sample is the raw (temperature, humidity) reading, or None when the sensor read failed
+        row = self._row
+        if sample is None:
+            if self.count == 0:
+                return False          # nothing to repeat yet: the warm-up just waits for a real reading
+            # repeat the last normalized sample to keep the window aligned with the sampling period
+            row[:] = self._store[(self._pos - 1) % self.width]
+            self.imputed += 1
+        else:
+            for c in range(self.channels):
+                row[c] = sample[c]
+            np.subtract(row, self.mean, out=row)
+            np.multiply(row, self.inv_std, out=row)
+
+        self._store[self._pos] = row
+        self._store[self._pos + self.width] = row
+        self._pos = (self._pos + 1) % self.width
+        if self.count < self.width:
+            self.count += 1
+        return True
+
+    def view(self):
+        # contiguous [1, width, channels] window, oldest sample first (no copy)
+        return self._views[self._pos]
+
+    def write_to(self, interpreter, index):
+        interpreter.set_tensor(index, self._views[self._pos])
+
+    def reset(self):
+        self._store[:] = 0
+        self._pos = 0
+        self.count = 0
+        self.imputed = 0
@@ -1,35 +1,35 @@
-import adafruit_dht
 import argparse
-import datetime
-import time
-from board import D4
+
+from sampler import BufferedWriter, CachedSensor, DHT11Sensor, Sampler, SimulatedSensor
 
 parser=argparse.ArgumentParser()
 parser.add_argument('-f', type=float, help='frequency in seconds')
 parser.add_argument('-p', type=float, help='period in seconds')
 parser.add_argument('-o', type=str, help='output filename')
+parser.add_argument('--sim', action='store_true', help='simulated DHT11, no hardware needed')
+parser.add_argument('--retries', type=int, default=3, help='retries of a failed read')
+parser.add_argument('--min_interval', type=float, default=1.0, help='minimum seconds between two DHT11 reads')
+parser.add_argument('--flush_rows', type=int, default=10, help='rows buffered before writing')
+parser.add_argument('--flush_secs', type=float, default=5.0, help='seconds buffered before writing')
+parser.add_argument('--fsync', type=str, default='close', choices=['never', 'flush', 'close'])
 
 args = parser.parse_args()
 
 num_samples = int(args.p // args.f)
 
-dht_device= adafruit_dht.DHT11(D4)
+dht_device = SimulatedSensor() if args.sim else DHT11Sensor('D4')
+sensor = CachedSensor(dht_device, min_interval=args.min_interval, retries=args.retries)
 
-fp=open(args.o, 'w')
+fp = BufferedWriter(args.o, flush_rows=args.flush_rows, flush_interval=args.flush_secs, fsync=args.fsync)
 
-for i in range(num_samples):
-	
-	now=datetime.datetime.now()
-	temperature= dht_device.temperature
-	humidity= dht_device.humidity
-	
-	#print('{:02}/{:02}/{:04},{:02}:{:02}:{:02},{:},{:}'.format(now.day, now.month, now.year, now.hour, now.minute, now.second, temperature, humidity), file=fp)
-	time.sleep(args.f)
-	
-fp.close()
+# one row per sample, due every args.f seconds on the monotonic clock
+sampler = Sampler(sensor, fp, args.f, num_samples)
+sampler.run()
+print(sampler.stats())
 
 
 '''
 python3 lab1_ex1.py -f 5 -p 20 -o ht.txt
 cat ht.txt
+python3 LAB1_ex1_PROF.py -f 1 -p 10 -o ht.txt --sim
 '''
@@ -0,0 +1,180 @@
+import datetime
+import os
+import random
+import time
+
+
+############################################ Sensor backends ############################################
+# DHT11Sensor talks to the real sensor (the board libraries are imported only when it is created),
+# SimulatedSensor behaves like one: a slow read, a random walk and occasional checksum errors.
+# Both return (temperature, humidity) or raise RuntimeError, as adafruit_dht does.
+
+class DHT11Sensor(object):
+    def __init__(self, pin='D4'):
+        import adafruit_dht
+        import board
+        self.device = adafruit_dht.DHT11(getattr(board, pin))
+
+    def read(self):
+        temperature = self.device.temperature
+        humidity = self.device.humidity
+        if temperature is None or humidity is None:
+            raise RuntimeError('incomplete reading')
+        return temperature, humidity
+
+
+class SimulatedSensor(object):
+    def __init__(self, temperature=21.0, humidity=55.0, failure_rate=0.1, read_time=0.25, seed=42):
+        self.temperature = temperature
+        self.humidity = humidity
+        self.failure_rate = failure_rate
+        self.read_time = read_time
+        self.random = random.Random(seed)
+
+    def read(self):
+        time.sleep(self.read_time)                 # the DHT11 read is bit-banged and takes a while
+        if self.random.random() < self.failure_rate:
+            raise RuntimeError('checksum did not validate')
+        self.temperature += self.random.gauss(0, 0.1)
+        self.humidity = min(95.0, max(20.0, self.humidity + self.random.gauss(0, 0.5)))
+        return int(round(self.temperature)), int(round(self.humidity))
+
+
+############################################ Read policy ############################################
+# The DHT11 must not be read more than once per `min_interval` seconds: a faster request gets the
+# last good value back. Failed reads are retried with an exponential backoff that never goes past
+# the deadline of the next sample.
+
+class CachedSensor(object):
+    def __init__(self, sensor, min_interval=1.0, retries=3, backoff=0.1, factor=2.0):
+        self.sensor = sensor
+        self.min_interval = min_interval
+        self.retries = retries
+        self.backoff = backoff
+        self.factor = factor
+        self.last = None
+        self.last_read = None
+        self.reads = 0
+        self.cached = 0
+        self.failures = 0
+        self.retried = 0
+
+    def read(self, deadline=None):
+        # returns (reading, from_cache); reading is None when every attempt failed
+        now = time.monotonic()
+        if self.last_read is not None and now - self.last_read < self.min_interval:
+            self.cached += 1
+            return self.last, True
+
+        delay = self.backoff
+        for attempt in range(self.retries + 1):
+            self.last_read = time.monotonic()
+            self.reads += 1
+            try:
+                self.last = self.sensor.read()
+                return self.last, False
+            except RuntimeError:
+                self.failures += 1
+            # the next attempt has to respect both the backoff and the sensor minimum interval
+            wait = max(delay, self.min_interval)
+            if attempt == self.retries or (deadline is not None and time.monotonic() + wait >= deadline):
+                break
+            self.retried += 1
+            time.sleep(wait)
+            delay *= self.factor
+        return None, False
+
+
+############################################ Buffered output ############################################
+# Rows are kept in memory and written every `flush_rows` rows or `flush_interval` seconds. fsync
+# chooses durability: 'never', 'flush' (after every write to the file) or 'close' (once at the end).
+
+class BufferedWriter(object):
+    def __init__(self, path, flush_rows=10, flush_interval=5.0, fsync='close'):
+        if fsync not in ('never', 'flush', 'close'):
+            raise ValueError(f'unknown fsync policy {fsync}')
+        self.fp = open(path, 'w')
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self._rows = []
+        self._last_flush = time.monotonic()
+        self.flushes = 0
+
+    def write(self, row):
+        self._rows.append(row)
+        if len(self._rows) >= self.flush_rows or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if self._rows:
+            self.fp.write('\n'.join(self._rows) + '\n')
+            self._rows = []
+        self.fp.flush()
+        if self.fsync == 'flush':
+            os.fsync(self.fp.fileno())
+        self._last_flush = time.monotonic()
+        self.flushes += 1
+
+    def close(self):
+        self.flush()
+        if self.fsync == 'close':
+            os.fsync(self.fp.fileno())
+        self.fp.close()
+
+
+############################################ Sampler ############################################
+# Sample i is due at start + i * period on the monotonic clock, so the time spent reading (and
+# retrying) never shifts the following samples. A sample whose slot has already passed is skipped
+# and counted instead of being taken late.
+
+def format_row(now, reading):
+    temperature, humidity = reading if reading is not None else ('', '')
+    return '{:02}/{:02}/{:04},{:02}:{:02}:{:02},{:},{:}'.format(now.day, now.month, now.year,
+                                                               now.hour, now.minute, now.second,
+                                                               temperature, humidity)
+
+
+class Sampler(object):
+    def __init__(self, sensor, writer, period, num_samples):
+        self.sensor = sensor
+        self.writer = writer
+        self.period = period
+        self.num_samples = num_samples
+        self.written = 0
+        self.failed = 0
+        self.skipped = 0
+        self.max_lateness = 0.0
+
+    def run(self):
+        start = time.monotonic()
+        i = 0
+        # the buffered rows are flushed even when a read raises or the run is interrupted
+        try:
+            while i < self.num_samples:
+                due = start + i * self.period
+                delay = due - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                elif -delay >= self.period:
+                    # the previous sample overran this whole slot
+                    self.skipped += 1
+                    i += 1
+                    continue
+                self.max_lateness = max(self.max_lateness, time.monotonic() - due)
+
+                now = datetime.datetime.now()
+                reading, _ = self.sensor.read(deadline=due + self.period)
+                if reading is None:
+                    self.failed += 1            # written with empty values, so the gap stays visible
+                self.writer.write(format_row(now, reading))
+                self.written += 1
+                i += 1
+        finally:
+            self.writer.close()
+
+    def stats(self):
+        return {'written': self.written, 'failed': self.failed, 'skipped': self.skipped,
+                'max_lateness_ms': self.max_lateness * 1e3, 'reads': self.sensor.reads,
+                'cached': self.sensor.cached, 'read_failures': self.sensor.failures,
+                'retries': self.sensor.retried, 'flushes': self.writer.flushes}
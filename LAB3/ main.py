@@ -1,13 +1,12 @@
 import tensorflow as tf 
 from tensorflow import keras
 import argparse
-import numpy as np
 import os
-import pandas as pd
 
 #importing models
 from my_modles_Class import CreateModel
 from  lab3_ex1_draft import WindowGenerator
+from jena_cache import load_jena
 
 
 def main() :
@@ -31,20 +30,12 @@ def main() :
 
 
     csv_path, _ = os.path.splitext(zip_path) # this how you remove the .zip at the end of the name 
-    df = pd.read_csv(csv_path)
 
     column_indices = [2, 5]                           # temperature and humidity column_indices
-    columns = df.columns[column_indices]              # temperature and humidity column_Names
-    data = df[columns].values.astype(np.float32)      # extract only numpy arrays
 
     # Train ,Validation ,Test Split  we don't have to shuffle because we don't have the labels yet: 
-    n = len(data)                          
-    train_data = data[0:int(n*0.7)]
-    val_data = data[int(n*0.7):int(n*0.9)]
-    test_data = data[int(n*0.9):]
-
-    mean = train_data.mean(axis=0)       # remember these used for normalization but only calculated form training data   
-    std = train_data.std(axis=0)
+    # the columns, split and train mean/std come from the binary cache (built from the CSV on the first run)
+    data, train_data, val_data, test_data, mean, std = load_jena(csv_path, column_indices)
 
     input_width = 6
     # LABEL_OPTIONS = args.labels
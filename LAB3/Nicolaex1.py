@@ -1,10 +1,10 @@
 import argparse
 import numpy as np
 import os
-import pandas as pd
 import tensorflow as tf
 
 from tensorflow import keras
+from jena_cache import load_jena
 
 
 parser = argparse.ArgumentParser()
@@ -22,19 +22,10 @@ zip_path = tf.keras.utils.get_file(
     extract=True,
     cache_dir='.', cache_subdir='data')
 csv_path, _ = os.path.splitext(zip_path)
-df = pd.read_csv(csv_path)
 
+# columns 2 and 5 (temperature, humidity), 70/20/10 split and train mean/std, from the binary cache
 column_indices = [2, 5]
-columns = df.columns[column_indices]
-data = df[columns].values.astype(np.float32)
-
-n = len(data)
-train_data = data[0:int(n*0.7)]
-val_data = data[int(n*0.7):int(n*0.9)]
-test_data = data[int(n*0.9):]
-
-mean = train_data.mean(axis=0)
-std = train_data.std(axis=0)
+data, train_data, val_data, test_data, mean, std = load_jena(csv_path, column_indices)
 
 input_width = 6
 LABELS = args.labels
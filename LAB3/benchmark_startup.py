@@ -0,0 +1,80 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument('entries', nargs='*', help='entry point scripts, default: the known ones found here')
+parser.add_argument('--model', type=str, default='', help='.tflite model loaded after the imports')
+parser.add_argument('--runtimes', type=str, default='auto,tensorflow', help='comma separated TFLITE_RUNTIME values')
+parser.add_argument('--repeat', type=int, default=5, help='fresh processes per measure, the median is reported')
+args = parser.parse_args()
+
+ENTRY_POINTS = ['Fast_client.py', 'registry_service.py', 'forecast_gateway.py', 'th_inference.py',
+                'kws_mfcc_inference.py', 'kws_stft_inference.py', 'Slow_Service.py']
+
+
+############################################ Startup probe ############################################
+# Runs in a fresh interpreter: executes only the module level imports of the entry point (its
+# argument parsing and main loop are left out), then builds one interpreter for --model, and reports
+# the elapsed times, the peak RSS and whether TensorFlow ended up imported.
+
+PROBE = r'''
+import ast, json, os, resource, sys, time
+script, model = sys.argv[1], sys.argv[2]
+# the shared modules (model_cache, features, ...) sit next to the entry point
+sys.path.insert(0, os.path.dirname(os.path.abspath(script)))
+start = time.perf_counter()
+tree = ast.parse(open(script).read(), script)
+namespace = {'__name__': '__probe__'}
+for node in tree.body:
+    if isinstance(node, (ast.Import, ast.ImportFrom)):
+        exec(compile(ast.Module([node], []), script, 'exec'), namespace)
+imported = time.perf_counter()
+runtime = None
+if model:
+    import model_cache
+    model_cache.MODEL_CACHE.interpreter(model)
+    runtime = model_cache.RUNTIME
+ready = time.perf_counter()
+print(json.dumps({'import_ms': (imported - start) * 1e3, 'ready_ms': (ready - start) * 1e3,
+                  'rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                  'tensorflow': 'tensorflow' in sys.modules, 'runtime': runtime}))
+'''
+
+
+def probe(entry, runtime):
+    env = dict(os.environ)
+    env.pop('TFLITE_RUNTIME', None)
+    if runtime != 'auto':
+        env['TFLITE_RUNTIME'] = runtime
+    start = time.perf_counter()
+    done = subprocess.run([sys.executable, '-c', PROBE, entry, args.model], env=env, capture_output=True, text=True)
+    wall = (time.perf_counter() - start) * 1e3
+    if done.returncode != 0:
+        lines = done.stderr.strip().splitlines()
+        raise RuntimeError(lines[-1] if lines else f'exit code {done.returncode}')
+    result = json.loads(done.stdout.strip().splitlines()[-1])
+    result['wall_ms'] = wall
+    return result
+
+
+entries = args.entries or [entry for entry in ENTRY_POINTS if os.path.exists(entry)]
+print(f"{'entry point':<26}{'runtime':<16}{'wall ms':>9}{'imports ms':>12}{'ready ms':>10}{'RSS MB':>8}  tf")
+for entry in entries:
+    name = os.path.basename(entry)
+    for runtime in args.runtimes.split(','):
+        try:
+            runs = [probe(entry, runtime) for _ in range(args.repeat)]
+        except RuntimeError as error:
+            print(f"{name:<26}{runtime:<16}failed: {error}")
+            continue
+        median = {key: statistics.median(run[key] for run in runs)
+                  for key in ('wall_ms', 'import_ms', 'ready_ms', 'rss_mb')}
+        used = runs[-1]['runtime'] or runtime
+        print(f"{name:<26}{used:<16}{median['wall_ms']:>9.0f}{median['import_ms']:>12.0f}"
+              f"{median['ready_ms']:>10.0f}{median['rss_mb']:>8.0f}  {'yes' if runs[-1]['tensorflow'] else 'no'}")
@@ -0,0 +1,100 @@
+import io
+import wave
+
+import numpy as np
+
+
+############################################ NumPy feature extraction ############################################
+# The same signal chain as tf.signal (periodic Hann STFT, HTK mel filterbank, orthonormal DCT-II
+# MFCCs) and tf.image.resize (bilinear, half-pixel centers) in plain NumPy, so the edge scripts can
+# preprocess audio without importing TensorFlow. Everything is computed in float32 as TF does.
+
+def pcm_to_float(pcm):
+    # 16-bit PCM bytes to float32 samples in [-1, 1), as tf.audio.decode_wav
+    return np.frombuffer(pcm, dtype='<i2').astype(np.float32) / 32768.0
+
+
+def decode_wav(wav_bytes):
+    with wave.open(io.BytesIO(wav_bytes), 'rb') as wav:
+        if wav.getsampwidth() != 2:
+            raise ValueError('only 16-bit wav files are supported')
+        samples = pcm_to_float(wav.readframes(wav.getnframes()))
+        channels = wav.getnchannels()
+        rate = wav.getframerate()
+    return samples.reshape(-1, channels), rate
+
+
+def pad_or_trim(samples, length):
+    if len(samples) >= length:
+        return samples[:length]
+    return np.concatenate([samples, np.zeros(length - len(samples), dtype=samples.dtype)])
+
+
+def stft_magnitude(samples, frame_length, frame_step, fft_length=None):
+    # |tf.signal.stft|: no padding at the end, periodic Hann window
+    fft_length = fft_length or frame_length
+    num_frames = 1 + (len(samples) - frame_length) // frame_step
+    strides = (samples.strides[0] * frame_step, samples.strides[0])
+    frames = np.lib.stride_tricks.as_strided(samples, (num_frames, frame_length), strides, writeable=False)
+    window = (0.5 - 0.5 * np.cos(2 * np.pi * np.arange(frame_length) / frame_length)).astype(np.float32)
+    return np.abs(np.fft.rfft(frames * window, n=fft_length)).astype(np.float32)
+
+
+def hertz_to_mel(frequencies):
+    return 1127.0 * np.log1p(np.asarray(frequencies, dtype=np.float64) / 700.0)
+
+
+def linear_to_mel_weight_matrix(num_mel_bins, num_spectrogram_bins, sample_rate, lower_edge_hertz,
+                                upper_edge_hertz):
+    # same construction as tf.signal.linear_to_mel_weight_matrix, the DC bin gets no weight
+    linear_frequencies = np.linspace(0.0, sample_rate / 2, num_spectrogram_bins)[1:]
+    spectrogram_bins_mel = hertz_to_mel(linear_frequencies)[:, np.newaxis]
+    band_edges_mel = np.linspace(hertz_to_mel(lower_edge_hertz), hertz_to_mel(upper_edge_hertz), num_mel_bins + 2)
+    lower_edge_mel = band_edges_mel[:-2]
+    center_mel = band_edges_mel[1:-1]
+    upper_edge_mel = band_edges_mel[2:]
+    lower_slopes = (spectrogram_bins_mel - lower_edge_mel) / (center_mel - lower_edge_mel)
+    upper_slopes = (upper_edge_mel - spectrogram_bins_mel) / (upper_edge_mel - center_mel)
+    mel_weights = np.maximum(0.0, np.minimum(lower_slopes, upper_slopes))
+    return np.pad(mel_weights, [[1, 0], [0, 0]]).astype(np.float32)
+
+
+_DCT = {}
+
+
+def dct_matrix(num_mel_bins, num_coefficients):
+    # the first num_coefficients columns of tf.signal.mfccs_from_log_mel_spectrograms
+    key = (num_mel_bins, num_coefficients)
+    if key not in _DCT:
+        n = np.arange(num_mel_bins)[:, np.newaxis]
+        k = np.arange(num_coefficients)[np.newaxis, :]
+        matrix = 2.0 * np.cos(np.pi * k * (2 * n + 1) / (2.0 * num_mel_bins)) / np.sqrt(2.0 * num_mel_bins)
+        _DCT[key] = matrix.astype(np.float32)
+    return _DCT[key]
+
+
+def mfccs(samples, frame_length, frame_step, linear_to_mel_weight_matrix, num_coefficients):
+    # [frames, num_coefficients] MFCCs of a float32 signal
+    spectrogram = stft_magnitude(samples, frame_length, frame_step, frame_length)
+    mel_spectrogram = np.dot(spectrogram, linear_to_mel_weight_matrix)
+    log_mel_spectrogram = np.log(mel_spectrogram + 1.e-6)
+    return np.dot(log_mel_spectrogram, dct_matrix(linear_to_mel_weight_matrix.shape[1], num_coefficients))
+
+
+def resize_bilinear(image, height, width):
+    # tf.image.resize(method='bilinear') of a [rows, cols] image: half-pixel centers, no antialiasing
+    def axis(size_in, size_out):
+        position = (np.arange(size_out) + 0.5) * (size_in / size_out) - 0.5
+        lower = np.floor(position)
+        fraction = (position - lower).astype(np.float32)
+        lower = np.clip(lower, 0, size_in - 1).astype(int)
+        upper = np.clip(np.ceil(position), 0, size_in - 1).astype(int)
+        return lower, upper, fraction
+
+    top, bottom, row_fraction = axis(image.shape[0], height)
+    left, right, col_fraction = axis(image.shape[1], width)
+    rows_top = image[top]
+    rows_bottom = image[bottom]
+    upper = rows_top[:, left] + (rows_top[:, right] - rows_top[:, left]) * col_fraction
+    lower = rows_bottom[:, left] + (rows_bottom[:, right] - rows_bottom[:, left]) * col_fraction
+    return (upper + (lower - upper) * row_fraction[:, np.newaxis]).astype(np.float32)
@@ -0,0 +1,65 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+
+############################################ Binary cache of the Jena climate CSV ############################################
+# The first run parses the CSV once (only the selected columns) and writes them as a float32 .npy next
+# to it, with a .json holding the split boundaries and the train mean/std. Later runs memory-map the
+# .npy, which takes milliseconds instead of seconds. The cache name and metadata carry the source size
+# and mtime, the columns and the split fractions, so changing any of them builds a new cache.
+
+def _stamp(csv_path, column_indices, splits):
+    st = os.stat(csv_path)
+    return {'source': os.path.abspath(csv_path), 'size': st.st_size, 'mtime_ns': st.st_mtime_ns,
+            'column_indices': [int(i) for i in column_indices], 'splits': [float(s) for s in splits]}
+
+
+def cache_paths(csv_path, stamp):
+    key = hashlib.sha1(json.dumps(stamp, sort_keys=True).encode()).hexdigest()[:12]
+    base = f'{csv_path}.{key}'
+    return base + '.npy', base + '.json'
+
+
+def _build(csv_path, stamp, data_path, meta_path):
+    columns = list(pd.read_csv(csv_path, nrows=0).columns[stamp['column_indices']])
+    data = pd.read_csv(csv_path, usecols=columns)[columns].values.astype(np.float32)
+
+    n = len(data)
+    bounds = [int(n * stamp['splits'][0]), int(n * stamp['splits'][1]), n]
+    train_data = data[0:bounds[0]]
+    meta = dict(stamp, columns=columns, bounds=bounds,
+                mean=train_data.mean(axis=0).tolist(), std=train_data.std(axis=0).tolist())
+
+    # written under temporary names and renamed, so an interrupted run never leaves a half cache
+    np.save(data_path + '.tmp.npy', data)
+    os.replace(data_path + '.tmp.npy', data_path)
+    with open(meta_path + '.tmp', 'w') as f:
+        json.dump(meta, f)
+    os.replace(meta_path + '.tmp', meta_path)
+    return meta
+
+
+def load_jena(csv_path, column_indices=(2, 5), splits=(0.7, 0.9)):
+    # returns data, train_data, val_data, test_data (read-only views of the mapped cache), mean, std
+    stamp = _stamp(csv_path, column_indices, splits)
+    data_path, meta_path = cache_paths(csv_path, stamp)
+
+    meta = None
+    if os.path.exists(data_path) and os.path.exists(meta_path):
+        with open(meta_path) as f:
+            meta = json.load(f)
+        if any(meta.get(key) != value for key, value in stamp.items()):
+            meta = None
+    if meta is None:
+        print(f"building the binary cache of {csv_path}")
+        meta = _build(csv_path, stamp, data_path, meta_path)
+
+    data = np.load(data_path, mmap_mode='r')
+    n1, n2, n = meta['bounds']
+    mean = np.array(meta['mean'], dtype=np.float32)
+    std = np.array(meta['std'], dtype=np.float32)
+    return data, data[0:n1], data[n1:n2], data[n2:n], mean, std
@@ -1,29 +1,27 @@
 import argparse
 import numpy as np
-import pyaudio
-import tensorflow as tf
+import features
+from model_cache import MODEL_CACHE
+from sources import PACINGS, open_audio
+from vad import VAD
 import time
-import wave
-from io import BytesIO
-from scipy.io import wavfile
 from scipy import signal
 
 
 parser = argparse.ArgumentParser()
 parser.add_argument('--model', type=str, required=True)
+parser.add_argument('--source', type=str, default='mic', help='mic[:DEVICE_INDEX], synthetic or wav:PATH (file, directory or split file)')
+parser.add_argument('--pacing', type=str, default='realtime', choices=PACINGS, help='pacing of a replayed source')
+parser.add_argument('--vad', type=int, default=1, help='1 = skip silent blocks before the MFCC')
+parser.add_argument('--vad_energy', type=float, default=-50.0, help='absolute energy floor in dBFS')
+parser.add_argument('--vad_flatness', type=float, default=0.5, help='frames flatter than this are noise')
 args = parser.parse_args()
 
-interpreter = tf.lite.Interpreter(model_path='./models/{}.tflite'.format(args.model))
-interpreter.allocate_tensors()
+interpreter = MODEL_CACHE.interpreter('./models/{}.tflite'.format(args.model))
 input_details = interpreter.get_input_details()
 output_details = interpreter.get_output_details()
 
-chunk = 4800
-resolution = pyaudio.paInt16
-samp_rate = 48000
 record_secs = 1 # seconds to record
-dev_index = 0 # device index found by p.get_device_info_by_index(ii)
-chunks = int((samp_rate / chunk) * record_secs)
 
 length = int(0.040*16000)
 stride = int(0.020*16000)
@@ -31,55 +29,51 @@ num_mel_bins = 40
 spectrogram_width = (16000 - length) // stride + 1
 num_spectrogram_bins = length // 2 + 1
 num_coefficients = 10
-linear_to_mel_weight_matrix = tf.signal.linear_to_mel_weight_matrix(
+linear_to_mel_weight_matrix = features.linear_to_mel_weight_matrix(
         num_mel_bins, num_spectrogram_bins, 16000, 20, 4000)
 
-buf = BytesIO()
+# the microphone records at 48 kHz, replayed clips keep their own rate
+source = open_audio(args.source, record_secs, args.pacing)
 
-audio = pyaudio.PyAudio() # create pyaudio instantiation
-stream = audio.open(format=resolution, rate=samp_rate, channels=1,
-                    input_device_index=dev_index, input=True,
-                    frames_per_buffer=chunk)
-stream.stop_stream()
+vad = VAD(energy_db=args.vad_energy, flatness=args.vad_flatness) if args.vad == 1 else None
 
 COMMANDS = ['stop', 'up', 'yes', 'right', 'left', 'no', 'silence', 'down', 'go']
 
+clips = 0
+correct = 0
+labelled = 0
+run_start = time.time()
 
 while True:
-    frames = []
-    buf.seek(0)
 
     print('record')
-    time.sleep(0.1)
-
-    stream.start_stream()
-    for ii in range(chunks):
-        data = stream.read(chunk)
-        frames.append(data)
-    stream.stop_stream()
-
-    wavefile = wave.open(buf ,'wb')
-    wavefile.setnchannels(1)
-    wavefile.setsampwidth(audio.get_sample_size(resolution))
-    wavefile.setframerate(samp_rate)
-    wavefile.writeframes(b''.join(frames))
-    wavefile.close()
-    buf.seek(0)
-
-    
-    sample, _ = tf.audio.decode_wav(buf.read())
-    sample = tf.squeeze(sample, 1)
+    if args.pacing == 'realtime':
+        time.sleep(0.1)
+
+    clip = source.record()
+    if clip is None:
+        break
+    clips += 1
+
+    # silence: no decode, MFCC or invoke
+    if vad is not None and not vad.is_speech(clip.pcm, clip.rate):
+        print('Command: silence')
+        print('Skipped {} of {} blocks'.format(vad.skipped, vad.blocks))
+        if clip.label in COMMANDS:
+            labelled += 1
+            correct += int(clip.label == 'silence')
+        print()
+        if args.pacing == 'realtime':
+            time.sleep(0.5)
+        continue
+
+    sample = features.pcm_to_float(clip.pcm)
     start = time.time()
-    sample = signal.resample_poly(sample, 1, 3)
-    sample = tf.convert_to_tensor(sample, dtype=tf.float32)
-    stft = tf.signal.stft(sample, length, stride,
-            fft_length=length)
-    spectrogram = tf.abs(stft)
-    mel_spectrogram = tf.tensordot(spectrogram, linear_to_mel_weight_matrix, 1)
-    log_mel_spectrogram = tf.math.log(mel_spectrogram + 1.e-6)
-    mfccs = tf.signal.mfccs_from_log_mel_spectrograms(log_mel_spectrogram)
-    mfccs = mfccs[..., :num_coefficients]
-    mfccs = tf.reshape(mfccs, [1, spectrogram_width, num_coefficients, 1])
+    if clip.rate != 16000:
+        sample = signal.resample_poly(sample, 16000, clip.rate).astype(np.float32)
+    sample = features.pad_or_trim(sample, 16000)
+    mfccs = features.mfccs(sample, length, stride, linear_to_mel_weight_matrix, num_coefficients)
+    mfccs = mfccs.reshape([1, spectrogram_width, num_coefficients, 1])
     end = time.time()
     preprocessing = (end-start)*1e3
     print('Preprocessing {:.3f}ms'.format(preprocessing))
@@ -94,5 +88,16 @@ while True:
     print('Total {:.3f}ms'.format(preprocessing+inference))
     index = np.argmax(predicted[0])
     print('Command:', COMMANDS[index])
+    if clip.label in COMMANDS:
+        labelled += 1
+        correct += int(clip.label == COMMANDS[index])
+        print('Expected:', clip.label)
     print()
-    time.sleep(0.5)
+    if args.pacing == 'realtime':
+        time.sleep(0.5)
+
+source.close()
+elapsed = time.time() - run_start
+print('{} clips in {:.2f}s ({:.1f}/s)'.format(clips, elapsed, clips / max(elapsed, 1e-9)))
+if labelled:
+    print('Accuracy {:.2f}% on {} labelled clips'.format(100 * correct / labelled, labelled))
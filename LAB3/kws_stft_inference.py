@@ -1,75 +1,56 @@
 import argparse
 import numpy as np
-import pyaudio
-import tensorflow as tf
+import features
+from model_cache import MODEL_CACHE
+from sources import PACINGS, open_audio
 import time
-import wave
-from io import BytesIO
-from scipy.io import wavfile
 from scipy import signal
 
 
 parser = argparse.ArgumentParser()
 parser.add_argument('--model', type=str, required=True)
+parser.add_argument('--source', type=str, default='mic', help='mic[:DEVICE_INDEX], synthetic or wav:PATH (file, directory or split file)')
+parser.add_argument('--pacing', type=str, default='realtime', choices=PACINGS, help='pacing of a replayed source')
 args = parser.parse_args()
 
-interpreter = tf.lite.Interpreter(model_path='./models/{}.tflite'.format(args.model))
-interpreter.allocate_tensors()
+interpreter = MODEL_CACHE.interpreter('./models/{}.tflite'.format(args.model))
 input_details = interpreter.get_input_details()
 output_details = interpreter.get_output_details()
 
-chunk = 4800
-resolution = pyaudio.paInt16
-samp_rate = 48000
 record_secs = 1 # seconds to record
-dev_index = 0 # device index found by p.get_device_info_by_index(ii)
-chunks = int((samp_rate / chunk) * record_secs)
 
 length = int(0.016*16000)
 stride = int(0.008*16000)
 
-buf = BytesIO()
-
-audio = pyaudio.PyAudio() # create pyaudio instantiation
-stream = audio.open(format=resolution, rate=samp_rate, channels=1,
-                    input_device_index=dev_index, input=True,
-                    frames_per_buffer=chunk)
-stream.stop_stream()
+# the microphone records at 48 kHz, replayed clips keep their own rate
+source = open_audio(args.source, record_secs, args.pacing)
 
 COMMANDS = ['stop', 'up', 'yes', 'right', 'left', 'no', 'silence', 'down', 'go']
 
+clips = 0
+correct = 0
+labelled = 0
+run_start = time.time()
 
 while True:
-    frames = []
-    buf.seek(0)
 
     print('record')
-    time.sleep(0.1)
-
-    stream.start_stream()
-    for ii in range(chunks):
-        data = stream.read(chunk)
-        frames.append(data)
-    stream.stop_stream()
+    if args.pacing == 'realtime':
+        time.sleep(0.1)
 
-    wavefile = wave.open(buf ,'wb')
-    wavefile.setnchannels(1)
-    wavefile.setsampwidth(audio.get_sample_size(resolution))
-    wavefile.setframerate(samp_rate)
-    wavefile.writeframes(b''.join(frames))
-    wavefile.close()
-    buf.seek(0)
+    clip = source.record()
+    if clip is None:
+        break
+    clips += 1
 
-    sample, _ = tf.audio.decode_wav(buf.read())
-    sample = tf.squeeze(sample, 1)
+    sample = features.pcm_to_float(clip.pcm)
     start = time.time()
-    sample = signal.resample_poly(sample, 1, 3)
-    sample = tf.convert_to_tensor(sample, dtype=tf.float32)
-    stft = tf.signal.stft(sample, length, stride,
-            fft_length=length)
-    spectrogram = tf.abs(stft)
-    spectrogram = tf.reshape(spectrogram, [1, 124, 129, 1])
-    spectrogram = tf.image.resize(spectrogram, [32, 32])
+    if clip.rate != 16000:
+        sample = signal.resample_poly(sample, 16000, clip.rate).astype(np.float32)
+    sample = features.pad_or_trim(sample, 16000)
+    spectrogram = features.stft_magnitude(sample, length, stride, length)
+    spectrogram = features.resize_bilinear(spectrogram, 32, 32)
+    spectrogram = spectrogram.reshape([1, 32, 32, 1])
     end = time.time()
     preprocessing = (end-start)*1e3
     print('Preprocessing {:.3f}ms'.format(preprocessing))
@@ -84,5 +65,16 @@ while True:
     print('Total {:.3f}ms'.format(preprocessing+inference))
     index = np.argmax(predicted[0])
     print('Command:', COMMANDS[index])
+    if clip.label in COMMANDS:
+        labelled += 1
+        correct += int(clip.label == COMMANDS[index])
+        print('Expected:', clip.label)
     print()
-    time.sleep(0.5)
+    if args.pacing == 'realtime':
+        time.sleep(0.5)
+
+source.close()
+elapsed = time.time() - run_start
+print('{} clips in {:.2f}s ({:.1f}/s)'.format(clips, elapsed, clips / max(elapsed, 1e-9)))
+if labelled:
+    print('Accuracy {:.2f}% on {} labelled clips'.format(100 * correct / labelled, labelled))
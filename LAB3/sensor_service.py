@@ -0,0 +1,82 @@
+import collections
+import threading
+import time
+from datetime import datetime
+
+from sources import open_sensor
+
+
+Reading = collections.namedtuple('Reading', ['temperature', 'humidity', 'timestamp', 'monotonic', 'seq'])
+
+
+############################################ Sensor service ############################################
+# One thread owns the sensor source and reads it at its own pace (about once per second at best for
+# the DHT11). Every good reading is published as an immutable Reading in a single slot: replacing one
+# reference is atomic, so readers never lock or wait, they get the latest value and can tell from its
+# age whether it is stale. Failed reads leave the previous reading in place, which simply gets older.
+# A replay source paces itself, so it is read back to back, and the service ends with the replay.
+
+class SensorService(threading.Thread):
+    def __init__(self, period=1.0, open_source=open_sensor):
+        super().__init__(name='dht-service', daemon=True)
+        self.period = period
+        self.open_source = open_source
+        self._latest = None
+        self._stop_event = threading.Event()
+        self.readings = 0
+        self.errors = 0
+        self.reopens = 0
+        self.finished = False
+
+    def latest(self):
+        # never blocks: the last good Reading, or None before the first one
+        return self._latest
+
+    def age(self, reading=None):
+        reading = reading if reading is not None else self._latest
+        if reading is None:
+            return float('inf')
+        return time.monotonic() - reading.monotonic
+
+    def is_stale(self, reading, max_age):
+        return reading is None or self.age(reading) > max_age
+
+    def stop(self):
+        self._stop_event.set()
+
+    def run(self):
+        source = self.open_source()
+        next_tick = time.monotonic()
+        seq = 0
+        try:
+            while not self._stop_event.is_set():
+                try:
+                    temperature, humidity = source.read()
+                    seq += 1
+                    self._latest = Reading(temperature, humidity, int(datetime.now().timestamp()),
+                                           time.monotonic(), seq)
+                    self.readings += 1
+                except EOFError:
+                    self.finished = True
+                    break
+                except RuntimeError as error:
+                    # Errors happen fairly often, DHT's are hard to read, just keep going
+                    print(f"Sensor Error {error.args[0]}")
+                    self.errors += 1
+                except Exception as error:
+                    # the device is in a bad state: reopen it
+                    print(f"Sensor failure {error!r}, reopening the device")
+                    self.errors += 1
+                    self.reopens += 1
+                    source.close()
+                    source = self.open_source()
+
+                if not source.paced:
+                    next_tick += self.period
+                    self._stop_event.wait(max(0.0, next_tick - time.monotonic()))
+        finally:
+            source.close()
+
+    def stats(self):
+        return {'readings': self.readings, 'errors': self.errors, 'reopens': self.reopens,
+                'age': self.age(), 'finished': self.finished}
@@ -0,0 +1,283 @@
+import collections
+import csv
+import glob
+import math
+import os
+import random
+import struct
+import time
+import wave
+
+
+############################################ Sources ############################################
+# Every capture path reads from a source instead of talking to the hardware directly, so the same
+# inference loop runs on the board (DHT11, microphone) or on any machine from recorded data.
+# Hardware libraries (adafruit_dht, board, pyaudio) and TensorFlow are only imported by the backend
+# that needs them. Replay backends pace themselves: 'realtime' delivers one item per interval as the
+# hardware would, 'fast' delivers them back to back for load tests.
+#
+#   sensor specs: dht11[:PIN]  synthetic  csv:PATH  tfrecord:PATH
+#   audio specs:  mic[:DEVICE_INDEX]  synthetic  wav:PATH (a .wav, a directory or a split file)
+
+PACINGS = ('realtime', 'fast')
+
+Clip = collections.namedtuple('Clip', ['pcm', 'rate', 'label'])
+
+
+class Pacer(object):
+    def __init__(self, interval, pacing='realtime'):
+        if pacing not in PACINGS:
+            raise ValueError(f'unknown pacing {pacing}')
+        self.interval = interval
+        self.pacing = pacing
+        self._next = None
+
+    def wait(self):
+        if self.pacing == 'fast':
+            return
+        now = time.monotonic()
+        if self._next is None or now - self._next > self.interval:
+            # first item, or the consumer fell behind: restart the schedule
+            self._next = now
+        elif self._next > now:
+            time.sleep(self._next - now)
+        self._next += self.interval
+
+
+############################################ Temperature and humidity ############################################
+# read() returns (temperature, humidity) or raises RuntimeError like a failed DHT11 read. A replay
+# that reached its end without looping raises EOFError. `paced` tells the caller whether the source
+# already waits between two readings.
+
+class DHT11Source(object):
+    paced = False
+
+    def __init__(self, pin='D4'):
+        import adafruit_dht
+        import board
+        self.pin = pin
+        self.device = adafruit_dht.DHT11(getattr(board, pin))
+
+    def read(self):
+        temperature = self.device.temperature
+        humidity = self.device.humidity
+        if temperature is None or humidity is None:
+            raise RuntimeError('incomplete reading')
+        return float(temperature), float(humidity)
+
+    def close(self):
+        self.device.exit()
+
+
+class SyntheticSensorSource(object):
+    # a random walk around room conditions with the occasional failed read
+    def __init__(self, interval=1.0, pacing='realtime', temperature=21.0, humidity=55.0, failure_rate=0.05,
+                 seed=42):
+        self.pacer = Pacer(interval, pacing)
+        self.paced = True
+        self.temperature = temperature
+        self.humidity = humidity
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+
+    def read(self):
+        self.pacer.wait()
+        if self.random.random() < self.failure_rate:
+            raise RuntimeError('checksum did not validate')
+        self.temperature += self.random.gauss(0, 0.1)
+        self.humidity = min(95.0, max(20.0, self.humidity + self.random.gauss(0, 0.5)))
+        return float(round(self.temperature)), float(round(self.humidity))
+
+    def close(self):
+        pass
+
+
+class ReplaySensorSource(object):
+    def __init__(self, rows, interval=1.0, pacing='realtime', loop=True):
+        if not rows:
+            raise ValueError('nothing to replay')
+        self.rows = rows
+        self.pacer = Pacer(interval, pacing)
+        self.paced = True
+        self.loop = loop
+        self.position = 0
+
+    def read(self):
+        if self.position == len(self.rows):
+            if not self.loop:
+                raise EOFError('end of the replay')
+            self.position = 0
+        self.pacer.wait()
+        row = self.rows[self.position]
+        self.position += 1
+        return row
+
+    def close(self):
+        pass
+
+
+def read_sensor_csv(path, temperature_column=None, humidity_column=None):
+    # the Jena climate csv (header 'T (degC)' and 'rh (%)') or a headerless LAB1 log
+    # (date,time,temperature,humidity); empty values are failed reads and are skipped
+    with open(path, newline='') as fp:
+        rows = list(csv.reader(fp))
+    header = rows[0] if rows and not _is_number(rows[0][-1]) else None
+    if header is not None:
+        rows = rows[1:]
+        temperature_column = header.index(temperature_column or 'T (degC)')
+        humidity_column = header.index(humidity_column or 'rh (%)')
+    else:
+        temperature_column = 2 if temperature_column is None else int(temperature_column)
+        humidity_column = 3 if humidity_column is None else int(humidity_column)
+    return [(float(row[temperature_column]), float(row[humidity_column])) for row in rows
+            if _is_number(row[temperature_column]) and _is_number(row[humidity_column])]
+
+
+def read_sensor_tfrecord(path):
+    # the HW1 records: Date_time, Temperature and Humidity as float or int64 features
+    import tensorflow as tf
+    rows = []
+    for record in tf.data.TFRecordDataset(path):
+        feature = tf.train.Example.FromString(record.numpy()).features.feature
+        rows.append((_feature_value(feature['Temperature']), _feature_value(feature['Humidity'])))
+    return rows
+
+
+def _feature_value(feature):
+    values = feature.float_list.value or feature.int64_list.value
+    return float(values[0])
+
+
+def _is_number(value):
+    try:
+        float(value)
+        return True
+    except ValueError:
+        return False
+
+
+def open_sensor(spec='dht11', interval=1.0, pacing='realtime', loop=True):
+    kind, _, arg = spec.partition(':')
+    if kind == 'dht11':
+        return DHT11Source(arg or 'D4')
+    if kind == 'synthetic':
+        return SyntheticSensorSource(interval, pacing)
+    if kind == 'csv':
+        return ReplaySensorSource(read_sensor_csv(arg), interval, pacing, loop)
+    if kind == 'tfrecord':
+        return ReplaySensorSource(read_sensor_tfrecord(arg), interval, pacing, loop)
+    raise ValueError(f'unknown sensor source {spec}')
+
+
+############################################ Audio ############################################
+# record() returns one Clip of record_secs seconds: mono 16-bit PCM bytes, its sample rate and the
+# label when the source knows it (replayed files are labelled by their folder). It returns None at
+# the end of a replay that does not loop.
+
+class MicrophoneSource(object):
+    def __init__(self, dev_index=0, rate=48000, chunk=4800, record_secs=1):
+        import pyaudio
+        self.rate = rate
+        self.chunk = chunk
+        self.chunks = int((rate / chunk) * record_secs)
+        self.audio = pyaudio.PyAudio()
+        self.stream = self.audio.open(format=pyaudio.paInt16, rate=rate, channels=1,
+                                      input_device_index=dev_index, input=True,
+                                      frames_per_buffer=chunk)
+        self.stream.stop_stream()
+
+    def record(self):
+        frames = []
+        self.stream.start_stream()
+        for ii in range(self.chunks):
+            frames.append(self.stream.read(self.chunk))
+        self.stream.stop_stream()
+        return Clip(b''.join(frames), self.rate, None)
+
+    def close(self):
+        self.stream.close()
+        self.audio.terminate()
+
+
+class SyntheticAudioSource(object):
+    # background noise, with a short tone burst in every other clip
+    def __init__(self, rate=16000, record_secs=1, pacing='realtime', seed=42):
+        self.rate = rate
+        self.samples = int(rate * record_secs)
+        self.pacer = Pacer(record_secs, pacing)
+        self.random = random.Random(seed)
+        self.count = 0
+
+    def record(self):
+        self.pacer.wait()
+        tone = self.count % 2 == 1
+        self.count += 1
+        samples = []
+        for i in range(self.samples):
+            value = self.random.gauss(0, 30)
+            if tone and self.samples // 4 <= i < 3 * self.samples // 4:
+                value += 8000 * math.sin(2 * math.pi * 440 * i / self.rate)
+            samples.append(int(max(-32768, min(32767, value))))
+        return Clip(struct.pack('<{}h'.format(len(samples)), *samples), self.rate, 'tone' if tone else 'silence')
+
+    def close(self):
+        pass
+
+
+class WavReplaySource(object):
+    def __init__(self, paths, record_secs=1, pacing='realtime', loop=False):
+        if not paths:
+            raise ValueError('no wav file to replay')
+        self.paths = paths
+        self.record_secs = record_secs
+        self.pacer = Pacer(record_secs, pacing)
+        self.loop = loop
+        self.position = 0
+
+    def record(self):
+        if self.position == len(self.paths):
+            if not self.loop:
+                return None
+            self.position = 0
+        path = self.paths[self.position]
+        self.position += 1
+        with wave.open(path, 'rb') as wav:
+            if wav.getnchannels() != 1 or wav.getsampwidth() != 2:
+                raise ValueError(f'{path}: only mono 16-bit wav files can be replayed')
+            rate = wav.getframerate()
+            pcm = wav.readframes(wav.getnframes())
+        # pad or trim to the recording length, as the microphone would deliver it
+        size = int(rate * self.record_secs) * 2
+        pcm = pcm[:size] + b'\x00' * max(0, size - len(pcm))
+        self.pacer.wait()
+        return Clip(pcm, rate, os.path.basename(os.path.dirname(path)) or None)
+
+    def close(self):
+        pass
+
+
+def list_wavs(path):
+    # a single .wav, every .wav below a directory or a split file listing one path per line
+    if os.path.isdir(path):
+        return sorted(glob.glob(os.path.join(path, '**', '*.wav'), recursive=True))
+    if path.endswith('.wav'):
+        return [path]
+    root = os.path.dirname(path)
+    paths = []
+    with open(path) as fp:
+        for line in fp:
+            line = line.strip()
+            if line:
+                paths.append(line if os.path.exists(line) else os.path.join(root, line))
+    return paths
+
+
+def open_audio(spec='mic', record_secs=1, pacing='realtime', loop=False):
+    kind, _, arg = spec.partition(':')
+    if kind == 'mic':
+        return MicrophoneSource(int(arg or 0), record_secs=record_secs)
+    if kind == 'synthetic':
+        return SyntheticAudioSource(record_secs=record_secs, pacing=pacing)
+    if kind == 'wav':
+        return WavReplaySource(list_wavs(arg), record_secs, pacing, loop)
+    raise ValueError(f'unknown audio source {spec}')
@@ -1,18 +1,24 @@
-import adafruit_dht
 import argparse
+import collections
+import functools
 import numpy as np
 import time
-import tensorflow as tf
-from board import D4
+from model_cache import MODEL_CACHE
+from sensor_service import SensorService
+from sources import PACINGS, open_sensor
 
 
 parser = argparse.ArgumentParser()
 parser.add_argument('--model', type=str, required=True)
+parser.add_argument('--sensor_period', type=float, default=1.0, help='seconds between two DHT11 reads')
+parser.add_argument('--poll', type=float, default=0.2, help='seconds between two looks at the latest reading')
+parser.add_argument('--max_age', type=float, default=3.0, help='seconds after which a reading is stale')
+parser.add_argument('--source', type=str, default='dht11', help='dht11[:PIN], synthetic, csv:PATH or tfrecord:PATH')
+parser.add_argument('--pacing', type=str, default='realtime', choices=PACINGS, help='pacing of a replayed source')
 args = parser.parse_args()
 
 
-interpreter = tf.lite.Interpreter(model_path='./models/{}.tflite'.format(args.model))
-interpreter.allocate_tensors()
+interpreter = MODEL_CACHE.interpreter('./models/{}.tflite'.format(args.model))
 
 input_details = interpreter.get_input_details()
 output_details = interpreter.get_output_details()
@@ -23,26 +29,68 @@ expected = np.zeros(2, dtype=np.float32)
 MEAN = np.array([9.107597, 75.904076], dtype=np.float32)
 STD = np.array([ 8.654227, 16.557089], dtype=np.float32)
 
-dht_device = adafruit_dht.DHT11(D4)
+# the last 7 distinct readings: 6 for the window, the 7th is the expected value
+readings = collections.deque(maxlen=7)
+
+
+def predict():
+    window[0] = list(readings)[:6]
+    expected[:] = readings[6]
+
+    interpreter.set_tensor(input_details[0]['index'], (window - MEAN) / STD)
+    interpreter.invoke()
+    predicted = interpreter.get_tensor(output_details[0]['index'])
+
+    print('Measured: {:.1f},{:.1f}'.format(expected[0], expected[1]))
+    print('Predicted: {:.1f},{:.1f}'.format(predicted[0, 0],
+        predicted[0, 1]))
+
+
+open_source = functools.partial(open_sensor, args.source, args.sensor_period, args.pacing, False)
+
+if args.pacing == 'fast':
+    # load test: no service thread, every replayed reading goes straight to the model
+    source = open_source()
+    start = time.monotonic()
+    count = 0
+    while True:
+        try:
+            readings.append(source.read())
+        except RuntimeError:
+            readings.clear()
+            continue
+        except EOFError:
+            break
+        if len(readings) == 7:
+            predict()
+            count += 1
+    elapsed = time.monotonic() - start
+    print('{} predictions in {:.2f}s ({:.1f}/s)'.format(count, elapsed, count / max(elapsed, 1e-9)))
+    raise SystemExit
+
+# the service thread owns the sensor, this loop only looks at its latest reading and never waits on it
+sensor = SensorService(args.sensor_period, open_source)
+sensor.start()
+
+last_seq = 0
+stale = False
 
 while True:
-    for i in range(7):
-        temperature = dht_device.temperature
-        humidity = dht_device.humidity
-        if i < 6:
-            window[0, i, 0] = np.float32(temperature)
-            window[0, i, 1] = np.float32(humidity)
-        if i == 6:
-            expected[0] = np.float32(temperature)
-            expected[1] = np.float32(humidity)
-
-            window = (window - MEAN) / STD
-            interpreter.set_tensor(input_details[0]['index'], window)
-            interpreter.invoke()
-            predicted = interpreter.get_tensor(output_details[0]['index'])
-
-            print('Measured: {:.1f},{:.1f}'.format(expected[0], expected[1]))
-            print('Predicted: {:.1f},{:.1f}'.format(predicted[0, 0],
-                predicted[0, 1]))
-
-        time.sleep(0.2)
+    time.sleep(args.poll)
+    latest = sensor.latest()
+    if sensor.finished and (latest is None or latest.seq == last_seq):
+        break
+    if sensor.is_stale(latest, args.max_age):
+        if not stale and latest is not None:
+            print('Stale reading: {:.1f}s old'.format(sensor.age(latest)))
+        # a gap in the readings breaks the window, start it again
+        readings.clear()
+        stale = True
+        continue
+    stale = False
+    if latest.seq == last_seq:
+        continue
+    last_seq = latest.seq
+    readings.append((latest.temperature, latest.humidity))
+    if len(readings) == 7:
+        predict()
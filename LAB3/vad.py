@@ -0,0 +1,76 @@
+import io
+import wave
+
+import numpy as np
+
+
+############################################ Voice activity detection ############################################
+# Runs on the raw PCM before any feature extraction. The block is cut into short frames; a frame is
+# voiced when its energy is above both an absolute floor and the running noise floor plus a margin, and
+# its spectrum is not flat (spectral flatness = geometric / arithmetic mean of the power spectrum, close
+# to 1 for noise and hiss, low for voiced speech). The block is speech when enough frames are voiced.
+# Only frames that pass the energy test are transformed, so a quiet block costs a few vector ops.
+
+class VAD(object):
+    def __init__(self, frame_ms=20, energy_db=-50.0, margin_db=10.0, flatness=0.5, min_frames=3,
+                 noise_alpha=0.05):
+        self.frame_ms = frame_ms
+        self.energy_db = energy_db            # absolute floor in dBFS
+        self.margin_db = margin_db            # required distance above the noise floor
+        self.flatness = flatness              # frames flatter than this are noise
+        self.min_frames = min_frames          # voiced frames needed to call the block speech
+        self.noise_alpha = noise_alpha        # noise floor update rate on silent blocks
+        self.noise_db = None
+        self.blocks = 0
+        self.skipped = 0
+
+    def frames(self, samples, sampling_rate):
+        frame_length = int(sampling_rate * self.frame_ms / 1000)
+        count = len(samples) // frame_length
+        return samples[:count * frame_length].reshape(count, frame_length)
+
+    def is_speech(self, samples, sampling_rate):
+        # samples: int16 PCM (bytes or array) or floats in [-1, 1]
+        if isinstance(samples, (bytes, bytearray)):
+            samples = np.frombuffer(samples, dtype=np.int16)
+        samples = np.asarray(samples)
+        if samples.dtype == np.int16:
+            samples = samples.astype(np.float32) / 32768.0
+        frames = self.frames(samples, sampling_rate)
+        self.blocks += 1
+        if len(frames) == 0:
+            self.skipped += 1
+            return False
+
+        energy = 10 * np.log10(np.mean(frames * frames, axis=1) + 1e-10)
+        threshold = self.energy_db
+        if self.noise_db is not None:
+            threshold = max(threshold, self.noise_db + self.margin_db)
+        loud = frames[energy > threshold]
+
+        voiced = 0
+        if len(loud) >= self.min_frames:
+            power = np.abs(np.fft.rfft(loud * np.hanning(loud.shape[1]), axis=1)) ** 2 + 1e-12
+            flatness = np.exp(np.mean(np.log(power), axis=1)) / np.mean(power, axis=1)
+            voiced = int(np.sum(flatness < self.flatness))
+
+        speech = voiced >= self.min_frames
+        if not speech:
+            self.skipped += 1
+            block_db = float(np.median(energy))
+            if self.noise_db is None:
+                self.noise_db = block_db
+            else:
+                self.noise_db += self.noise_alpha * (block_db - self.noise_db)
+        return speech
+
+    def is_speech_wav(self, wav_bytes):
+        with wave.open(io.BytesIO(bytes(wav_bytes)), 'rb') as wav:
+            sampling_rate = wav.getframerate()
+            samples = np.frombuffer(wav.readframes(wav.getnframes()), dtype=np.int16)
+            if wav.getnchannels() > 1:
+                samples = samples[::wav.getnchannels()]
+        return self.is_speech(samples, sampling_rate)
+
+    def stats(self):
+        return {'blocks': self.blocks, 'skipped': self.skipped, 'noise_db': self.noise_db}